@@ -70,6 +70,26 @@ _init_debug()
 # Instantiate FormatStr object
 fstrobj = FormatStr()
 
+class _FormatArgs(object):
+    """Object attributes as arguments for FormatStr.vformat(), positional
+       arguments are the attributes given by _attrlist and named arguments
+       are the object's own attributes and the shared attributes
+    """
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __getitem__(self, key):
+        obj = self.obj
+        if isinstance(key, (int, long)):
+            if obj._attrlist is None:
+                raise IndexError(key)
+            return getattr(obj, obj._attrlist[key])
+        elif key in obj._globals:
+            return obj._globals[key]
+        return obj.__dict__[key]
+
 class BaseObj(object):
     """Base class so objects will inherit the methods providing the string
        representation of the object and a simple debug printing and logging
@@ -245,6 +265,18 @@ class BaseObj(object):
             return None
         raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, attr))
 
+    def __getstate__(self):
+        """Return the object state for pickling, defined here so the
+           lookup is not done by __getattr__
+        """
+        return self.__dict__
+
+    def __setstate__(self, state):
+        """Set the object state when unpickling, defined here so the
+           lookup is not done by __getattr__
+        """
+        self.__dict__.update(state)
+
     def __eq__(self, other):
         """Comparison method: this object is treated like the attribute
            defined by set_eqattr()
@@ -308,6 +340,9 @@ class BaseObj(object):
                 val = getattr(self, key, None)
                 if val != None:
                     if isrepr:
+                        if isinstance(val, list) and type(val) != list:
+                            # Format list subclass as a regular list
+                            val = list(val)
                         value = pformat(val, indent=0)
                         if (isinstance(val, list) or isinstance(val, dict)) and value.find("\n") > 0:
                             # If list or dictionary have more than one line as
@@ -592,13 +627,10 @@ class BaseObj(object):
         """
         if len(kwts) == 0 and len(kwds) == 0:
             # Use object attributes, both positional using _attrlist and
-            # named arguments using object's own dictionary
-            if self._attrlist is not None:
-                kwts = (getattr(self, attr) for attr in self._attrlist)
-            kwds = self.__dict__.copy()
-            if self._globals:
-                # Include the shared attributes as named attributes
-                kwds.update(self._globals)
+            # named arguments using object's own dictionary, only the
+            # attributes referenced by the format are fetched
+            args = _FormatArgs(self)
+            return fstrobj.vformat(fmt, args, args)
         return fstrobj.format(fmt, *kwts, **kwds)
 
     def dprint(self, level, msg, indent=0):
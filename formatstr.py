@@ -157,11 +157,23 @@ def ordinal_number(value, short=0):
     return str(value) + suffix
 
 def crc32(value):
-    """Convert string to its crc32 representation"""
+    """Convert string to its crc32 representation, objects which cache
+       their own digest (packet.utils.StrHex) are asked for it instead
+    """
+    if type(value) != str:
+        func = getattr(value, "crc32", None)
+        if func is not None:
+            return func()
     return binascii.crc32(value) & 0xffffffff
 
 def crc16(value):
-    """Convert string to its crc16 representation"""
+    """Convert string to its crc16 representation, objects which cache
+       their own digest (packet.utils.StrHex) are asked for it instead
+    """
+    if type(value) != str:
+        func = getattr(value, "crc16", None)
+        if func is not None:
+            return func()
     return binascii.crc_hqx(value, 0xa5a5) & 0xffff
 
 def hexstr(value):
@@ -292,6 +304,181 @@ class FormatStr(Formatter):
            out = x.format("{0:umax32}", alist)    # out = "[1, 2, 3, umax32]"
            out = x.format("{0:--:umax32}", alist) # out = "1--2--3--umax32"
     """
+    # Cache of compiled format strings and compiled format specs
+    _fmt_cache  = {}
+    _spec_cache = {}
+
+    def vformat(self, format_string, args, kwargs):
+        """Override original method to use a compiled format string:
+           the format string is parsed only the first time it is used
+           and the format spec of every field is resolved into a function
+           so formatting is reduced to fetching the arguments and joining
+           the resulting strings
+        """
+        items = self._fmt_cache.get(format_string)
+        if items is None:
+            items = self._compile(format_string)
+            if len(self._fmt_cache) >= 4096:
+                # Do not let the cache grow without bounds
+                self._fmt_cache.clear()
+            self._fmt_cache[format_string] = items
+        return self._render(items, args, kwargs)
+
+    def _compile(self, format_string, recursion_depth=2):
+        """Return list of compiled items for the format string, each item is
+           a tuple (literal, field) where field is None for literal text only
+           or a tuple (key, ispos, attrlist, conversion, spec, func) where
+           func is the compiled format spec or None if the format spec has
+           nested fields, in which case spec is the compiled format spec
+        """
+        if recursion_depth < 0:
+            raise ValueError("Max string recursion exceeded")
+        items = []
+        for literal, field_name, format_spec, conversion in self.parse(format_string):
+            if field_name is None:
+                items.append((literal, None))
+                continue
+            key, rest = field_name._formatter_field_name_split()
+            ispos = isinstance(key, (int, long))
+            if "{" in format_spec or "}" in format_spec:
+                # Format spec has nested fields, render it every time
+                spec = self._compile(format_spec, recursion_depth-1)
+                func = None
+            else:
+                spec = None
+                func = self._spec_func(format_spec)
+            items.append((literal, (key, ispos, tuple(rest), conversion, spec, func)))
+        return items
+
+    def _render(self, items, args, kwargs):
+        """Return the string given by the compiled items"""
+        out = []
+        for literal, field in items:
+            if literal:
+                out.append(literal)
+            if field is None:
+                continue
+            key, ispos, attrlist, conversion, spec, func = field
+            # Same as get_field() and get_value()
+            try:
+                if ispos:
+                    obj = args[key]
+                else:
+                    obj = kwargs[key]
+            except (IndexError, KeyError):
+                obj = ""
+            for isattr, name in attrlist:
+                if isattr:
+                    obj = getattr(obj, name)
+                else:
+                    obj = obj[name]
+            if conversion:
+                obj = self.convert_field(obj, conversion)
+            if func is None:
+                out.append(self.format_field(obj, self._render(spec, args, kwargs)))
+            else:
+                out.append(func(obj))
+        return "".join(out)
+
+    def _spec_func(self, format_spec):
+        """Return the function which formats a value according to the given
+           format spec, the result is the same as format_field() but the
+           format spec is processed only once
+        """
+        func = self._spec_cache.get(format_spec)
+        if func is None:
+            func = self._compile_spec(format_spec)
+            self._spec_cache[format_spec] = func
+        return func
+
+    def _compile_spec(self, format_spec):
+        """Compile format spec, see format_field() for the description of
+           every modifier
+        """
+        if len(format_spec) > 1 and format_spec[0] == "?":
+            # Conditional directive
+            data = re.split(r"(?<!\\):", format_spec)
+            tstr = data[0][1:].replace("\\:", ":")
+            fstr = data[1].replace("\\:", ":") if len(data) > 1 else ""
+            return lambda value: fstr if value is None else tstr
+        elif format_spec == "len":
+            return lambda value: "0" if value is None else str(len(value))
+
+        # Any modifier not handled here is done by format_field()
+        field_func = lambda value: self.format_field(value, format_spec)
+        xmod, num, fmt = re.search(r"([#@]?)(\d*)(.*)", format_spec).groups()
+
+        # String modifiers
+        str_func = None
+        fmtlist = (xmod+fmt).split(":")
+        if len(fmtlist) > 1:
+            # Nested format, process in reversed order
+            funcs = [self._spec_func(x) for x in reversed(fmtlist)]
+            def str_func(value):
+                for sfunc in funcs:
+                    value = sfunc(value)
+                return value
+        elif fmt == "x":
+            xprefix = "0x" if xmod == "#" else ""
+            str_func = lambda value: xprefix + value.encode("hex")
+        elif fmt == "crc32":
+            str_func = lambda value: "{0:#010x}".format(crc32(value)) if CRC32 else str(value)
+        elif fmt == "crc16":
+            str_func = lambda value: "{0:#06x}".format(crc16(value)) if CRC16 else str(value)
+        elif xmod == "@":
+            if num.isdigit() and (len(fmt) <= 2 or fmt[0] != ","):
+                start = int(num)
+                str_func = lambda value: value[start:]
+            elif num.isdigit() and fmt[1:].isdigit():
+                start, end = int(num), int(fmt[1:])
+                str_func = lambda value: value[start:end]
+            else:
+                str_func = field_func
+
+        # Number modifiers
+        num_func = None
+        if _max_map.get(fmt):
+            max_map = _max_map[fmt]
+            num_func = lambda value: max_map.get(value, str(value))
+        elif fmt[:5] == "units" or fmt[:4] == "date":
+            num_func = field_func
+        elif fmt[:3] == "ord":
+            fmts = fmt.split(":", 1)
+            short = 0
+            if len(fmts) == 2:
+                short = fmts[1][0] == "s"
+            num_func = lambda value: ordinal_number(value, short)
+
+        # List modifiers
+        fmts = format_spec.split(":", 1)
+        sep = fmts[0] if len(fmts) == 2 else None
+
+        def func(value):
+            if value is None:
+                return ""
+            if isinstance(value, int) and type(value) != int:
+                # This is an object derived from int, convert it to string
+                value = str(value)
+            if isinstance(value, str):
+                if str_func is not None:
+                    return str_func(value)
+            elif isinstance(value, list):
+                vlist = [item_func(x) for x in value]
+                if sep is None:
+                    return "[" + ", ".join(vlist) + "]"
+                return sep.join(vlist)
+            elif isinstance(value, (int, long, float)):
+                if num_func is not None:
+                    return num_func(value)
+            return format(value, format_spec)
+
+        if sep is None:
+            # Same format spec is applied to each item in the list
+            item_func = func
+        else:
+            item_func = self._spec_func(fmts[1])
+        return func
+
     def format_field(self, value, format_spec):
         """Override original method to include modifier extensions"""
         if len(format_spec) > 1 and format_spec[0] == "?":
@@ -0,0 +1,395 @@
+#===============================================================================
+# Copyright 2026 NetApp, Inc. All Rights Reserved,
+# contribution by Jorge Mora <mora@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#===============================================================================
+"""
+Packet capture module
+
+Provides an in-process packet capture using a Linux AF_PACKET socket with
+a TPACKET_V3 memory mapped ring and a classic BPF filter attached to the
+socket so packets are filtered by the kernel. Captured packets are written
+to a pcap file which can be opened by the packet trace object Pktt.
+
+The capture needs the CAP_NET_RAW capability, when running as a regular
+user the module can be executed as a script using sudo. In this case it
+prints "listening on <interface>" once the capture has started, the same
+as tcpdump, and it stops gracefully on SIGINT or SIGTERM.
+"""
+import os
+import sys
+import time
+import mmap
+import errno
+import select
+import signal
+import socket
+import struct
+import ctypes
+import threading
+import subprocess
+import nfstest_config as c
+from baseobj import BaseObj
+from optparse import OptionParser
+
+# Module constants
+__author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
+__copyright__ = "Copyright (C) 2026 NetApp, Inc."
+__license__   = "GPL v2"
+__version__   = "1.0"
+
+# Socket options and constants
+SOL_PACKET       = 263
+PACKET_RX_RING   = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION   = 10
+TPACKET_V3       = 2
+SO_ATTACH_FILTER = 26
+ETH_P_ALL        = 0x0003
+PACKET_OUTGOING  = 4
+ARPHRD_LOOPBACK  = 772
+
+# Block status
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER   = 1
+
+# Offsets in the TPACKET_V3 block descriptor
+BLK_STATUS    = 8  # Block status
+BLK_NUM_PKTS  = 12 # Number of packets in block
+BLK_FIRST_PKT = 16 # Offset to first packet in block
+
+# Size of struct tpacket3_hdr aligned to TPACKET_ALIGNMENT, this is where
+# the struct sockaddr_ll is found for each packet
+TPACKET3_HDRLEN = 48
+
+# Ring defaults
+BLOCK_SIZE  = 1<<20 # Size of each block in the ring
+BLOCK_COUNT = 64    # Number of blocks in the ring
+FRAME_SIZE  = 1<<11 # Frame size used to compute the number of frames
+BLOCK_TOV   = 10    # Milliseconds to retire a block which is not full
+
+# Maximum snapshot length
+MAX_SNAPLEN = 262144
+
+# BPF instruction codes
+BPF_LD_W_ABS  = 0x20
+BPF_LD_H_ABS  = 0x28
+BPF_LD_B_ABS  = 0x30
+BPF_LD_H_IND  = 0x48
+BPF_LDX_B_MSH = 0xb1
+BPF_JMP_JA    = 0x05
+BPF_JMP_JEQ_K = 0x15
+BPF_JMP_JSET_K = 0x45
+BPF_RET_K     = 0x06
+
+def bpf_program(hosts=[], ports=[], snaplen=0):
+    """Return a classic BPF program as a list of tuples (code, jt, jf, k)
+       accepting IPv4 and IPv6 packets on an ethernet link between any of
+       the given hosts and using any of the given TCP/UDP ports
+
+       hosts:
+           List of IPv4 or IPv6 addresses, an empty list matches any host
+       ports:
+           List of TCP/UDP ports, an empty list matches any port
+       snaplen:
+           Number of bytes to return for each packet accepted, use 0 to
+           return full packets
+    """
+    if snaplen <= 0:
+        snaplen = MAX_SNAPLEN
+    ip4list = []
+    ip6list = []
+    for host in hosts:
+        if ":" in host:
+            ip6list.append(struct.unpack("!IIII", socket.inet_pton(socket.AF_INET6, host)))
+        else:
+            ip4list.append(struct.unpack("!I", socket.inet_pton(socket.AF_INET, host))[0])
+
+    # List of instructions where jump targets are given by labels, labels
+    # are given as strings in the list
+    code = [
+        (BPF_LD_H_ABS, 0, 0, 12),
+        (BPF_JMP_JEQ_K, "ip4", 0, 0x0800),
+        (BPF_JMP_JEQ_K, "ip6", "drop", 0x86dd),
+        "ip4",
+    ]
+    if len(hosts):
+        for offset in (26, 30):
+            # Compare IPv4 source and destination addresses
+            code.append((BPF_LD_W_ABS, 0, 0, offset))
+            for addr in ip4list:
+                code.append((BPF_JMP_JEQ_K, "ip4port", 0, addr))
+        code.append((BPF_JMP_JA, 0, 0, "drop"))
+    code.append("ip4port")
+    if len(ports):
+        code += [
+            (BPF_LD_B_ABS, 0, 0, 23),
+            (BPF_JMP_JEQ_K, "ip4tcp", 0, 6),
+            (BPF_JMP_JEQ_K, "ip4tcp", "drop", 17),
+            "ip4tcp",
+            # Only the first fragment has the port numbers
+            (BPF_LD_H_ABS, 0, 0, 20),
+            (BPF_JMP_JSET_K, "drop", 0, 0x1fff),
+            (BPF_LDX_B_MSH, 0, 0, 14),
+        ]
+        for offset in (14, 16):
+            code.append((BPF_LD_H_IND, 0, 0, offset))
+            for port in ports:
+                code.append((BPF_JMP_JEQ_K, "accept", 0, port))
+        code.append((BPF_JMP_JA, 0, 0, "drop"))
+    else:
+        code.append((BPF_JMP_JA, 0, 0, "accept"))
+
+    code.append("ip6")
+    if len(hosts):
+        nlabel = 0
+        for offset in (22, 38):
+            # Compare IPv6 source and destination addresses
+            for addr in ip6list:
+                nlabel += 1
+                label = "ip6next%d" % nlabel
+                for i in xrange(4):
+                    code.append((BPF_LD_W_ABS, 0, 0, offset+4*i))
+                    code.append((BPF_JMP_JEQ_K, "ip6port" if i == 3 else 0, label, addr[i]))
+                code.append(label)
+        code.append((BPF_JMP_JA, 0, 0, "drop"))
+    code.append("ip6port")
+    if len(ports):
+        code += [
+            (BPF_LD_B_ABS, 0, 0, 20),
+            (BPF_JMP_JEQ_K, "ip6tcp", 0, 6),
+            (BPF_JMP_JEQ_K, "ip6tcp", "drop", 17),
+            "ip6tcp",
+        ]
+        for offset in (54, 56):
+            code.append((BPF_LD_H_ABS, 0, 0, offset))
+            for port in ports:
+                code.append((BPF_JMP_JEQ_K, "accept", 0, port))
+        code.append((BPF_JMP_JA, 0, 0, "drop"))
+    code += [
+        "accept",
+        (BPF_RET_K, 0, 0, snaplen),
+        "drop",
+        (BPF_RET_K, 0, 0, 0),
+    ]
+
+    # Resolve labels
+    labels = {}
+    index = 0
+    for item in code:
+        if type(item) is str:
+            labels[item] = index
+        else:
+            index += 1
+    prog = []
+    for item in code:
+        if type(item) is str:
+            continue
+        pos = len(prog) + 1
+        op, jt, jf, k = item
+        if type(jt) is str:
+            jt = labels[jt] - pos
+        if type(jf) is str:
+            jf = labels[jf] - pos
+        if type(k) is str:
+            k = labels[k] - pos
+        if jt > 255 or jf > 255:
+            raise Exception("BPF program too large: too many hosts or ports")
+        prog.append((op, jt, jf, k))
+    return prog
+
+def bpf_compile(expr, tcpdump=c.NFSTEST_TCPDUMP):
+    """Return a classic BPF program as a list of tuples (code, jt, jf, k)
+       for the given tcpdump filter expression, the program is compiled
+       by tcpdump
+    """
+    cmd = "%s -ddd %s" % (tcpdump, repr(expr))
+    out = subprocess.check_output(cmd, shell=True)
+    lines = out.split("\n")
+    prog = [tuple(int(x) for x in line.split()) for line in lines[1:] if len(line.strip())]
+    if len(prog) != int(lines[0]):
+        raise Exception("Unable to compile BPF filter: %s" % expr)
+    return prog
+
+class Capture(BaseObj):
+    """Capture object
+
+       Capture() -> New packet capture object
+
+       Usage:
+           from nfstest.capture import Capture, bpf_program
+
+           # Capture all NFS packets on loopback
+           x = Capture("/tmp/trace.cap", interface="lo", bpf=bpf_program(ports=[2049]))
+           x.start()
+           ...
+           x.stop()
+    """
+    def __init__(self, tracefile, interface=None, bpf=None, snaplen=0, blocksize=BLOCK_SIZE, blockcount=BLOCK_COUNT):
+        """Constructor
+
+           Initialize object's private data.
+
+           tracefile:
+               Name of pcap file to create
+           interface:
+               Network device interface to capture, if not given all
+               interfaces are captured [default: None]
+           bpf:
+               Classic BPF program given as a list of tuples (code, jt, jf, k)
+               attached to the socket [default: None (capture all packets)]
+           snaplen:
+               Maximum number of bytes to capture for each packet, use 0 to
+               capture full packets [default: 0]
+           blocksize:
+               Size of each block in the ring [default: 1MB]
+           blockcount:
+               Number of blocks in the ring [default: 64]
+        """
+        self.tracefile  = tracefile
+        self.interface  = interface
+        self.bpf        = bpf
+        self.snaplen    = snaplen if snaplen > 0 else MAX_SNAPLEN
+        self.blocksize  = blocksize
+        self.blockcount = blockcount
+        self.npackets   = 0     # Number of packets captured
+        self.ndrops     = 0     # Number of packets dropped by the kernel
+        self.sock   = None
+        self.ring   = None
+        self.fd     = None
+        self.thread = None
+        self._stop  = False
+
+    def __del__(self):
+        """Destructor"""
+        self.stop()
+
+    def start(self):
+        """Start capture"""
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        if self.bpf is not None:
+            # Attach BPF filter to socket so packets are filtered by the kernel
+            insns = "".join([struct.pack("HBBI", *x) for x in self.bpf])
+            self._bpfbuf = ctypes.create_string_buffer(insns)
+            fprog = struct.pack("HL", len(self.bpf), ctypes.addressof(self._bpfbuf))
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        nframes = (self.blocksize / FRAME_SIZE) * self.blockcount
+        req = struct.pack("IIIIIII", self.blocksize, self.blockcount, FRAME_SIZE, nframes, BLOCK_TOV, 0, 0)
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        self.ring = mmap.mmap(self.sock.fileno(), self.blocksize*self.blockcount, mmap.MAP_SHARED, mmap.PROT_READ|mmap.PROT_WRITE)
+        if self.interface is not None:
+            self.sock.bind((self.interface, ETH_P_ALL))
+
+        # Write pcap header using the ethernet link type
+        self.fd = open(self.tracefile, "wb")
+        self.fd.write(struct.pack("=IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, self.snaplen, 1))
+        self.fd.flush()
+
+        self._stop = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop capture, all packets received so far are written to the
+           pcap file before returning
+        """
+        if self.thread is not None:
+            self._stop = True
+            self.thread.join()
+            self.thread = None
+        if self.sock is not None:
+            try:
+                stats = self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12)
+                self.ndrops = struct.unpack("III", stats)[1]
+            except Exception:
+                pass
+            self.ring.close()
+            self.ring = None
+            self.sock.close()
+            self.sock = None
+        if self.fd is not None:
+            self.fd.close()
+            self.fd = None
+
+    def _run(self):
+        """Internal method to process all blocks in the ring"""
+        index = 0
+        poller = select.poll()
+        poller.register(self.sock.fileno(), select.POLLIN|select.POLLERR)
+        stime = None
+        while True:
+            boffset = index * self.blocksize
+            status = struct.unpack_from("I", self.ring, boffset+BLK_STATUS)[0]
+            if status & TP_STATUS_USER:
+                self._write_block(boffset)
+                # Give block back to the kernel
+                self.ring[boffset+BLK_STATUS:boffset+BLK_STATUS+4] = struct.pack("I", TP_STATUS_KERNEL)
+                index = (index + 1) % self.blockcount
+                continue
+            if self._stop:
+                # Wait for the kernel to retire the current block in case
+                # it has any packets
+                if stime is None:
+                    stime = time.time()
+                elif time.time() - stime > 2.0*BLOCK_TOV/1000:
+                    break
+            try:
+                poller.poll(BLOCK_TOV if self._stop else 100)
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+    def _write_block(self, boffset):
+        """Internal method to write all packets in the block to the pcap file"""
+        ring = self.ring
+        npkts, poffset = struct.unpack_from("II", ring, boffset+BLK_NUM_PKTS)
+        poffset += boffset
+        out = []
+        for i in xrange(npkts):
+            nextoff, secs, nsecs, caplen, length, status, mac = struct.unpack_from("IIIIIIH", ring, poffset)
+            hatype, pkttype = struct.unpack_from("HB", ring, poffset+TPACKET3_HDRLEN+8)
+            if not (pkttype == PACKET_OUTGOING and hatype == ARPHRD_LOOPBACK):
+                # Outgoing packets on loopback are also seen as incoming
+                caplen = min(caplen, self.snaplen)
+                out.append(struct.pack("=IIII", secs, nsecs/1000, caplen, length))
+                out.append(ring[poffset+mac:poffset+mac+caplen])
+                self.npackets += 1
+            poffset += nextoff
+        self.fd.write("".join(out))
+        self.fd.flush()
+
+def main():
+    """Run packet capture until SIGINT or SIGTERM is received"""
+    opts = OptionParser("%prog [options]")
+    opts.add_option("-i", "--interface", default=None, help="Network device interface")
+    opts.add_option("-w", "--tracefile", default=None, help="Name of pcap file to create")
+    opts.add_option("-s", "--snaplen", type="int", default=0, help="Snapshot length")
+    opts.add_option("-b", "--blockcount", type="int", default=BLOCK_COUNT, help="Number of 1MB blocks in the ring")
+    opts.add_option("-f", "--filter", default=None, help="BPF program as given by 'tcpdump -ddd' using commas instead of new lines")
+    options, args = opts.parse_args()
+    bpf = None
+    if options.filter:
+        lines = options.filter.split(",")
+        bpf = [tuple(int(x) for x in line.split()) for line in lines[1:]]
+    cap = Capture(options.tracefile, interface=options.interface, bpf=bpf, snaplen=options.snaplen, blockcount=options.blockcount)
+    signal.signal(signal.SIGTERM, lambda signum, frame: None)
+    signal.signal(signal.SIGINT, lambda signum, frame: None)
+    cap.start()
+    sys.stderr.write("listening on %s\n" % (options.interface or "any"))
+    sys.stderr.flush()
+    signal.pause()
+    cap.stop()
+    sys.stderr.write("%d packets captured\n%d packets dropped by kernel\n" % (cap.npackets, cap.ndrops))
+
+if __name__ == "__main__":
+    main()
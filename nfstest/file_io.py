@@ -40,11 +40,24 @@ File operations:
   - Lock
   - Unlock
   - Tlock
+
+The latency of each file operation is recorded in a histogram having
+fixed buckets, four buckets for every power of two microseconds, so the
+overhead of recording the latency is minimal. The histograms are used
+to display the latency percentiles for each operation.
+
+All counters and latency histograms are kept in a shared memory array
+having a slot for each process, so the main process has access to the
+stats of all processes at any time without any interprocess messages.
+This allows the stats to be displayed periodically while the processes
+are running, the interval stats could also be written to a file as JSON
+lines, one JSON object per interval.
 """
 import os
 import re
 import sys
 import time
+import json
 import errno
 import fcntl
 import ctypes
@@ -54,10 +67,13 @@ import formatstr
 import traceback
 import subprocess
 from random import Random
+from Queue import Empty
+from bisect import bisect_right
 import nfstest_config as c
 from baseobj import BaseObj
 from formatstr import str_units, int_units
 from multiprocessing import Process,JoinableQueue
+from multiprocessing.sharedctypes import RawArray
 
 # Module constants
 __author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
@@ -84,6 +100,9 @@ P_RDWRONLY   = False
 P_DIRECT     = False
 P_TMPDIR     = "/tmp"
 P_IODELAY    = 0.0
+P_LATENCY    = False
+P_INTERVAL   = 0.0
+P_JSONFILE   = None
 
 P_RENAME     = 5.0
 P_REMOVE     = 5.0
@@ -109,6 +128,74 @@ P_SIZEMULT   = "1.0"
 # file operations like remove, rename, etc.
 MIN_FILES = 10
 
+# Maximum number of seconds to wait for a message from any of the
+# processes before checking if a process has terminated
+PROC_TIMEOUT = 1.0
+
+# Operations having a latency histogram
+L_OPEN    = 0
+L_CLOSE   = 1
+L_READ    = 2
+L_WRITE   = 3
+L_FSYNC   = 4
+L_RENAME  = 5
+L_REMOVE  = 6
+L_TRUNC   = 7
+L_FTRUNC  = 8
+L_LINK    = 9
+L_SLINK   = 10
+L_READDIR = 11
+L_LOCK    = 12
+L_UNLOCK  = 13
+L_TLOCK   = 14
+
+LAT_OPS = ["OPEN", "CLOSE", "READ", "WRITE", "FSYNC", "RENAME", "REMOVE",
+           "TRUNC", "FTRUNC", "LINK", "SLINK", "READDIR", "LOCK", "UNLOCK",
+           "TLOCK"]
+
+# Upper bound in microseconds for each bucket of the latency histogram,
+# there are four buckets for every power of two up to about 134 seconds
+# plus an extra bucket for any latency larger than that
+LAT_BOUNDS = sorted(set([int(2**(x/4.0)) for x in xrange(1, 109)]))
+LAT_NBUCKETS = len(LAT_BOUNDS) + 1
+# Latency percentiles to display
+LAT_PERCENTILES = [50, 90, 99, 99.9]
+
+# Index of each counter in the stats array
+S_RBYTES   = 0
+S_WBYTES   = 1
+S_NOPEN    = 2
+S_NOPENDGR = 3
+S_NOSYNC   = 4
+S_NCLOSE   = 5
+S_NREAD    = 6
+S_NWRITE   = 7
+S_NFSYNC   = 8
+S_NRENAME  = 9
+S_NREMOVE  = 10
+S_NTRUNC   = 11
+S_NFTRUNC  = 12
+S_NLINK    = 13
+S_NSLINK   = 14
+S_NREADDIR = 15
+S_NLOCK    = 16
+S_NTLOCK   = 17
+S_NUNLOCK  = 18
+
+# Object attribute name for each counter in the stats array
+STAT_NAMES = ["rbytes", "wbytes", "nopen", "nopendgr", "nosync", "nclose",
+              "nread", "nwrite", "nfsync", "nrename", "nremove", "ntrunc",
+              "nftrunc", "nlink", "nslink", "nreaddir", "nlock", "ntlock",
+              "nunlock"]
+
+# The latency histograms follow the counters in the stats array,
+# each histogram has LAT_NBUCKETS buckets plus the total latency
+S_LATENCY = len(STAT_NAMES)
+LAT_HSIZE = LAT_NBUCKETS + 1
+
+# Number of entries in the stats array for each process
+NSTATS = S_LATENCY + len(LAT_OPS)*LAT_HSIZE
+
 # Mapping dictionaries
 LOCKMAP = {
     fcntl.F_RDLCK: "RDLCK",
@@ -135,6 +222,28 @@ def stop_handler(signum, frame):
     """
     raise TermSignal("Terminating process!")
 
+def lat_str(usecs):
+    """Return the latency given in microseconds as a string"""
+    if usecs < 1000:
+        return "%dus" % usecs
+    elif usecs < 1000000:
+        return "%.2fms" % (usecs/1000.0)
+    return "%.3fs" % (usecs/1000000.0)
+
+def lat_percentile(hist, pct):
+    """Return the latency in microseconds for the given percentile from
+       the latency histogram. The value returned is the upper bound of
+       the bucket where the percentile falls in.
+    """
+    total = sum(hist[:LAT_NBUCKETS])
+    limit = pct*total/100.0
+    count = 0
+    for index in xrange(LAT_NBUCKETS):
+        count += hist[index]
+        if count >= limit:
+            break
+    return LAT_BOUNDS[min(index, len(LAT_BOUNDS)-1)]
+
 # File object
 class FileObj(BaseObj): pass
 
@@ -236,6 +345,15 @@ class FileIO(BaseObj):
                Create a log file for each process [default: False]
            logdir:
                Log directory [default: '/tmp']
+           latency:
+               Display latency stats for each operation [default: False]
+           interval:
+               Display stats every given number of seconds, the stats for
+               each process are displayed with debug level 'dbg1'
+               [default: 0 (disabled)]
+           jsonfile:
+               Write the stats for every interval as JSON lines to this
+               file [default: None]
         """
         self.progname   = os.path.basename(sys.argv[0])
         self.datadir    = kwargs.pop("datadir",    None)
@@ -259,6 +377,9 @@ class FileIO(BaseObj):
         self.logdir     = kwargs.pop("logdir",     P_TMPDIR)
         self.exiterr    = kwargs.pop("exiterr",    False)
         self.minfiles   = kwargs.pop("minfiles",   str(MIN_FILES))
+        self.latency    = kwargs.pop("latency",    P_LATENCY)
+        self.interval   = kwargs.pop("interval",   P_INTERVAL)
+        self.jsonfile   = kwargs.pop("jsonfile",   P_JSONFILE)
 
         if self.datadir is None:
             print "Error: datadir is required"
@@ -346,6 +467,20 @@ class FileIO(BaseObj):
         self.ntlock   = 0
         self.stime    = 0
 
+        # Latency histogram for each operation, the last entry in each
+        # histogram is the total latency in microseconds
+        self.lathist = [[0]*LAT_HSIZE for op in LAT_OPS]
+
+        # Shared stats array for all processes and the stats slot
+        # for the current process
+        self.shstats = None
+        self.stats   = None
+
+        # Interval stats: time and stats of the previous interval
+        self.itime  = None
+        self.istats = None
+        self.jsonfd = None
+
         # Set read and write option percentages
         total = 100.0
         if self.rdwr is None:
@@ -536,31 +671,43 @@ class FileIO(BaseObj):
         self.fbuffers.append(dbuffer)
         return dbuffer
 
+    def _latency(self, op, stime):
+        """Add the latency of the operation started at the given time
+           to the latency histogram of the operation
+        """
+        usecs = int(1000000*(time.time() - stime))
+        index = S_LATENCY + op*LAT_HSIZE
+        self.stats[index + bisect_right(LAT_BOUNDS, usecs)] += 1
+        self.stats[index + LAT_NBUCKETS] += usecs
+
     def _getlock(self, name, fd, lock_type=None, offset=0, length=0, lock=None, tlock=False):
         """Get byte range lock on file given by file descriptor"""
         rn = self.random.randint(0,9999)
         stype = fcntl.F_SETLK
         if lock_type == fcntl.F_UNLCK:
             lstr = "UNLOCK"
+            op = L_UNLOCK
             if not lock or rn >= 100*self.unlock:
                 # Do not unlock file
                 return
-            self.nunlock += 1
+            self.stats[S_NUNLOCK] += 1
         else:
             if tlock:
                 # Just do TLOCK
                 lstr = "TLOCK "
+                op = L_TLOCK
                 stype = fcntl.F_GETLK
                 if rn >= 100*self.tlock:
                     # No lock, so no tlock
                     return
-                self.ntlock += 1
+                self.stats[S_NTLOCK] += 1
             else:
                 lstr = "LOCK  "
+                op = L_LOCK
                 if rn >= 100*self.lock:
                     # No lock
                     return
-                self.nlock += 1
+                self.stats[S_NLOCK] += 1
             if lock_type is None:
                 # Choose lock: read or write
                 if self._percent(50):
@@ -575,7 +722,10 @@ class FileIO(BaseObj):
             fstr = " full file"
         self._dprint("DBG4", "%s  %s %d @ %d (%s)%s" % (lstr, name, length, offset, LOCKMAP[lock_type], fstr))
         lockdata = struct.pack('hhllhh', lock_type, 0, offset, length, 0, 0)
-        return fcntl.fcntl(fd, stype, lockdata)
+        stime = time.time()
+        out = fcntl.fcntl(fd, stype, lockdata)
+        self._latency(op, stime)
+        return out
 
     def _do_io(self, **kwargs):
         """Read or write to the given file descriptor"""
@@ -600,19 +750,24 @@ class FileIO(BaseObj):
             data = 'x' * size
             self._dprint("DBG5", "WRITE   %s %d @ %d" % (fileobj.name, size, offset))
 
+            stime = time.time()
             if self.direct:
                 # Direct I/O -- use native write function
                 count = self.libc.write(fd, self.wbuffer, size)
+                self._latency(L_WRITE, stime)
             else:
                 # Buffered I/O
                 count = os.write(fd, data)
+                self._latency(L_WRITE, stime)
                 if self._percent(self.fsync):
                     self._dprint("DBG4", "FSYNC   %s" % fileobj.name)
-                    self.nfsync += 1
+                    self.stats[S_NFSYNC] += 1
+                    stime = time.time()
                     os.fsync(fd)
+                    self._latency(L_FSYNC, stime)
 
-            self.nwrite += 1
-            self.wbytes += count
+            self.stats[S_NWRITE] += 1
+            self.stats[S_WBYTES] += count
             fsize = offset + count
             if fileobj.size < fsize:
                 fileobj.size = fsize
@@ -622,6 +777,7 @@ class FileIO(BaseObj):
                 lockout = self._getlock(fileobj.name, fd, lock_type=fcntl.F_RDLCK, offset=offset, length=size)
             self._dprint("DBG5", "READ    %s %d @ %d" % (fileobj.name, size, offset))
 
+            stime = time.time()
             if self.direct:
                 # Direct I/O -- use native read function
                 count = self.libc.read(fd, self.rbuffer, size)
@@ -629,8 +785,9 @@ class FileIO(BaseObj):
                 # Buffered I/O
                 data = os.read(fd, size)
                 count = len(data)
-            self.rbytes += count
-            self.nread += 1
+            self._latency(L_READ, stime)
+            self.stats[S_RBYTES] += count
+            self.stats[S_NREAD] += 1
 
         if self.random and not lockfull:
             # Unlock file segment
@@ -656,7 +813,9 @@ class FileIO(BaseObj):
             # Choose new size at random
             nsize = self.random.randint(0, fileobj.size + self.wsizedev)
             self._dprint("DBG2", "TRUNC   %s %d -> %d" % (fileobj.name, fileobj.size, nsize))
+            stime = time.time()
             out = self.libc.truncate(self.absfile, nsize)
+            self._latency(L_TRUNC, stime)
             if out == -1:
                 err = ctypes.get_errno()
                 if hasattr(fileobj, 'srcname') and err == errno.ENOENT:
@@ -665,7 +824,7 @@ class FileIO(BaseObj):
                     return
                 raise OSError(err, os.strerror(err), fileobj.name)
             else:
-                self.ntrunc += 1
+                self.stats[S_NTRUNC] += 1
                 fileobj.size = nsize
             return
 
@@ -676,8 +835,10 @@ class FileIO(BaseObj):
             self.absfile = os.path.join(self.datadir, fileobj.name)
             newfile = os.path.join(self.datadir, name)
             self._dprint("DBG2", "RENAME  %s -> %s" % (fileobj.name, name))
+            stime = time.time()
             os.rename(self.absfile, newfile)
-            self.nrename += 1
+            self._latency(L_RENAME, stime)
+            self.stats[S_NRENAME] += 1
             fileobj.name = name
             return
 
@@ -686,8 +847,10 @@ class FileIO(BaseObj):
             fileobj = self._get_fileobj()
             self.absfile = os.path.join(self.datadir, fileobj.name)
             self._dprint("DBG2", "REMOVE  %s" % fileobj.name)
+            stime = time.time()
             os.unlink(self.absfile)
-            self.nremove += 1
+            self._latency(L_REMOVE, stime)
+            self.stats[S_NREMOVE] += 1
             self.n_files.pop(self.findex)
             return
 
@@ -707,8 +870,10 @@ class FileIO(BaseObj):
                     raise Exception("Unable to find a valid source file for hard link")
             srcfile = os.path.join(self.datadir, fileobj.name)
             self._dprint("DBG2", "LINK    %s -> %s" % (name, fileobj.name))
+            stime = time.time()
             os.link(srcfile, self.absfile)
-            self.nlink += 1
+            self._latency(L_LINK, stime)
+            self.stats[S_NLINK] += 1
             linkobj = FileObj(name=name, size=fileobj.size)
             self.n_files.append(linkobj)
             return
@@ -728,8 +893,10 @@ class FileIO(BaseObj):
                     self.absfile = os.path.join(self.datadir, fileobj.name)
                     raise Exception("Unable to find a valid source file for symbolic link")
             self._dprint("DBG2", "SLINK   %s -> %s" % (name, fileobj.name))
+            stime = time.time()
             os.symlink(fileobj.name, self.absfile)
-            self.nslink += 1
+            self._latency(L_SLINK, stime)
+            self.stats[S_NSLINK] += 1
             slinkobj = FileObj(name=name, size=fileobj.size, srcname=fileobj.name)
             self.n_files.append(slinkobj)
             return
@@ -739,6 +906,7 @@ class FileIO(BaseObj):
             count = self.random.randint(1,99)
             self._dprint("DBG2", "READDIR %s maxentries: %d" % (self.datadir, count))
             self.absfile = self.datadir
+            stime = time.time()
             fd = self.libc.opendir(self.datadir)
             index = 0
             while True:
@@ -747,7 +915,8 @@ class FileIO(BaseObj):
                     break
                 index += 1
             out = self.libc.closedir(fd)
-            self.nreaddir += 1
+            self._latency(L_READDIR, stime)
+            self.stats[S_NREADDIR] += 1
             return
 
         # Select type of open: read, write or rdwr
@@ -789,7 +958,7 @@ class FileIO(BaseObj):
             # Add O_SYNC flag when opening file for writing
             oflags |= os.O_SYNC
             oflist.append("O_SYNC")
-            self.nosync += 1
+            self.stats[S_NOSYNC] += 1
 
         if self.direct:
             # Open file for direct I/O
@@ -813,7 +982,9 @@ class FileIO(BaseObj):
                     is_symlink = True
                 self.absfile = os.path.join(self.datadir, fileobj.name)
                 self._dprint("DBG2", "OPEN    %s %s %s" % (fileobj.name, sstr, ostr))
+                stime = time.time()
                 fd = os.open(self.absfile, oflags)
+                self._latency(L_OPEN, stime)
                 st = os.fstat(fd)
                 if is_symlink:
                     self._dprint("DBG6", "OPEN    %s inode:%d symlink" % (fileobj.name, st.st_ino))
@@ -834,7 +1005,7 @@ class FileIO(BaseObj):
                 else:
                     # Unknown error
                     raise
-        self.nopen += 1
+        self.stats[S_NOPEN] += 1
 
         # Get file size for writing
         size = int(abs(self.random.gauss(self.fsizeavg, self.fsizedev)))
@@ -872,8 +1043,10 @@ class FileIO(BaseObj):
             # Choose new size at random
             nsize = self.random.randint(0, fileobj.size + self.wsizedev)
             self._dprint("DBG2", "FTRUNC  %s %d -> %d" % (fileobj.name, fileobj.size, nsize))
+            stime = time.time()
             os.ftruncate(fd, nsize)
-            self.nftrunc += 1
+            self._latency(L_FTRUNC, stime)
+            self.stats[S_NFTRUNC] += 1
             fileobj.size = nsize
 
         # Read or write the file
@@ -895,23 +1068,29 @@ class FileIO(BaseObj):
             # Second, open file again for reading
             # Then close read and write file descriptor
             self._dprint("DBG2", "OPENDGR %s" % fileobj.name)
+            stime = time.time()
             fdr = os.open(self.absfile, os.O_RDONLY)
-            self.nopendgr += 1
+            self._latency(L_OPEN, stime)
+            self.stats[S_NOPENDGR] += 1
             count = self._do_io(fd=fdr, offset=fdroffset, size=self.rsize, fileobj=fileobj)
             fdroffset += count
 
         # Close main file descriptor
         self._dprint("DBG3", "CLOSE   %s" % fileobj.name)
+        stime = time.time()
         os.close(fd)
-        self.nclose += 1
+        self._latency(L_CLOSE, stime)
+        self.stats[S_NCLOSE] += 1
 
         if odgrade:
             for i in xrange(10):
                 count = self._do_io(fd=fdr, offset=fdroffset, size=self.rsize, fileobj=fileobj)
                 fdroffset += count
             self._dprint("DBG3", "CLOSE   %s" % fileobj.name)
+            stime = time.time()
             os.close(fdr)
-            self.nclose += 1
+            self._latency(L_CLOSE, stime)
+            self.stats[S_NCLOSE] += 1
 
         return
 
@@ -929,11 +1108,109 @@ class FileIO(BaseObj):
             path = parpath
         return path
 
-    def run_process(self, tid=0):
-        """Main loop for each process"""
+    def get_stats(self, sindex=None):
+        """Return the stats array from the shared memory
+
+           sindex:
+               Return the stats for the process using this slot,
+               otherwise return the sum of the stats for all the
+               processes [default: None]
+        """
+        if self.shstats is None:
+            return [0]*NSTATS
+        if sindex is not None:
+            return self.shstats[sindex*NSTATS:(sindex+1)*NSTATS]
+        data = self.shstats[:]
+        if self.nprocs == 1:
+            return data
+        return [sum(x) for x in zip(*[data[i:i+NSTATS] for i in xrange(0, len(data), NSTATS)])]
+
+    def _interval_stats(self, ctime):
+        """Display the stats for the time elapsed since the last interval
+           and write them to the JSON file if given
+        """
+        data = self.shstats[:]
+        delta = ctime - self.itime
+        if self.istats is None or delta <= 0:
+            return
+        prevdata = self.istats
+        self.itime  = ctime
+        self.istats = data
+
+        # Counters included in the number of operations
+        opidx = [i for i in xrange(S_NOPEN, S_LATENCY) if i != S_NOSYNC]
+
+        def proc_stats(start, end):
+            """Return the interval stats for the given slice of the array"""
+            diff = [x - y for x, y in zip(data[start:end], prevdata[start:end])]
+            return {
+                "ops":     sum([diff[i] for i in opidx]),
+                "ops_s":   sum([diff[i] for i in opidx])/delta,
+                "read_s":  diff[S_RBYTES]/delta,
+                "write_s": diff[S_WBYTES]/delta,
+            }, diff
+
+        plist = []
+        total = [0]*NSTATS
+        for sindex in xrange(self.nprocs):
+            pstats, diff = proc_stats(sindex*NSTATS, (sindex+1)*NSTATS)
+            pstats["tid"] = self.tidbase + sindex
+            plist.append(pstats)
+            total = [x + y for x, y in zip(total, diff)]
+
+        latency = {}
+        for op in xrange(len(LAT_OPS)):
+            index = S_LATENCY + op*LAT_HSIZE
+            hist = total[index:index+LAT_HSIZE]
+            count = sum(hist[:LAT_NBUCKETS])
+            if count > 0:
+                latency[LAT_OPS[op]] = dict([("count", count), ("avg", hist[LAT_NBUCKETS]/count)] +
+                                            [("p%s" % x, lat_percentile(hist, x)) for x in LAT_PERCENTILES])
+
+        ops = sum([total[i] for i in opidx])
+        rbps = total[S_RBYTES]/delta
+        wbps = total[S_WBYTES]/delta
+        pctstr = ""
+        for opname in ("READ", "WRITE"):
+            if opname in latency:
+                pctstr += ", %s p99 %s" % (opname, lat_str(latency[opname]["p99"]))
+        self.dprint("INFO", "INTERVAL: % 7d ops, % 9.1f ops/s, READ % 10s/s, WRITE % 10s/s%s" %
+                    (ops, ops/delta, str_units(rbps), str_units(wbps), pctstr))
+        for pstats in plist:
+            self.dprint("DBG1", "    PROC %d: % 7d ops, % 9.1f ops/s, READ % 10s/s, WRITE % 10s/s" %
+                        (pstats["tid"], pstats["ops"], pstats["ops_s"], str_units(pstats["read_s"]), str_units(pstats["write_s"])))
+
+        if self.jsonfd is not None:
+            item = {
+                "time":     ctime,
+                "elapsed":  ctime - self.s_time,
+                "interval": delta,
+                "ops":      ops,
+                "ops_s":    ops/delta,
+                "read_s":   rbps,
+                "write_s":  wbps,
+                "latency":  latency,
+                "procs":    plist,
+            }
+            self.jsonfd.write(json.dumps(item, sort_keys=True) + "\n")
+            self.jsonfd.flush()
+
+    def run_process(self, tid=0, sindex=0):
+        """Main loop for each process
+
+           tid:
+               Process id, used to set the random number generator and
+               the file base name
+           sindex:
+               Process slot in the shared stats array [default: 0]
+        """
         ret = 0
         stime = time.time()
         self.tid = tid
+        # Stats for this process are kept in its own slot
+        # of the shared stats array
+        ssize = ctypes.sizeof(ctypes.c_uint64)
+        self.stats = (ctypes.c_uint64 * NSTATS).from_buffer(self.shstats, sindex*NSTATS*ssize)
         self.n_index = 1
         self.n_files = []
         self.s_time  = stime
@@ -991,31 +1268,16 @@ class FileIO(BaseObj):
                 ret = 1
                 break
             ctime = time.time()
+            if self.queue is None and self.interval > 0 and ctime >= self.itime + self.interval:
+                # Single process, display interval stats
+                self._interval_stats(ctime)
             if self.runtime > 0 and ctime >= stime + self.runtime:
                 # Runtime has been reached
                 break
             count += 1
         if self.queue:
-            # Send all counts to main process
-            self.queue.put(["RBYTES",   self.rbytes])
-            self.queue.put(["WBYTES",   self.wbytes])
-            self.queue.put(["NOPEN",    self.nopen])
-            self.queue.put(["NOPENDGR", self.nopendgr])
-            self.queue.put(["NOSYNC",   self.nosync])
-            self.queue.put(["NCLOSE",   self.nclose])
-            self.queue.put(["NREAD",    self.nread])
-            self.queue.put(["NWRITE",   self.nwrite])
-            self.queue.put(["NFSYNC",   self.nfsync])
-            self.queue.put(["NRENAME",  self.nrename])
-            self.queue.put(["NREMOVE",  self.nremove])
-            self.queue.put(["NTRUNC",   self.ntrunc])
-            self.queue.put(["NFTRUNC",  self.nftrunc])
-            self.queue.put(["NLINK",    self.nlink])
-            self.queue.put(["NSLINK",   self.nslink])
-            self.queue.put(["NREADDIR", self.nreaddir])
-            self.queue.put(["NLOCK",    self.nlock])
-            self.queue.put(["NTLOCK",   self.ntlock])
-            self.queue.put(["NUNLOCK",  self.nunlock])
+            # Let the main process know this process is done,
+            # all the counts are already in the shared stats array
             self.queue.put(["RETVALUE", ret])
 
         if self.direct:
@@ -1061,6 +1323,17 @@ class FileIO(BaseObj):
                 if regex:
                     self.dprint("INFO", regex.group(0))
 
+        # Setup shared stats array having a slot for each process
+        self.shstats = RawArray(ctypes.c_uint64, self.nprocs*NSTATS)
+        # Process id of the first process
+        self.tidbase = self.tid
+        if self.interval > 0:
+            self.s_time = stime
+            self.itime  = stime
+            self.istats = self.shstats[:]
+            if self.jsonfile is not None:
+                self.jsonfd = open(self.jsonfile, "a")
+
         if self.nprocs > 1:
             # setup interprocess queue
             self.queue = JoinableQueue()
@@ -1069,84 +1342,65 @@ class FileIO(BaseObj):
                 # Run each subprocess with its own process id (tid)
                 # The process id is used to set the random number generator
                 # and also to have each process work with different files
-                process = Process(target=self.run_process, kwargs={'tid':self.tid})
+                process = Process(target=self.run_process, kwargs={'tid':self.tid, 'sindex':i})
                 processes.append(process)
                 process.start()
                 self.tid += 1
-            done = False
-            while not done:
-                # Wait for a short time so main process does not hog the CPU
-                # by checking the queue continuously
-                time.sleep(0.1)
-                while not self.queue.empty():
-                    # Get any pending messages from any of the processes
-                    level, msg = self.queue.get()
-                    # Check if message is a valid count first
-                    if level == "RBYTES":
-                        self.rbytes += msg
-                    elif level == "WBYTES":
-                        self.wbytes += msg
-                    elif level == "NOPEN":
-                        self.nopen += msg
-                    elif level == "NOPENDGR":
-                        self.nopendgr += msg
-                    elif level == "NOSYNC":
-                        self.nosync += msg
-                    elif level == "NCLOSE":
-                        self.nclose += msg
-                    elif level == "NREAD":
-                        self.nread += msg
-                    elif level == "NWRITE":
-                        self.nwrite += msg
-                    elif level == "NFSYNC":
-                        self.nfsync += msg
-                    elif level == "NRENAME":
-                        self.nrename += msg
-                    elif level == "NREMOVE":
-                        self.nremove += msg
-                    elif level == "NTRUNC":
-                        self.ntrunc += msg
-                    elif level == "NFTRUNC":
-                        self.nftrunc += msg
-                    elif level == "NLINK":
-                        self.nlink += msg
-                    elif level == "NSLINK":
-                        self.nslink += msg
-                    elif level == "NREADDIR":
-                        self.nreaddir += msg
-                    elif level == "NLOCK":
-                        self.nlock += msg
-                    elif level == "NTLOCK":
-                        self.ntlock += msg
-                    elif level == "NUNLOCK":
-                        self.nunlock += msg
-                    elif level == "RETVALUE":
-                        if msg != 0:
-                            errors += 1
-                            if self.exiterr:
-                                # Exit on first error
-                                for process in list(processes):
-                                    process.terminate()
-                                break
-                    else:
-                        # Message is not any of the valid counts,
-                        # so treat it as a debug message
-                        self.dprint(level, msg)
-                # Check if any process has finished
+            ndone = 0
+            while len(processes) > 0:
+                timeout = PROC_TIMEOUT
+                if self.interval > 0:
+                    ctime = time.time()
+                    if ctime >= self.itime + self.interval:
+                        self._interval_stats(ctime)
+                    timeout = max(0, min(timeout, self.itime + self.interval - ctime))
+                try:
+                    # Wait for any message from any of the processes
+                    level, msg = self.queue.get(timeout=timeout)
+                except Empty:
+                    level, msg = None, None
+                if level == "RETVALUE":
+                    # Process is done
+                    ndone += 1
+                    if msg != 0:
+                        errors += 1
+                        if self.exiterr:
+                            # Exit on first error
+                            for process in list(processes):
+                                process.terminate()
+                elif level is not None:
+                    # Message is a debug message
+                    self.dprint(level, msg)
+                    continue
+                # Check if any process has finished, wait for all of them
+                # once all processes are done
                 for process in list(processes):
-                    if not process.is_alive():
+                    if ndone >= self.nprocs or not process.is_alive():
                         process.join()
                         if not self.exiterr and abs(process.exitcode):
                             errors += 1
                         processes.remove(process)
-                        if len(processes) == 0:
-                            done = True
-                            break
         else:
             # Only one process to run, just run the function
             out = self.run_process(tid=self.tid)
             if out != 0:
                 errors += 1
+
+        if self.jsonfd is not None:
+            self.jsonfd.close()
+            self.jsonfd = None
+
+        # Add stats from all processes
+        stats = self.get_stats()
+        for index in xrange(S_LATENCY):
+            name = STAT_NAMES[index]
+            setattr(self, name, getattr(self, name) + stats[index])
+        for op in xrange(len(LAT_OPS)):
+            index = S_LATENCY + op*LAT_HSIZE
+            hist = self.lathist[op]
+            for i in xrange(LAT_HSIZE):
+                hist[i] += stats[index+i]
+
         # Set seed to make sure if this function is called again a different
         # set of operations will be called
         self.seed += self.nprocs
@@ -1179,3 +1433,17 @@ class FileIO(BaseObj):
         if errors > 0:
             self.dprint("INFO", "ERRORS:  % 7d" % errors)
         self.dprint("INFO", "TIME:    % 7d secs" % delta)
+
+        if self.latency:
+            # Display latency stats
+            pctstr = "".join(["% 10s" % ("p%s" % x) for x in LAT_PERCENTILES])
+            self.dprint("INFO", "=================LATENCY==================")
+            self.dprint("INFO", "           COUNT       AVG%s" % pctstr)
+            for op in xrange(len(LAT_OPS)):
+                hist = self.lathist[op]
+                count = sum(hist[:LAT_NBUCKETS])
+                if count == 0:
+                    continue
+                avg = lat_str(hist[LAT_NBUCKETS]/count)
+                pctstr = "".join(["% 10s" % lat_str(lat_percentile(hist, x)) for x in LAT_PERCENTILES])
+                self.dprint("INFO", "%-8s % 7d % 9s%s" % (LAT_OPS[op]+":", count, avg, pctstr))
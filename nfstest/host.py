@@ -20,16 +20,24 @@ It provides methods for mounting and unmounting from an NFS server and
 a mechanism to simulate a network partition via the use of 'iptables'.
 Currently, there is no mechanism to restore the iptables rules to their
 original state.
+
+All commands sent to the same remote host are multiplexed through a single
+ssh connection (ssh ControlMaster) so only the first command pays the cost
+of establishing and authenticating the connection.
 """
 import os
 import re
+import sys
+import glob
 import time
+import atexit
 import ctypes
 import socket
 import subprocess
 import nfstest_config as c
 from baseobj import BaseObj
 from packet.pktt import Pktt
+from capture import Capture, bpf_program, bpf_compile
 
 # Module constants
 __author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
@@ -37,6 +45,37 @@ __copyright__ = "Copyright (C) 2012 NetApp, Inc."
 __license__   = "GPL v2"
 __version__   = "1.5"
 
+# Number of seconds the ssh master connection is kept open after
+# the last command multiplexed through it has finished
+SSH_PERSIST = 600
+
+# ssh master connections started by this process
+# {key: (control path, destination), value: pid}
+_ssh_masters = {}
+
+def _ssh_exit_all():
+    """Close all ssh master connections started by this process,
+       a forked process does not close the connections started
+       by its parent
+    """
+    pid = os.getpid()
+    with open(os.devnull, "w") as fd:
+        for (sshctl, dest), mpid in _ssh_masters.items():
+            if mpid == pid:
+                cmd = "ssh -o ControlPath=%s -O exit %s" % (sshctl, dest)
+                subprocess.call(cmd, shell=True, close_fds=True, stdout=fd, stderr=fd)
+    _ssh_masters.clear()
+atexit.register(_ssh_exit_all)
+
+# RPC programs captured by the "nfs" trace filter besides NFS and portmap:
+# MOUNT, NLM and NSM
+TRACE_RPC_PROGRAMS = (100005, 100021, 100024)
+# Snapshot length used when capturing just the packet headers, this is
+# enough for the link, IP, TCP and RPC/NFS headers of READ and WRITE.
+# It applies to all packets so any other large packet is truncated as
+# well, e.g., READDIR, GETATTR or LAYOUTGET replies
+TRACE_HDR_SNAPLEN = 512
+
 class Host(BaseObj):
     """Host object
 
@@ -123,6 +162,33 @@ class Host(BaseObj):
                Tcpdump command [default: '/usr/sbin/tcpdump']
            tbsize:
                Capture buffer size in kB [default: 150000]
+           tracefilter:
+               Packet filter for the packet trace: "host" captures all
+               traffic between the hosts, "nfs" captures only NFS, portmap,
+               MOUNT and NLM traffic between the hosts (NFSv4.0 callbacks
+               are not captured), any other value is used as the tcpdump
+               filter expression [default: 'host']
+           snaplen:
+               Maximum number of bytes to capture for each packet, use 0 to
+               capture full packets or "hdr" to capture just the packet
+               headers without the READ/WRITE data. Every packet is
+               truncated, so using "hdr" large replies like READDIR,
+               GETATTR or LAYOUTGET are not fully decoded [default: 0]
+           capsize:
+               Rotate packet trace files every 1000000*capsize bytes
+               [default: None (no rotation)]
+           capfiles:
+               Maximum number of rotated packet trace files, once this
+               number is reached the oldest file is overwritten
+               [default: 0 (no limit)]
+           capzip:
+               Compress packet trace files once they are rotated
+               [default: False]
+           capture:
+               Packet capture backend: "tcpdump" or "packet" to capture
+               on the local host using an AF_PACKET socket with a memory
+               mapped ring, tcpdump is used for remote hosts or when
+               capsize is given [default: 'tcpdump']
            notrace:
                Debug option so a trace is not actually started [default: False]
            rpcdebug:
@@ -140,6 +206,9 @@ class Host(BaseObj):
                Iptables command [default: '/usr/sbin/iptables']
            sudo:
                Sudo command [default: '/usr/bin/sudo']
+           sshmux:
+               Multiplex all commands sent to the remote host through a
+               single ssh connection [default: True]
         """
         # Arguments
         self.host         = kwargs.pop("host",         '')
@@ -159,6 +228,12 @@ class Host(BaseObj):
         self.trcdelay     = kwargs.pop("trcdelay",     0.0)
         self.tcpdump      = kwargs.pop("tcpdump",      c.NFSTEST_TCPDUMP)
         self.tbsize       = kwargs.pop("tbsize",       150000)
+        self.tracefilter  = kwargs.pop("tracefilter",  'host')
+        self.snaplen      = kwargs.pop("snaplen",      0)
+        self.capsize      = kwargs.pop("capsize",      None)
+        self.capfiles     = kwargs.pop("capfiles",     0)
+        self.capzip       = kwargs.pop("capzip",       False)
+        self.capture      = kwargs.pop("capture",      'tcpdump')
         self.notrace      = kwargs.pop("notrace",      False)
         self.rpcdebug     = kwargs.pop("rpcdebug",     '')
         self.nfsdebug     = kwargs.pop("nfsdebug",     '')
@@ -167,6 +242,7 @@ class Host(BaseObj):
         self.tmpdir       = kwargs.pop("tmpdir",       c.NFSTEST_TMPDIR)
         self.iptables     = kwargs.pop("iptables",     c.NFSTEST_IPTABLES)
         self.sudo         = kwargs.pop("sudo",         c.NFSTEST_SUDO)
+        self.sshmux       = kwargs.pop("sshmux",       True)
 
         # Initialize object variables
         self.nfs_version = float(self.nfsversion)
@@ -180,6 +256,7 @@ class Host(BaseObj):
         self.tracefile = ''
         self.tracefiles = []
         self.traceproc = None
+        self._rpcports = None
         self.process_list = []
         self.process_smap = {}
         self.process_dmap = {}
@@ -189,6 +266,10 @@ class Host(BaseObj):
         self._mtpoint_created = []
         self.need_network_reset = False
         self._localhost = False if len(self.host) > 0 else True
+        self._sshctl = None
+        if self.sshmux and not self._localhost:
+            # Control socket for the ssh master connection
+            self._sshctl = "%s/.nfstest_ssh_%d_%%r@%%h:%%p" % (c.NFSTEST_TMPDIR, os.getpid())
         self.fqdn = socket.getfqdn(self.host)
         ipv6 = self.proto[-1] == '6'
         self.ipaddr = self.get_ip_address(host=self.host, ipv6=ipv6)
@@ -228,12 +309,52 @@ class Host(BaseObj):
             self.network_reset()
         if self.mounted:
             self.umount()
+        self.remove_mtpoints()
+
+    def remove_mtpoints(self):
+        """Remove all mount point directories created by this object"""
         for mtpoint in self._mtpoint_created:
             try:
                 cmd = "rmdir %s" % mtpoint
                 self.run_cmd(cmd, sudo=True, dlevel='DBG3', msg="Removing mount point directory: ")
             except:
                 pass
+        self._mtpoint_created = []
+
+    def ssh_master(self):
+        """Start the ssh master connection used for multiplexing commands
+           to the remote host if it has not been started yet by this
+           process. The master connection is shared by all objects for
+           the same remote host and it is closed when the process exits.
+           The master is started with its own output redirected so it
+           does not keep open the output pipes of the command starting it.
+        """
+        dest = self._ssh_dest()
+        key = (self._sshctl, dest)
+        # A forked process reuses the master connection of its parent
+        if key not in _ssh_masters:
+            cmd = "ssh -f -N -o ControlMaster=auto -o ControlPath=%s -o ControlPersist=%d %s" % (self._sshctl, SSH_PERSIST, dest)
+            self.dprint('DBG4', "Start ssh master connection: " + cmd)
+            with open(os.devnull, "r+") as fd:
+                subprocess.call(cmd, shell=True, close_fds=True, stdin=fd, stdout=fd, stderr=fd)
+            _ssh_masters[key] = os.getpid()
+
+    def _ssh_dest(self):
+        """Return the ssh destination for the remote host: [user@]host"""
+        if self.user is not None and len(self.user) > 0:
+            return self.user + '@' + self.host
+        return self.host
+
+    def _ssh_opts(self):
+        """Return the ssh options for multiplexing the command through
+           the ssh master connection. The master connection is started
+           by the first command and it is kept open in the background
+           so all other commands reuse it.
+        """
+        if self._sshctl is None:
+            return ""
+        self.ssh_master()
+        return "-o ControlMaster=auto -o ControlPath=%s " % self._sshctl
 
     def nfsvers(self, version=None):
         """Return major and minor version for the given NFS version
@@ -278,6 +399,8 @@ class Host(BaseObj):
            There is no user authentication, so remote host must allow
            ssh connection without any passwords for the user.
            For a localhost the command is just executed and ssh is not used.
+           Commands to a remote host are multiplexed through a single ssh
+           connection unless option sshmux is False.
 
            The object for the process of the command is stored in object
            attribute 'self.process' to be used by methods wait_cmd() and
@@ -304,17 +427,13 @@ class Host(BaseObj):
         self.pstderr = ''
         self.perror  = ''
         self.returncode = 0
-        if self.user is not None and len(self.user) > 0:
-            user = self.user + '@'
-        else:
-            user = ''
 
         # Add sudo command if specified
         if sudo:
             cmd = self.sudo_cmd(cmd)
 
         if not self._localhost:
-            cmd = 'ssh -t -t %s%s "%s"' % (user, self.host, cmd.replace('"', '\\"'))
+            cmd = 'ssh -t -t %s%s "%s"' % (self._ssh_opts(), self._ssh_dest(), cmd.replace('"', '\\"'))
 
         self.dprint(dlevel, msg + cmd)
         self.process = subprocess.Popen(cmd, shell=True, close_fds=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -617,7 +736,46 @@ class Host(BaseObj):
             self.dprint('DBG2', self.perror)
             time.sleep(1)
 
-    def trace_start(self, tracefile=None, interface=None, capsize=None, clients=None):
+    def get_rpc_ports(self):
+        """Return the list of ports used by the NFS server for NFS, portmap,
+           MOUNT and NLM. The ports are queried just once using rpcinfo,
+           if this fails only the NFS and portmap ports are returned.
+        """
+        if self._rpcports is None:
+            self._rpcports = [self.port, 111]
+            try:
+                cmd = "%s -p %s" % (c.NFSTEST_RPCINFO, self.server)
+                out = self.run_cmd(cmd, dlevel='DBG4', msg="Get RPC ports: ")
+                for line in out.split("\n"):
+                    fields = line.split()
+                    if len(fields) >= 4 and fields[0].isdigit() and fields[3].isdigit():
+                        port = int(fields[3])
+                        if int(fields[0]) in TRACE_RPC_PROGRAMS and port not in self._rpcports:
+                            self._rpcports.append(port)
+            except:
+                self.dprint('DBG2', "Unable to get RPC ports: %s" % self.perror)
+        return self._rpcports
+
+    def trace_filter(self, hosts, tracefilter=None):
+        """Return the tcpdump filter expression for the packet trace
+
+           hosts:
+               List of IP addresses to capture
+           tracefilter:
+               Packet filter: "host", "nfs" or tcpdump filter expression
+               [default: self.tracefilter]
+        """
+        if tracefilter is None:
+            tracefilter = self.tracefilter
+        hexpr = "host %s" % " or ".join(hosts)
+        if tracefilter == "host":
+            return hexpr
+        elif tracefilter == "nfs":
+            ports = [str(x) for x in self.get_rpc_ports()]
+            return "(%s) and (port %s)" % (hexpr, " or ".join(ports))
+        return tracefilter
+
+    def trace_start(self, tracefile=None, interface=None, capsize=None, clients=None, tracefilter=None, snaplen=None, capfiles=None, capzip=None):
         """Start trace on interface given
 
            tracefile:
@@ -627,9 +785,24 @@ class Host(BaseObj):
            capsize:
                Use the -C option of tcpdump to split the trace files every
                1000000*capsize bytes. See documentation for tcpdump for more
-               information
+               information [default: self.capsize]
+           capfiles:
+               Use the -W option of tcpdump to limit the number of trace
+               files created when capsize is given, once this number is
+               reached the oldest file is overwritten [default: self.capfiles]
+           capzip:
+               Compress each trace file once tcpdump rotates it when capsize
+               is given [default: self.capzip]
            clients:
                List of Host() objects to monitor
+           tracefilter:
+               Packet filter for the packet trace, see trace_filter()
+               [default: self.tracefilter]
+           snaplen:
+               Maximum number of bytes to capture for each packet, use 0 to
+               capture full packets or "hdr" to capture just the packet
+               headers, large replies like READDIR are truncated as well
+               [default: self.snaplen]
 
            Return the name of the trace file created.
         """
@@ -654,14 +827,33 @@ class Host(BaseObj):
             if interface is not None:
                 opts += " -i %s" % interface
 
+            if capsize is None:
+                capsize = self.capsize
+            if capfiles is None:
+                capfiles = self.capfiles
+            if capzip is None:
+                capzip = self.capzip
+
             if capsize:
                 opts += " -C %d" % capsize
+                if capfiles:
+                    opts += " -W %d" % capfiles
+                if capzip:
+                    opts += " -z gzip"
+
+            if snaplen is None:
+                snaplen = self.snaplen
+            if snaplen == "hdr":
+                snaplen = TRACE_HDR_SNAPLEN
+
+            hosts = [self.ipaddr] + [x.ipaddr for x in clients]
+            tfilter = self.trace_filter(hosts, tracefilter)
 
-            hosts = self.ipaddr
-            for cobj in clients:
-                hosts += " or %s" % cobj.ipaddr
+            if self.capture == "packet" and self._localhost and not capsize:
+                self._capture_start(interface, hosts, tracefilter, int(snaplen))
+                return self.tracefile
 
-            cmd = "%s%s -n -B %d -s 0 -w %s host %s" % (self.tcpdump, opts, self.tbsize, self.tracefile, hosts)
+            cmd = "%s%s -n -B %d -s %d -w %s %s" % (self.tcpdump, opts, self.tbsize, int(snaplen), self.tracefile, repr(tfilter))
             self.run_cmd(cmd, sudo=True, dlevel='DBG2', msg="Trace start: ", wait=False)
             self.traceproc = self.process
 
@@ -677,18 +869,60 @@ class Host(BaseObj):
                     raise Exception(out)
         return self.tracefile
 
+    def _capture_start(self, interface, hosts, tracefilter, snaplen):
+        """Internal method to start the packet trace using an AF_PACKET
+           socket instead of tcpdump. The capture runs in this process
+           when running as root, otherwise the capture module is run as
+           a separate process using sudo.
+        """
+        if tracefilter is None:
+            tracefilter = self.tracefilter
+        if tracefilter in ("host", "nfs"):
+            ports = self.get_rpc_ports() if tracefilter == "nfs" else []
+            bpf = bpf_program(hosts, ports, snaplen)
+        else:
+            bpf = bpf_compile(self.trace_filter(hosts, tracefilter), self.tcpdump)
+        # Ring size is given by the capture buffer size
+        blockcount = max(4, int(self.tbsize)/1024)
+
+        if os.getuid() == 0:
+            self.dprint('DBG2', "Trace start: %s on %s" % (self.tracefile, interface))
+            self.traceproc = Capture(self.tracefile, interface=interface, bpf=bpf, snaplen=snaplen, blockcount=blockcount)
+            self.traceproc.start()
+            return
+
+        bpfstr = ",".join(["%d" % len(bpf)] + ["%d %d %d %d" % x for x in bpf])
+        opts = " -i %s" % interface if interface is not None else ""
+        srcdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        capfile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "capture.py")
+        cmd = "env PYTHONPATH=%s %s %s%s -s %d -b %d -w %s -f '%s'" % (srcdir, sys.executable, capfile, opts, snaplen, blockcount, self.tracefile, bpfstr)
+        self.run_cmd(cmd, sudo=True, dlevel='DBG2', msg="Trace start: ", wait=False)
+        self.traceproc = self.process
+        out = self.traceproc.stderr.readline()
+        if not re.search('listening on', out):
+            time.sleep(1)
+            if self.process.poll() is not None:
+                raise Exception(out + self.traceproc.stderr.read())
+
     def trace_stop(self):
         """Stop the trace started by trace_start()."""
         try:
-            if self.traceproc:
+            if isinstance(self.traceproc, Capture):
                 self.dprint('DBG2', "Trace stop")
                 time.sleep(self.trcdelay)
-                try:
-                    # Try killall first
-                    self.run_cmd("killall tcpdump", sudo=True, dlevel='DBG2')
-                    time.sleep(0.1)
-                except:
-                    pass
+                self.traceproc.stop()
+                self.dprint('DBG2', "%d packets captured, %d packets dropped by kernel" % (self.traceproc.npackets, self.traceproc.ndrops))
+                self.traceproc = None
+            elif self.traceproc:
+                self.dprint('DBG2', "Trace stop")
+                time.sleep(self.trcdelay)
+                if self.capture != "packet" or not self._localhost:
+                    try:
+                        # Try killall first
+                        self.run_cmd("killall tcpdump", sudo=True, dlevel='DBG2')
+                        time.sleep(0.1)
+                    except:
+                        pass
                 # Make sure the process gets killed and wait for it to finish
                 self.stop_cmd(self.traceproc)
                 self.traceproc = None
@@ -697,8 +931,48 @@ class Host(BaseObj):
         except:
             return
 
+    def trace_segments(self, tracefile=None):
+        """Return the list of trace files created by tcpdump for the given
+           trace file, including all the rotated files (<tracefile><N>) and
+           the rotated files which have been compressed (<tracefile><N>.gz)
+
+           tracefile:
+               Name of trace file [default: self.tracefile]
+        """
+        if tracefile is None:
+            tracefile = self.tracefile
+        seglist = []
+        regex = re.compile(re.escape(tracefile) + r"(\d*)(\.gz)?$")
+        for fname in glob.glob(tracefile + "*"):
+            m = regex.match(fname)
+            if m:
+                index = int(m.group(1)) if len(m.group(1)) else -1
+                seglist.append((index, fname))
+        return [x[1] for x in sorted(seglist)]
+
+    def trace_prune(self, tracefile=None, keeptime=0):
+        """Remove all rotated trace files except for the ones having packets
+           within the given number of seconds from the end of the trace
+
+           tracefile:
+               Name of trace file [default: self.tracefile]
+           keeptime:
+               Number of seconds to keep [default: 0]
+        """
+        seglist = self.trace_segments(tracefile)
+        if len(seglist) < 2:
+            return
+        mtimes = [os.stat(x).st_mtime for x in seglist]
+        mintime = max(mtimes) - keeptime
+        rmlist = [x for x, t in zip(seglist, mtimes) if t < mintime]
+        if len(rmlist):
+            cmd = "rm -f %s" % " ".join(rmlist)
+            self.run_cmd(cmd, sudo=True, dlevel='DBG5', msg="    Removing trace files: ")
+
     def trace_open(self, tracefile=None, **kwargs):
         """Open the trace file given or the trace file started by trace_start().
+           If tcpdump has rotated the trace file started by trace_start(),
+           all the rotated trace files are opened.
 
            All extra options are passed directly to the packet trace object.
 
@@ -707,6 +981,9 @@ class Host(BaseObj):
         """
         if tracefile is None:
             tracefile = self.tracefile
+            seglist = self.trace_segments(tracefile)
+            if len(seglist) > 1 or (len(seglist) == 1 and seglist[0] != tracefile):
+                tracefile = seglist if len(seglist) > 1 else seglist[0]
         self.dprint('DBG1', "trace_open [%s]" % tracefile)
         self.pktt = Pktt(tracefile, **kwargs)
         return self.pktt
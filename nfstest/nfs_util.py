@@ -192,6 +192,12 @@ class NFSUtil(Host):
             trcdelay     = kwargs.pop("trcdelay",     self.trcdelay),
             tcpdump      = kwargs.pop("tcpdump",      self.tcpdump),
             tbsize       = kwargs.pop("tbsize",       self.tbsize),
+            tracefilter  = kwargs.pop("tracefilter",  self.tracefilter),
+            snaplen      = kwargs.pop("snaplen",      self.snaplen),
+            capsize      = kwargs.pop("capsize",      self.capsize),
+            capfiles     = kwargs.pop("capfiles",     self.capfiles),
+            capzip       = kwargs.pop("capzip",       self.capzip),
+            capture      = kwargs.pop("capture",      self.capture),
             notrace      = kwargs.pop("notrace",      self.notrace),
             rpcdebug     = kwargs.pop("rpcdebug",     self.rpcdebug),
             nfsdebug     = kwargs.pop("nfsdebug",     self.nfsdebug),
@@ -200,6 +206,7 @@ class NFSUtil(Host):
             tmpdir       = kwargs.pop("tmpdir",       c.NFSTEST_TMPDIR if len(host) else self.tmpdir),
             iptables     = kwargs.pop("iptables",     self.iptables),
             sudo         = kwargs.pop("sudo",         self.sudo),
+            sshmux       = kwargs.pop("sshmux",       self.sshmux),
         )
 
         self.clients.append(self.clientobj)
@@ -234,12 +241,18 @@ class NFSUtil(Host):
         ops_expr   = not defexpr and ops   is not None
         cbs_expr   = not defexpr and cbs   is not None
         procs_expr = not defexpr and procs is not None
-        for pkt in self.pktt:
+        for pkt in self._trace_packets():
             # Get list of NFS packets
             if pkt == "nfs":
                 if maxindex is not None and pkt.record.index >= maxindex:
                     break
 
+                # Discard data from read and write packets so memory
+                # is not an issue. Do this before selecting operations
+                # in case a READ or WRITE packet is selected by any
+                # of the other operations in the array
+                self._discard_data(pkt)
+
                 rpc = pkt.rpc
                 if rpc.procedure == 0:
                     # NULL procedure
@@ -251,15 +264,6 @@ class NFSUtil(Host):
                     incl_pkt = False
                     for item in pkt.nfs.array:
                         op = item.op
-                        # Discard data from read and write packets so memory
-                        # is not an issue. Do this before selecting operations
-                        # in case a READ or WRITE packet is selected by any
-                        # of the other operations in the array
-                        if op == OP_READ and rpc.type == 1:
-                            if item.status == NFS4_OK:
-                                item.opread.resok.data = ""
-                        elif op == OP_WRITE and rpc.type == 0:
-                            item.opwrite.data = ""
                         if not defexpr:
                             # If any of the lists is given, make sure to
                             # include only operations in the given lists
@@ -279,18 +283,40 @@ class NFSUtil(Host):
                     # procedures given in the list
                     if not defexpr and (not procs_expr or procedure not in procs):
                         continue
-                    # Discard data from read and write packets
-                    # so memory is not an issue
-                    if procedure == NFSPROC3_READ and rpc.type == 1:
-                        if pkt.nfs.status == NFS3_OK:
-                            pkt.nfs.opread.resok.data = ""
-                    elif procedure == NFSPROC3_WRITE and rpc.type == 0:
-                        pkt.nfs.opwrite.data = ""
                 pktlist.append(pkt)
                 if pktdisp:
                     self.test_info(str(pkt))
         self.pktt.set_pktlist(pktlist)
 
+    def _trace_packets(self):
+        """Return the source of packets used by set_pktlist()"""
+        return self.pktt
+
+    def _discard_data(self, pkt):
+        """Discard data from READ reply and WRITE call packets"""
+        rpc = pkt.rpc
+        if rpc.procedure == 0:
+            # NULL procedure
+            return
+        elif (rpc.version == 4 and not pkt.nfs.callback) or \
+             (rpc.version == 1 and pkt.nfs.callback):
+            # NFSv4 COMPOUND and callback
+            for item in pkt.nfs.array:
+                op = item.op
+                if op == OP_READ and rpc.type == 1:
+                    if item.status == NFS4_OK:
+                        item.opread.resok.data = ""
+                elif op == OP_WRITE and rpc.type == 0:
+                    item.opwrite.data = ""
+        elif rpc.version == 3:
+            # NFSv3 procedures
+            procedure = pkt.nfs.procedure
+            if procedure == NFSPROC3_READ and rpc.type == 1:
+                if pkt.nfs.status == NFS3_OK:
+                    pkt.nfs.opread.resok.data = ""
+            elif procedure == NFSPROC3_WRITE and rpc.type == 0:
+                pkt.nfs.opwrite.data = ""
+
     def find_nfs_op(self, op, **kwargs):
         """Find the call and its corresponding reply for the specified NFSv4
            operation going to the server specified by the ipaddr and port.
@@ -1255,8 +1281,7 @@ class NFSUtil(Host):
 
             size = nfsop.count
             if iomode != LAYOUTIOMODE4_READ:
-                data = self.data_pattern(file_offset, len(nfsop.data), pattern=pattern)
-                if data != nfsop.data:
+                if self.verify_pattern(file_offset, nfsop.data, pattern=pattern) is not None:
                     bad_pattern += 1
                 else:
                     good_pattern += 1
@@ -1304,8 +1329,7 @@ class NFSUtil(Host):
                     # Get real file offset
                     file_offset = self.get_abs_offset(offset, ds_index)
 
-                    data = self.data_pattern(file_offset, len(nfsop.data), pattern=pattern)
-                    if data != nfsop.data:
+                    if self.verify_pattern(file_offset, nfsop.data, pattern=pattern) is not None:
                         bad_pattern += 1
                     else:
                         good_pattern += 1
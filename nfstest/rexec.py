@@ -32,6 +32,7 @@ remote host without the need for a password.
 import os
 import time
 import types
+import select
 import inspect
 import nfstest_config as c
 from baseobj import BaseObj
@@ -91,49 +92,60 @@ class RemoteServer:
             msg = self.conn.recv()
             self.log("RECEIVED: %r" % msg)
             if type(msg) is dict:
-                try:
-                    # Get command
-                    cmd  = msg.get("cmd")
-                    # Get function/statement/expression and positional arguments
-                    kwts = msg.get("kwts", ())
-                    fstr = kwts[0]
-                    kwts = kwts[1:]
-                    # Get named arguments
-                    kwds = msg.get("kwds", {})
-
-                    if cmd == "run":
-                        # Find if function is defined
-                        if type(fstr) in [types.FunctionType, types.BuiltinFunctionType, types.MethodType]:
-                            # This is a function
-                            func = fstr
-                        else:
-                            # Find symbol in locals then in globals
-                            func = locals().get(fstr)
+                # Request id is sent back with the results
+                reqid = msg.get("id")
+                # A batch has a list of requests, results are sent back
+                # as a list in a single message
+                reqlist = msg.get("batch")
+                if reqlist is None:
+                    reqlist = [msg]
+                results = []
+                for req in reqlist:
+                    try:
+                        # Get command
+                        cmd  = req.get("cmd")
+                        # Get function/statement/expression and positional arguments
+                        kwts = req.get("kwts", ())
+                        fstr = kwts[0]
+                        kwts = kwts[1:]
+                        # Get named arguments
+                        kwds = req.get("kwds", {})
+
+                        if cmd == "run":
+                            # Find if function is defined
+                            if type(fstr) in [types.FunctionType, types.BuiltinFunctionType, types.MethodType]:
+                                # This is a function
+                                func = fstr
+                            else:
+                                # Find symbol in locals then in globals
+                                func = locals().get(fstr)
+                                if func is None:
+                                    func = globals().get(fstr)
                             if func is None:
-                                func = globals().get(fstr)
-                        if func is None:
-                            raise Exception("function not found")
-                        # Run function with all its arguments
-                        out = func(*kwts, **kwds)
-                        self.log("RESULT: " + repr(out))
-                        self.conn.send(out)
-                    elif cmd == "eval":
-                        # Evaluate expression
-                        out = eval(fstr)
-                        self.log("RESULT: " + repr(out))
-                        self.conn.send(out)
-                    elif cmd == "exec":
-                        # Execute statement
-                        exec(fstr)
-                        self.log("EXEC done")
-                        self.conn.send(None)
-                    else:
-                        emsg = "Unknown procedure"
-                        self.log("ERROR: %s" % emsg)
-                        self.conn.send(Exception(emsg))
-                except Exception as e:
-                    self.log("ERROR: %r" % e)
-                    self.conn.send(e)
+                                raise Exception("function not found")
+                            # Run function with all its arguments
+                            out = func(*kwts, **kwds)
+                            self.log("RESULT: " + repr(out))
+                        elif cmd == "eval":
+                            # Evaluate expression
+                            out = eval(fstr)
+                            self.log("RESULT: " + repr(out))
+                        elif cmd == "exec":
+                            # Execute statement
+                            exec(fstr)
+                            self.log("EXEC done")
+                            out = None
+                        else:
+                            emsg = "Unknown procedure"
+                            self.log("ERROR: %s" % emsg)
+                            out = Exception(emsg)
+                    except Exception as e:
+                        self.log("ERROR: %r" % e)
+                        out = e
+                    results.append(out)
+                if msg.get("batch") is None:
+                    results = results[0]
+                self.conn.send((reqid, results))
             if msg == "close":
                 # Request to close the connection,
                 # exit the loop and terminate the server
@@ -217,13 +229,29 @@ class Rexec(BaseObj):
                    out = x.results()
                    break
 
+           # Multiple requests could be in flight, results are matched to
+           # their request by the request id returned when using NOWAIT
+           id1 = x.run("get_time", 2, NOWAIT=True)
+           id2 = x.run("add_one", 3, NOWAIT=True)
+           out2 = x.results(id2)
+           out1 = x.results(id1)
+
+           # Send many requests in a single message and get a list of results
+           fd = x.run(os.open, "/tmp/testfile", os.O_WRONLY|os.O_CREAT)
+           out = x.batch([
+               ("run",  (os.write, fd, "hello there\\n")),
+               ("eval", "add_one(67)"),
+               ("run",  ("get_time",), {"delay":1}),
+               ("run",  (os.close, fd)),
+           ])
+
            # Create remote procedure object as a different user
            # First, run the remote server as root
            x = Rexec("192.168.0.85", sudo=True)
            # Then set the effective user id
            x.run(os.seteuid, 1000)
     """
-    def __init__(self, servername=None, logfile=None, sudo=False, sync_timeout=0.1):
+    def __init__(self, servername=None, logfile=None, sudo=False, connect=True):
         """Constructor
 
            Initialize object's private data.
@@ -237,19 +265,26 @@ class Rexec(BaseObj):
            sudo:
                Run remote procedure server as root
                [Default: False]
-           sync_timeout:
-               Timeout used for synchronizing the connection stream
-               [Default: 0.1]
+           connect:
+               Connect to the remote server, if false the remote server is
+               started but connect() must be called before sending any
+               requests [Default: True]
         """
         global PORT
         self.pid     = None
         self.conn    = None
         self.process = None
         self.remote  = False
-        self.servername   = servername
-        self.logfile      = logfile
-        self.sudo         = sudo
-        self.sync_timeout = sync_timeout
+        self.reqid   = 0
+        self.servername = servername
+        self.logfile    = logfile
+        self.sudo       = sudo
+        # List of request ids not yet returned by results()
+        self._reqids  = []
+        # Results received from the server not yet returned by results()
+        self._pending = {}
+        # Request ids for a batch of requests
+        self._batchids = set()
         if os.getuid() == 0:
             # Already running as root
             self.sudo = True
@@ -289,10 +324,16 @@ class Rexec(BaseObj):
             # Send the server code to be executed via standard input
             self.process.stdin.write(server_code)
 
-        # Connect to remote server
-        address = (servername, PORT)
-        self.conn = Client(address)
+        # Address of remote server
+        self.address = (servername, PORT)
         PORT += 1
+        if connect:
+            self.connect()
+
+    def connect(self):
+        """Connect to remote server"""
+        if self.conn is None:
+            self.conn = Client(self.address)
 
     def __del__(self):
         """Destructor"""
@@ -313,16 +354,57 @@ class Rexec(BaseObj):
             self.process.wait()
             self.process = None
 
-    def _send_cmd(self, cmd, *kwts, **kwds):
-        """Internal method to send commands to remote server"""
-        nowait = kwds.pop("NOWAIT", False)
-        self.conn.send({"cmd": cmd, "kwts": kwts, "kwds": kwds})
+    def _send_msg(self, msg, nowait=False):
+        """Internal method to send a message to the remote server, the
+           message is tagged with a unique request id so the results
+           can be matched to the request
+        """
+        self.reqid += 1
+        msg["id"] = self.reqid
+        self._reqids.append(self.reqid)
+        if msg.get("batch") is not None:
+            self._batchids.add(self.reqid)
+        self.conn.send(msg)
         if nowait:
-            # NOWAIT option is specified, so return immediately
+            # NOWAIT option is specified, so return the request id
+            # immediately
             # Use poll() method to check if any data is available
             # Use results() method to get pending results from function
-            return
-        return self.results()
+            return self.reqid
+        return self.results(self.reqid)
+
+    def _send_cmd(self, cmd, *kwts, **kwds):
+        """Internal method to send commands to remote server"""
+        nowait = kwds.pop("NOWAIT", False)
+        return self._send_msg({"cmd": cmd, "kwts": kwts, "kwds": kwds}, nowait)
+
+    def batch(self, reqlist, NOWAIT=False):
+        """Send a list of requests to the remote server in a single message
+           and return the list of results. The requests are processed in
+           order by the remote server and if any of the requests fails the
+           first exception is raised once all requests have been processed.
+
+           reqlist:
+               List of requests where each request is a tuple of the form:
+                   (cmd, kwts[, kwds])
+               cmd:
+                   Request type: "run", "eval" or "exec"
+               kwts:
+                   Positional arguments, the first argument is the function,
+                   expression or statement, a single value is taken as a
+                   tuple having just this value
+               kwds:
+                   Dictionary of named arguments [default: {}]
+           NOWAIT:
+               Return the request id immediately, use results() with the
+               request id to get the list of results [default: False]
+        """
+        batch = []
+        for req in reqlist:
+            kwts = req[1] if type(req[1]) in (tuple, list) else (req[1],)
+            kwds = req[2] if len(req) > 2 else {}
+            batch.append({"cmd": req[0], "kwts": tuple(kwts), "kwds": kwds})
+        return self._send_msg({"batch": batch}, NOWAIT)
 
     def wait(self, objlist=None, timeout=0):
         """Return a list of Rexec objects where data is available to be read
@@ -333,46 +415,75 @@ class Rexec(BaseObj):
                Maximum time in seconds to block, if timeout is None then
                an infinite timeout is used
         """
-        ret = []
         if objlist is None:
             # Use current object as default
             objlist = [self]
 
-        for obj in objlist:
-            if obj.poll(timeout):
-                ret.append(obj)
+        # Objects having results already received
+        idlist = set([id(x) for x in objlist if len(x._pending)])
+        if len(idlist):
             # Just check all other objects if they are ready now
             timeout = 0
+        # Wait on all connections at once
+        rlist = select.select([x.conn for x in objlist], [], [], timeout)[0]
+        idlist.update([id(x) for x in objlist if x.conn in rlist])
+        ret = [x for x in objlist if id(x) in idlist]
         return ret if len(ret) else None
 
     def poll(self, timeout=0):
-        """Return whether there is any data available to be read
+        """Return whether there is any data available to be read or
+           any results already received
 
            timeout:
                Maximum time in seconds to block, if timeout is None then
                an infinite timeout is used
         """
+        if len(self._pending):
+            # Results already received
+            return True
         return self.conn.poll(timeout)
 
-    def results(self):
-        """Return pending results"""
-        while True:
-            out = self.conn.recv()
-            if isinstance(out, Exception):
-                raise out
-            elif out is None and self.poll(self.sync_timeout):
-                # Try to re-sync when recv() returns None and there is
-                # still data in the buffer
-                continue
-            return out
+    def _recv(self):
+        """Internal method to receive the results of a single request and
+           save them so they can be returned by results()
+        """
+        rid, out = self.conn.recv()
+        self._pending[rid] = out
 
-    def rexec(self, expr):
+    def results(self, reqid=None):
+        """Return pending results
+
+           reqid:
+               Return the results for this request id, results received
+               for other requests are saved so they can be returned later
+               [default: results of the oldest pending request]
+        """
+        if reqid is None:
+            if len(self._reqids) == 0:
+                return
+            reqid = self._reqids[0]
+        while reqid not in self._pending:
+            self._recv()
+        out = self._pending.pop(reqid)
+        if reqid in self._reqids:
+            self._reqids.remove(reqid)
+        if isinstance(out, Exception):
+            raise out
+        elif reqid in self._batchids:
+            # Results for a batch of requests
+            self._batchids.discard(reqid)
+            for item in out:
+                if isinstance(item, Exception):
+                    raise item
+        return out
+
+    def rexec(self, expr, NOWAIT=False):
         """Execute statement on remote server"""
-        return self._send_cmd("exec", expr)
+        return self._send_cmd("exec", expr, NOWAIT=NOWAIT)
 
-    def reval(self, expr):
+    def reval(self, expr, NOWAIT=False):
         """Evaluate expression on remote server"""
-        return self._send_cmd("eval", expr)
+        return self._send_cmd("eval", expr, NOWAIT=NOWAIT)
 
     def run(self, *kwts, **kwds):
         """Run function on remote server
@@ -383,12 +494,12 @@ class Rexec(BaseObj):
         """
         return self._send_cmd("run", *kwts, **kwds)
 
-    def rcode(self, code):
+    def rcode(self, code, NOWAIT=False):
         """Define function on remote server"""
         codesrc = "".join(inspect.getsourcelines(code)[0])
-        self.rexec(codesrc)
+        return self.rexec(codesrc, NOWAIT=NOWAIT)
 
-    def rimport(self, module, symbols=[]):
+    def rimport(self, module, symbols=[], NOWAIT=False):
         """Import module on remote server
 
            module:
@@ -398,10 +509,183 @@ class Rexec(BaseObj):
         """
         # Import module
         if len(symbols) == 0:
-            self.rexec("import %s" % module)
+            reqlist = [("exec", "import %s" % module)]
             symbols = [module]
         else:
-            self.rexec("from %s import %s" % (module, ",".join(symbols)))
+            reqlist = [("exec", "from %s import %s" % (module, ",".join(symbols)))]
         # Make all symbols global
         for item in symbols:
-            self.rexec("globals()['%s']=locals()['%s']" % (item, item))
+            reqlist.append(("exec", "globals()['%s']=locals()['%s']" % (item, item)))
+        return self.batch(reqlist, NOWAIT=NOWAIT)
+
+class RexecPool(BaseObj):
+    """RexecPool object
+
+       RexecPool() -> New pool of remote procedure objects
+
+       Arguments:
+           servernames:
+               List of host names or IP addresses of hosts where the
+               remote servers will run, use an empty string to run the
+               remote server locally
+           logfiles:
+               List of pathnames of log files to be created on the remote
+               hosts, one for each server [default: None]
+
+       All other arguments are passed to each Rexec object
+
+       Usage:
+           from nfstest.rexec import RexecPool
+
+           # Function to be defined at all remote hosts
+           def get_time(delay=0):
+               time.sleep(delay)
+               return time.time()
+
+           # Start remote servers on all clients concurrently
+           pool = RexecPool(["client1", "client2", "client3"])
+
+           # Define function on all remote servers
+           pool.rimport("time")
+           pool.rcode(get_time)
+
+           # Run function on all remote servers concurrently, results
+           # are returned in the same order as the list of servers
+           tlist = pool.run("get_time", 2)
+
+           # Send request to all remote servers, do other things and
+           # then gather the results
+           reqids = pool.scatter("run", os.getpid)
+           ...
+           pids = pool.gather(reqids)
+
+           # Wait for any of the remote servers to have results available
+           objlist = pool.wait(timeout=1)
+
+           # Close all remote servers
+           pool.close()
+    """
+    def __init__(self, servernames=[], logfiles=None, **kwds):
+        """Constructor
+
+           Start all remote servers and then connect to each of them so
+           all remote servers are started concurrently.
+        """
+        self.rexeclist = []
+        for idx in xrange(len(servernames)):
+            logfile = logfiles[idx] if logfiles else None
+            self.rexeclist.append(Rexec(servernames[idx], logfile=logfile, connect=False, **kwds))
+        for obj in self.rexeclist:
+            obj.connect()
+
+    def __del__(self):
+        """Destructor"""
+        self.close()
+
+    def close(self):
+        """Close connection to all remote servers"""
+        for obj in self.rexeclist:
+            obj.close()
+        self.rexeclist = []
+
+    def scatter(self, method, *kwts, **kwds):
+        """Send the same request to all remote servers without waiting
+           for the results and return the list of request ids, one for
+           each remote server. Use gather() to get the results.
+
+           method:
+               Rexec method to call: "run", "reval", "rexec", "rcode",
+               "rimport" or "batch"
+
+           All other arguments are passed to the Rexec method
+        """
+        kwds["NOWAIT"] = True
+        return [getattr(obj, method)(*kwts, **kwds) for obj in self.rexeclist]
+
+    def gather(self, reqids, timeout=None, exceptions=False):
+        """Return the list of results for the given list of request ids,
+           results are read from all remote servers as they become
+           available. If any of the requests fails the first exception
+           is raised once all results have been received.
+
+           reqids:
+               List of request ids as returned by scatter()
+           timeout:
+               Maximum time in seconds to wait for all results, if timeout
+               is None then an infinite timeout is used [default: None]
+           exceptions:
+               Return any exception in the list of results instead of
+               raising it [default: False]
+        """
+        results = [None] * len(reqids)
+        errors  = []
+        pending = range(len(reqids))
+        stime   = time.time()
+        while True:
+            for idx in list(pending):
+                obj = self.rexeclist[idx]
+                if reqids[idx] in obj._pending:
+                    try:
+                        results[idx] = obj.results(reqids[idx])
+                    except Exception as e:
+                        results[idx] = e
+                        errors.append(e)
+                    pending.remove(idx)
+            if len(pending) == 0:
+                break
+            tout = None
+            if timeout is not None:
+                tout = max(0, timeout - (time.time() - stime))
+            # Wait on the connections of all servers still pending
+            connlist = [self.rexeclist[idx].conn for idx in pending]
+            rlist = select.select(connlist, [], [], tout)[0]
+            if len(rlist) == 0:
+                raise Exception("Timeout waiting for results from remote servers")
+            for idx in pending:
+                obj = self.rexeclist[idx]
+                if obj.conn in rlist:
+                    obj._recv()
+        if len(errors) and not exceptions:
+            raise errors[0]
+        return results
+
+    def wait(self, timeout=0):
+        """Return a list of Rexec objects where data is available to be read
+
+           timeout:
+               Maximum time in seconds to block, if timeout is None then
+               an infinite timeout is used
+        """
+        if len(self.rexeclist):
+            return self.rexeclist[0].wait(self.rexeclist, timeout)
+
+    def run(self, *kwts, **kwds):
+        """Run function on all remote servers and return the list of results
+
+           The first positional argument is the function to be executed.
+           All other positional arguments and any named arguments are treated
+           as arguments to the function
+        """
+        return self.gather(self.scatter("run", *kwts, **kwds))
+
+    def rexec(self, expr):
+        """Execute statement on all remote servers"""
+        return self.gather(self.scatter("rexec", expr))
+
+    def reval(self, expr):
+        """Evaluate expression on all remote servers"""
+        return self.gather(self.scatter("reval", expr))
+
+    def rcode(self, code):
+        """Define function on all remote servers"""
+        return self.gather(self.scatter("rcode", code))
+
+    def rimport(self, module, symbols=[]):
+        """Import module on all remote servers
+
+           module:
+               Module to import in the remote servers
+           symbols:
+               If given, import only these symbols from the module
+        """
+        return self.gather(self.scatter("rimport", module, symbols))
@@ -44,19 +44,24 @@ the iptables rules to their original state.
 """
 import os
 import re
+import gc
 import sys
 import time
 import fcntl
 import ctypes
 import struct
+import signal
 import inspect
+import cPickle
 import textwrap
+import traceback
 from utils import *
 from formatstr import *
-from rexec import Rexec
+from rexec import Rexec, RexecPool
 import nfstest_config as c
 from baseobj import BaseObj
 from nfs_util import NFSUtil
+from packet.pktt import Pktt
 import packet.nfs.nfs3_const as nfs3_const
 import packet.nfs.nfs4_const as nfs4_const
 from optparse import OptionParser,OptionGroup,IndentedHelpFormatter,SUPPRESS_HELP
@@ -83,6 +88,15 @@ VT_HL   = "\033[47m"
 
 _isatty = os.isatty(1)
 
+# Default data pattern, each line has the file offset followed by the
+# pattern string and each line is always _DP_LINE_LEN bytes long
+_DP_STRING     = 'abcdefghijklmnopqrst'
+_DP_LINE_LEN   = 32
+_DP_LINE_FMT   = "0x%08X " + _DP_STRING + "\n"
+# Number of lines to format at a time
+_DP_BLOCK_LINES = 32768
+_DP_BLOCK_SIZE  = _DP_BLOCK_LINES * _DP_LINE_LEN
+
 _test_map = {
     HEAD: "\n*** ",
     INFO: "    ",
@@ -177,6 +191,11 @@ class TestUtil(NFSUtil):
                         Reformat the description so it fits in lines no
                         more than the width given. The description is not
                         formatted for a value of zero [default: 72]
+           partests:
+               List of tests which are independent of each other so they
+               can be run concurrently when using the --parallel option.
+               These tests must not use remote procedure servers, other
+               hosts or packet traces [default: []]
 
            Example:
                x = TestUtil(testnames=['basic', 'lock'])
@@ -189,6 +208,7 @@ class TestUtil(NFSUtil):
         self.usage      = kwargs.pop('usage', '')
         self.testnames  = kwargs.pop('testnames', [])
         self.testgroups = kwargs.pop('testgroups', {})
+        self.partests   = kwargs.pop('partests', [])
         self.progname = os.path.basename(sys.argv[0])
         self.testname = ""
         if self.progname[-3:] == '.py':
@@ -222,9 +242,12 @@ class TestUtil(NFSUtil):
         self._opts_done = False
         # List of sparse files
         self.sparse_files = []
+        # Aligned write buffer used by write_data: [buffer, size, contents]
+        self._wbuffer = [None, 0, None]
         # Rexec attributes
         self.rexecobj = None
         self.rexecobj_list = []
+        self.rexecpool_list = []
         # List of remote files
         self.remote_files = []
         self.nfserr_list  = None
@@ -238,6 +261,8 @@ class TestUtil(NFSUtil):
         self.trace_marker_list = []
         self.trace_marker_index = 0
         self.trace_marker_id = 0
+        # Background trace decoding: [tracefile, pid, pklfile, pktlist]
+        self._bgdecode = None
 
         if len(self.testnames) > 0:
             # Add default testgroup: all
@@ -262,6 +287,12 @@ class TestUtil(NFSUtil):
         # Prototypes for libc functions
         self.libc.fallocate.argtypes = ctypes.c_int, ctypes.c_int, ctypes.c_ulong, ctypes.c_ulong
         self.libc.fallocate.restype  = ctypes.c_int
+        self.libc.pwrite.argtypes = ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_long
+        self.libc.pwrite.restype  = ctypes.c_ssize_t
+        self.libc.posix_memalign.argtypes = ctypes.POINTER(ctypes.c_void_p), ctypes.c_size_t, ctypes.c_size_t
+        self.libc.posix_memalign.restype  = ctypes.c_int
+        self.libc.free.argtypes = ctypes.c_void_p,
+        self.libc.free.restype  = None
 
     def __del__(self):
         """Destructor
@@ -276,6 +307,9 @@ class TestUtil(NFSUtil):
         self.dprint('DBG7', "Calling %s() destructor" % self.__class__.__name__)
         self.trace_stop()
         self.cleanup(newline=False)
+        if self._wbuffer[0] is not None:
+            self.libc.free(self._wbuffer[0])
+            self._wbuffer = [None, 0, None]
         # Call base destructor
         NFSUtil.__del__(self)
         if self.dprint_count() > count:
@@ -414,12 +448,49 @@ class TestUtil(NFSUtil):
         self.cap_opgroup.add_option("--createtraces", action="store_true", default=False, help=hmsg)
         hmsg = "Capture buffer size for tcpdump [default: %default]"
         self.cap_opgroup.add_option("--tbsize", default="192k", help=hmsg)
+        hmsg = "Packet filter for the packet trace: 'host' captures all " + \
+               "traffic between the hosts, 'nfs' captures only NFS, " + \
+               "portmap, MOUNT and NLM traffic between the hosts, any " + \
+               "other value is used as the tcpdump filter expression " + \
+               "[default: '%default']"
+        self.cap_opgroup.add_option("--tracefilter", default="host", help=hmsg)
+        hmsg = "Maximum number of bytes to capture for each packet, use 0 " + \
+               "to capture full packets or 'hdr' to capture just the " + \
+               "packet headers without the READ/WRITE data, 'hdr' " + \
+               "truncates every packet to 512 bytes so large replies " + \
+               "like READDIR, GETATTR or LAYOUTGET are not fully " + \
+               "decoded, do not use 'hdr' for tests verifying data " + \
+               "or attributes in the packet trace [default: %default]"
+        self.cap_opgroup.add_option("--snaplen", default="0", help=hmsg)
+        hmsg = "Rotate packet trace files every given number of bytes " + \
+               "[default: no rotation]"
+        self.cap_opgroup.add_option("--capsize", default="", help=hmsg)
+        hmsg = "Maximum number of rotated packet trace files, once this " + \
+               "number is reached the oldest file is overwritten, this " + \
+               "option is used only when --capsize is given " + \
+               "[default: %default (no limit)]"
+        self.cap_opgroup.add_option("--capfiles", type="int", default=0, help=hmsg)
+        hmsg = "Compress rotated packet trace files"
+        self.cap_opgroup.add_option("--capzip", action="store_true", default=False, help=hmsg)
+        hmsg = "Keep just the rotated packet trace files within the last " + \
+               "given number of minutes of each packet trace when there " + \
+               "are failures [default: %default (keep all)]"
+        self.cap_opgroup.add_option("--capkeep", type="float", default=0.0, help=hmsg)
+        hmsg = "Packet capture backend: 'tcpdump' or 'packet' to capture " + \
+               "on the local host using an AF_PACKET socket with a memory " + \
+               "mapped ring and the packet filter attached to the socket, " + \
+               "tcpdump is always used when --capsize is given " + \
+               "[default: '%default']"
+        self.cap_opgroup.add_option("--capture", default="tcpdump", help=hmsg)
         hmsg = "Seconds to delay before stopping packet trace [default: %default]"
         self.cap_opgroup.add_option("--trcdelay", type="float", default=0.0, help=hmsg)
         hmsg = "Do not remove any trace files [default: remove trace files if no errors]"
         self.cap_opgroup.add_option("--keeptraces", action="store_true", default=False, help=hmsg)
         hmsg = "Remove trace files [default: remove trace files if no errors]"
         self.cap_opgroup.add_option("--rmtraces", action="store_true", default=False, help=hmsg)
+        hmsg = "Decode packet trace on a background process as soon as " + \
+               "the trace is stopped"
+        self.cap_opgroup.add_option("--bgdecode", action="store_true", default=False, help=hmsg)
         hmsg = "Device interface [default: automatically selected]"
         self.cap_opgroup.add_option("-i", "--interface", default=None, help=hmsg)
         self.opts.add_option_group(self.cap_opgroup)
@@ -471,6 +542,8 @@ class TestUtil(NFSUtil):
         self.dbg_opgroup.add_option("--nfserrors", action="store_true", default=False, help=hmsg)
         hmsg = "IP address of localhost"
         self.dbg_opgroup.add_option("--client-ipaddr", default=None, help=hmsg)
+        hmsg = "Do not multiplex all commands sent to a remote host through a single ssh connection"
+        self.dbg_opgroup.add_option("--nosshmux", action="store_true", default=False, help=hmsg)
         self.opts.add_option_group(self.dbg_opgroup)
 
         usage = self.usage
@@ -480,6 +553,20 @@ class TestUtil(NFSUtil):
                    "with a '^' then all tests are run except the ones " + \
                    "listed [default: 'all']"
             self.test_opgroup.add_option("--runtest", default=None, help=hmsg)
+            if len(self.partests) > 0:
+                hmsg = "Maximum number of tests to run concurrently, only " + \
+                       "the tests known to be independent of each other " + \
+                       "are run concurrently and all other tests are run " + \
+                       "one at a time. Each test runs in its own process " + \
+                       "using its own mount point and trace files, the " + \
+                       "output of each test is displayed when the test " + \
+                       "finishes and in the same order as the tests are " + \
+                       "given. The mount points share the same NFS client " + \
+                       "state (connection and superblock) and the trace " + \
+                       "of each test includes the traffic of all tests " + \
+                       "running at the same time. This option is ignored " + \
+                       "when remote procedure servers are used [default: %default]"
+                self.test_opgroup.add_option("--parallel", type="int", default=1, help=hmsg)
             self.opts.add_option_group(self.test_opgroup)
             if len(usage) == 0:
                 usage = "%prog [options]"
@@ -957,6 +1044,7 @@ class TestUtil(NFSUtil):
             # Process all command line arguments -- all will be part of the
             # objects namespace
             self.__dict__.update(opts.__dict__)
+            self.sshmux = not self.nosshmux
             if not self.server:
                 self.opts.error("server option is required")
 
@@ -993,6 +1081,8 @@ class TestUtil(NFSUtil):
             self.tverbose = _tverbose_map.get(self.tverbose)
             if self.tverbose is None:
                 self.opts.error("invalid value for tverbose option")
+            if self.capture not in ("tcpdump", "packet"):
+                self.opts.error("invalid value for capture option")
 
             # Convert units
             self.filesize     = int_units(self.filesize)
@@ -1000,6 +1090,13 @@ class TestUtil(NFSUtil):
             self.wsize        = int_units(self.wsize)
             self.offset_delta = int_units(self.offset_delta)
             self.tbsize       = int_units(self.tbsize)
+            if self.snaplen != "hdr":
+                self.snaplen  = int_units(self.snaplen)
+            # Size of rotated files is given in units of 1000000 bytes
+            if self.capsize:
+                self.capsize  = max(1, int_units(self.capsize)/1000000)
+            else:
+                self.capsize  = None
 
             # Set NFS version -- the actual value will be set after the mount
             self.nfs_version = float(self.nfsversion)
@@ -1141,6 +1238,8 @@ class TestUtil(NFSUtil):
                 pass
         self.rexecobj = None
         self.rexecobj_list = []
+        self.rexecpool_list = []
+        self._trace_decode_reset()
 
         for item in self.remote_files:
             try:
@@ -1159,9 +1258,17 @@ class TestUtil(NFSUtil):
         if not self.keeptraces and (self.rmtraces or self._msg_count[FAIL] == 0):
             for rfile in self.tracefiles:
                 try:
-                    # Remove trace files as root
+                    # Remove trace files as root, including rotated files
                     self.dprint('DBG5', "    Removing trace file [%s]" % rfile)
-                    os.system(self.sudo_cmd("rm -f %s" % rfile))
+                    rmlist = [rfile] + self.trace_segments(rfile)
+                    os.system(self.sudo_cmd("rm -f %s" % " ".join(rmlist)))
+                except:
+                    pass
+        elif not self.keeptraces and self.capkeep > 0:
+            for rfile in self.tracefiles:
+                try:
+                    # Keep the last capkeep minutes of each packet trace
+                    self.trace_prune(rfile, 60*self.capkeep)
                 except:
                     pass
 
@@ -1245,6 +1352,113 @@ class TestUtil(NFSUtil):
         # Start the packet trace
         return super(TestUtil, self).trace_start(*kwts, **kwds)
 
+    def trace_stop(self, *kwts, **kwds):
+        """This is a wrapper to the original trace_stop method to start
+           decoding the packet trace on a background process when the
+           --bgdecode option is given
+        """
+        tracing = self.traceproc is not None
+        ret = super(TestUtil, self).trace_stop(*kwts, **kwds)
+        if tracing and getattr(self, "bgdecode", False):
+            self.trace_decode()
+        return ret
+
+    def trace_decode(self, tracefile=None):
+        """Decode the packet trace on a background process. All NFS, NLM
+           and MOUNT packets are decoded so set_pktlist() uses these
+           packets instead of decoding the packet trace once it is opened
+           by trace_open(). The data of READ replies and WRITE calls is
+           discarded.
+
+           tracefile:
+               Name of trace file to decode [default: self.tracefile]
+        """
+        self._trace_decode_reset()
+        if tracefile is None:
+            tracefile = self.tracefile
+        if not tracefile or not os.path.exists(tracefile):
+            return
+        pklfile = tracefile + ".pkl"
+        # Flush all buffered output so it is not duplicated
+        sys.stdout.flush()
+        self.flush_log()
+        pid = os.fork()
+        if pid == 0:
+            # Child process: decode packet trace and save packets to file
+            try:
+                pktlist = []
+                pktt = Pktt(tracefile)
+                for pkt in pktt:
+                    if pkt == "nfs":
+                        self._discard_data(pkt)
+                    elif pkt != "nlm" and pkt != "mount":
+                        continue
+                    pktlist.append(pkt)
+                pktt.close()
+                gc.disable()
+                fd = open(pklfile + ".tmp", "wb")
+                cPickle.dump(pktlist, fd, cPickle.HIGHEST_PROTOCOL)
+                fd.close()
+                os.rename(pklfile + ".tmp", pklfile)
+            finally:
+                os._exit(0)
+        self.dprint('DBG2', "Decoding packet trace [%s] on process %d" % (tracefile, pid))
+        self._bgdecode = [tracefile, pid, pklfile, None]
+
+    def _trace_decode_reset(self):
+        """Internal method to stop the background decoding of the packet
+           trace and to release all decoded packets
+        """
+        if self._bgdecode is None:
+            return
+        tracefile, pid, pklfile, pktlist = self._bgdecode
+        self._bgdecode = None
+        if pid is not None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        for fname in (pklfile, pklfile + ".tmp"):
+            if os.path.exists(fname):
+                os.unlink(fname)
+
+    def _trace_packets(self):
+        """Return the list of packets decoded on the background process for
+           the opened packet trace, waiting for the process to finish if
+           necessary. Return the packet trace object if the packet trace
+           has not been decoded on the background.
+        """
+        if self._bgdecode is None or self._bgdecode[0] != self.pktt.bfile:
+            return self.pktt
+        if self._bgdecode[3] is None:
+            tracefile, pid, pklfile, pktlist = self._bgdecode
+            if pid is not None:
+                self.dprint('DBG2', "Waiting for packet trace decoding process %d" % pid)
+                os.waitpid(pid, 0)
+                self._bgdecode[1] = None
+            # Garbage collection is disabled while loading all the packets
+            # since it is not needed and it just slows down the loading
+            gcenabled = gc.isenabled()
+            gc.disable()
+            try:
+                fd = open(pklfile, "rb")
+                data = fd.read()
+                fd.close()
+                self._bgdecode[3] = cPickle.loads(data)
+                del data
+                os.unlink(pklfile)
+            except Exception as e:
+                self.dprint('DBG2', "Unable to get decoded packet trace: %s" % e)
+                self._trace_decode_reset()
+                return self.pktt
+            finally:
+                if gcenabled:
+                    gc.enable()
+        # Skip packets already read from the packet trace object
+        index = self.pktt.index
+        return [x for x in self._bgdecode[3] if x.record.index >= index]
+
     def trace_open(self, *kwts, **kwds):
         """This is a wrapper to the original trace_open method where the
            packet trace is scanned for NFS errors and a failure is logged
@@ -1264,7 +1478,7 @@ class TestUtil(NFSUtil):
                     "mount3": self.mnt3err_list,
                 }
             # Scan for NFS errors
-            for pkt in self.pktt:
+            for pkt in self._trace_packets():
                 for objname in ("nfs", "nlm", "mount"):
                     nfsobj = getattr(pkt, objname, None)
                     if nfsobj:
@@ -1305,6 +1519,28 @@ class TestUtil(NFSUtil):
         self.rexecobj_list.append(self.rexecobj)
         return self.rexecobj
 
+    def create_rexec_pool(self, servernames, **kwds):
+        """Create a pool of remote server objects, all remote servers are
+           started concurrently.
+        """
+        logfiles = []
+        for servername in servernames:
+            remote = servername not in [None, "", "localhost", "127.0.0.1"]
+            logfile = None
+            if self.rexeclog:
+                logfile = self.get_logname(remote)
+                if remote:
+                    self.remote_files.append([servername, logfile])
+            logfiles.append(logfile)
+
+        self.dprint('DBG2', "Start %d remote procedure servers" % len(servernames))
+        pool = RexecPool(servernames, logfiles=logfiles, **kwds)
+        self.rexecobj_list += pool.rexeclist
+        # Keep a reference to the pool so its remote servers are not
+        # closed when the caller's reference goes away
+        self.rexecpool_list.append(pool)
+        return pool
+
     def run_tests(self, **kwargs):
         """Run all test specified by the --runtest option.
 
@@ -1314,15 +1550,194 @@ class TestUtil(NFSUtil):
            All other arguments given are passed to the test methods.
         """
         testnames = kwargs.pop("testnames", self.testlist)
-        for name in self.testlist:
+        tlist = [x for x in self.testlist if x in testnames and hasattr(self, x+'_test')]
+        parallel = getattr(self, "parallel", 1) > 1
+        if parallel and len(self.rexecobj_list) > 0:
+            # The remote procedure servers cannot be used by the test
+            # processes so run all tests one at a time
+            self.warning("Option --parallel is ignored when using remote procedure servers")
+            parallel = False
+        index = 0
+        while index < len(tlist):
+            plist = []
+            if parallel:
+                # Run all consecutive independent tests concurrently
+                while index+len(plist) < len(tlist) and tlist[index+len(plist)] in self.partests:
+                    plist.append(tlist[index+len(plist)])
+            if len(plist) > 1:
+                self._run_tests_parallel(plist, **kwargs)
+                index += len(plist)
+                continue
+            name = tlist[index]
+            index += 1
             testmethod = name + '_test'
-            if name in testnames and hasattr(self, testmethod):
+            self._runtest = True
+            self._tverbose()
+            # Set current testname on object
+            self.testname = name
+            # Execute test
+            getattr(self, testmethod)(**kwargs)
+
+    def _run_tests_parallel(self, tlist, **kwargs):
+        """Internal method to run the given list of tests concurrently,
+           running no more than --parallel tests at a time. Each test is
+           run in its own process and its output is displayed in the same
+           order as the list of tests once the test finishes.
+        """
+        self._runtest = True
+        self._tverbose()
+        basename = "%s/%s" % (self.tmpdir, self.get_name())
+        # List of tests to start: (index, testname)
+        pending = list(enumerate(tlist))
+        # Processes running: {pid: index}
+        running = {}
+        # Tests done but not yet displayed
+        done = set()
+        index = 0
+        try:
+            while len(pending) or len(running):
+                while len(pending) and len(running) < self.parallel:
+                    idx, name = pending.pop(0)
+                    # Flush all buffered output so it is not duplicated
+                    # in the new process
+                    sys.stdout.flush()
+                    self.flush_log()
+                    pid = os.fork()
+                    if pid == 0:
+                        # Child process: run test and exit
+                        self._run_test_proc(idx, name, "%s_%s" % (basename, name), **kwargs)
+                    self.dprint('DBG2', "Started test '%s' on process %d" % (name, pid))
+                    running[pid] = idx
+
+                # Wait for any of the running tests to finish
+                for pid in list(running):
+                    if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                        done.add(running.pop(pid))
+                if index not in done:
+                    time.sleep(0.1)
+
+                # Display output of all finished tests in order
+                while index in done:
+                    self._test_proc_output("%s_%s" % (basename, tlist[index]))
+                    done.discard(index)
+                    index += 1
+        except:
+            # Stop all running tests so they are not left orphaned
+            self._stop_test_procs(running)
+            raise
+
+    def _stop_test_procs(self, running, timeout=30):
+        """Internal method to interrupt the given test processes and wait
+           for them to finish. A test process is killed if it does not
+           finish cleaning up within the given timeout.
+        """
+        for pid in running:
+            try:
+                os.kill(pid, signal.SIGINT)
+            except OSError:
+                pass
+        stime = time.time()
+        for pid in list(running):
+            try:
+                while os.waitpid(pid, os.WNOHANG)[0] != pid:
+                    if time.time() - stime > timeout:
+                        os.kill(pid, signal.SIGKILL)
+                        os.waitpid(pid, 0)
+                        break
+                    time.sleep(0.1)
+            except OSError:
+                pass
+
+    def _run_test_proc(self, idx, name, basename, **kwargs):
+        """Internal method to run a single test on a child process using
+           its own mount point and trace files. The output of the test is
+           saved to files named as the given base name so the parent
+           process can display it.
+        """
+        try:
+            # Redirect stdout and stderr
+            fd = os.open(basename + ".out", os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0644)
+            os.dup2(fd, 1)
+            os.dup2(fd, 2)
+            os.close(fd)
+            if getattr(self, "logfile", None):
+                self.open_log(basename + ".log")
+
+            # Do not use or cleanup any resources belonging to the parent
+            mounted = self.mounted
+            self.mounted = False
+            self.traceproc = None
+            self.tracefiles = []
+            self.remove_list = []
+            self.remote_files = []
+            self.rexecobj = None
+            self.rexecobj_list = []
+            self.rexecpool_list = []
+            self._bgdecode = None
+            self._mtpoint_created = []
+            self.test_msgs = []
+            for tid in _test_map:
+                self._msg_count[tid] = 0
+
+            # Use its own mount point and trace files
+            self.mtpoint = "%s_%d" % (self.mtpoint.rstrip("/"), idx)
+            self.tracename = "%s_%s" % (self.tracename, name)
+            # Use its own names for files and directories
+            self._name = "%s_%s" % (self.get_name(), name)
+            self.nocleanup = False
+            if mounted:
+                self.mount()
+
+            self._runtest = True
+            self.testname = name
+            getattr(self, name + '_test')(**kwargs)
+        except:
+            self.test(False, traceback.format_exc().rstrip())
+        finally:
+            try:
                 self._runtest = True
                 self._tverbose()
-                # Set current testname on object
-                self.testname = name
-                # Execute test
-                getattr(self, testmethod)(**kwargs)
+                self.trace_stop()
+                self.cleanup(newline=False)
+                self.remove_mtpoints()
+            finally:
+                # Save test results for the parent process
+                fd = open(basename + ".res", "w")
+                cPickle.dump([self._msg_count, self.test_msgs], fd)
+                fd.close()
+                sys.stdout.flush()
+                self.close_log()
+                os._exit(0)
+
+    def _test_proc_output(self, basename):
+        """Internal method to display the output of a test that has run on
+           a child process and to add its results to the total count.
+        """
+        try:
+            fd = open(basename + ".res", "r")
+            msg_count, test_msgs = cPickle.load(fd)
+            fd.close()
+            for tid in msg_count:
+                self._msg_count[tid] += msg_count[tid]
+            self.test_msgs += test_msgs
+        except Exception:
+            self.test(False, "Unable to get results for test process: %s.res" % basename)
+        for ext in (".out", ".log"):
+            fname = basename + ext
+            if not os.path.exists(fname):
+                continue
+            fd = open(fname, "r")
+            data = fd.read()
+            fd.close()
+            if ext == ".out":
+                sys.stdout.write(data)
+                sys.stdout.flush()
+                self._empty_msg = int(data[-2:] == "\n\n")
+            else:
+                self.write_log(data.rstrip("\n"))
+            os.unlink(fname)
+        if os.path.exists(basename + ".res"):
+            os.unlink(basename + ".res")
 
     def _print_msg(self, msg, tid=None, single=0):
         """Display message to the screen and to the log file."""
@@ -1634,29 +2049,64 @@ class TestUtil(NFSUtil):
                Data pattern to return, default is of the form:
                hex_offset(0x%08X) abcdefghijklmnopqrst\\n
         """
-        data = ''
+        if size <= 0:
+            return ''
         if pattern is None:
-            pattern = 'abcdefghijklmnopqrst'
-            line_len = 32
-            default = True
+            s_offset = offset % _DP_LINE_LEN
+            data = "".join(self._pattern_blocks(offset - s_offset, offset + size))
         else:
             line_len = len(pattern)
-            default = False
-
-        s_offset = offset % line_len
-        offset = offset - s_offset
-        N = int(0.9999 + (size + s_offset) / float(line_len))
-
-        for i in range(0,N):
-            if default:
-                str_offset = "0x%08X " % offset
-                plen = 31 - len(str_offset)
-                data += str_offset + pattern[:plen] + '\n'
-                offset += line_len
-            else:
-                data += pattern
+            s_offset = offset % line_len
+            N = (size + s_offset + line_len - 1) // line_len
+            data = pattern * N
         return data[s_offset:size+s_offset]
 
+    @staticmethod
+    def _pattern_blocks(offset, end):
+        """Generator yielding blocks of the default data pattern starting
+           at the given line aligned offset up to (and including) the line
+           having the end offset.
+        """
+        while offset < end:
+            nlines = min(_DP_BLOCK_LINES, (end - offset + _DP_LINE_LEN - 1) // _DP_LINE_LEN)
+            last = offset + (nlines - 1) * _DP_LINE_LEN
+            offsets = xrange(offset, last + 1, _DP_LINE_LEN)
+            if last <= 0xFFFFFFFF:
+                # All offsets are formatted using exactly eight hex digits so
+                # the whole block is formatted in a single operation
+                yield (_DP_LINE_FMT * nlines) % tuple(offsets)
+            else:
+                # Offset string is longer so truncate the pattern string
+                # to keep the same line length
+                yield "".join([("0x%08X %s" % (x, _DP_STRING))[:_DP_LINE_LEN-1] + "\n" for x in offsets])
+            offset = last + _DP_LINE_LEN
+
+    def verify_pattern(self, offset, data, pattern=None):
+        """Verify data matches the data pattern.
+
+           offset:
+               Starting offset of data
+           data:
+               Data to verify
+           pattern:
+               Data pattern to compare [default: data_pattern default]
+
+           Return the offset of the first byte not matching the data pattern
+           or None if all data matches. The expected data is generated one
+           block at a time so the data pattern for the whole size of the
+           data is never created.
+        """
+        size = len(data)
+        index = 0
+        while index < size:
+            count = min(_DP_BLOCK_SIZE, size - index)
+            expected = self.data_pattern(offset + index, count, pattern)
+            chunk = data[index:index+count]
+            if chunk != expected:
+                return offset + index + len(os.path.commonprefix([chunk, expected]))
+            index += count
+        return None
+
     def delay_io(self, delay=None):
         """Delay I/O by value given or the value given in --iodelay option."""
         if delay is None:
@@ -1672,6 +2122,35 @@ class TestUtil(NFSUtil):
         os.mkdir(self.absdir, mode)
         return self.dirname
 
+    def _get_wbuffer(self, size):
+        """Return the address of the page aligned write buffer making sure
+           it is at least the given size. The buffer is reused by all calls
+           to write_data so it is allocated only when a larger buffer is
+           needed.
+        """
+        if self._wbuffer[1] < size:
+            if self._wbuffer[0] is not None:
+                self.libc.free(self._wbuffer[0])
+                self._wbuffer = [None, 0, None]
+            # Round size up to a page boundary
+            size += -size % self.PAGESIZE
+            dbuffer = ctypes.c_void_p()
+            err = self.libc.posix_memalign(ctypes.byref(dbuffer), self.PAGESIZE, size)
+            if err:
+                raise OSError(err, os.strerror(err))
+            self._wbuffer = [dbuffer.value, size, None]
+        return self._wbuffer[0]
+
+    def _fill_wbuffer(self, data, key=None):
+        """Copy data to the write buffer, if key is given and it matches
+           the key of the current contents the buffer is not modified.
+        """
+        addr = self._get_wbuffer(len(data))
+        if key is None or self._wbuffer[2] != key:
+            ctypes.memmove(addr, data, len(data))
+            self._wbuffer[2] = key
+        return addr
+
     def write_data(self, fd, offset=0, size=None, pattern=None):
         """Write data to the file given by the file descriptor
 
@@ -1683,17 +2162,59 @@ class TestUtil(NFSUtil):
                Total number of bytes to write [default: --filesize option]
            pattern:
                Data pattern to write to the file [default: data_pattern default]
+
+           Data is written as much as wsize bytes per write call using
+           pwrite from a page aligned buffer so it works for files opened
+           with O_DIRECT as well. The default data pattern is generated
+           for many write calls at a time while any other pattern is
+           generated just once since it repeats itself: the buffer holds
+           wsize bytes plus a full pattern so the data for any offset
+           is found in the buffer.
         """
         if size is None:
             size = self.filesize
+        if size <= 0:
+            return
+
+        wsize = self.wsize
+        odirect = fcntl.fcntl(fd, fcntl.F_GETFL) & getattr(os, "O_DIRECT", 0)
+        if pattern is not None and not odirect:
+            # Data is the same for all offsets modulo the pattern length,
+            # the starting address of each write depends on the offset
+            # so it could be unaligned and not used with O_DIRECT
+            plen = len(pattern)
+            bsize = wsize + plen
+            addr = self._fill_wbuffer(self.data_pattern(0, bsize, pattern), (pattern, bsize))
+        else:
+            # Generate data for as many write calls as possible
+            plen = 0
+            bsize = max(wsize, _DP_BLOCK_SIZE - _DP_BLOCK_SIZE % wsize)
+            addr = self._get_wbuffer(bsize)
+            bindex = blen = 0
 
         while size > 0:
             # Write as much as wsize bytes per write call
-            dsize = min(self.wsize, size)
-            os.lseek(fd, offset, 0)
-            count = os.write(fd, self.data_pattern(offset, dsize, pattern))
+            if plen:
+                dsize = min(wsize, size)
+                index = offset % plen
+            else:
+                if bindex >= blen:
+                    # Generate the data for the next block
+                    blen = min(bsize, size)
+                    self._fill_wbuffer(self.data_pattern(offset, blen, pattern))
+                    bindex = 0
+                dsize = min(wsize, size, blen - bindex)
+                index = bindex
+            count = self.libc.pwrite(fd, addr + index, dsize, offset)
+            if count < 0:
+                err = ctypes.get_errno()
+                raise OSError(err, os.strerror(err))
+            if not plen:
+                bindex += count
             size -= count
             offset += count
+        # Leave file position at the end of the data written
+        os.lseek(fd, offset, 0)
 
     def create_file(self, offset=0, size=None, dir=None, mode=None, **kwds):
         """Create a file starting to write at given offset with total size
@@ -121,6 +121,7 @@ NFSTEST_SCRIPTS = [
 NFSTEST_ALLMODS = [
     'baseobj.py',
     'formatstr.py',
+    'nfstest/capture.py',
     'nfstest/file_io.py',
     'nfstest/host.py',
     'nfstest/nfs_util.py',
@@ -129,6 +130,7 @@ NFSTEST_ALLMODS = [
     'nfstest/utils.py',
     'packet/derunpack.py',
     'packet/pkt.py',
+    'packet/pktstats.py',
     'packet/pktt.py',
     'packet/record.py',
     'packet/unpack.py',
@@ -199,5 +201,6 @@ NFSTEST_SUDO         = _find_exec('sudo')
 NFSTEST_IPTABLES     = _find_exec('iptables')
 NFSTEST_TCPDUMP      = _find_exec('tcpdump')
 NFSTEST_CMD_IP       = _find_exec('ip')
+NFSTEST_RPCINFO      = _find_exec('rpcinfo')
 NFSTEST_MESSAGESLOG  = '/var/log/messages'
 NFSTEST_TMPDIR       = '/tmp'
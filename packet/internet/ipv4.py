@@ -18,6 +18,7 @@ Decode IP version 4 layer.
 """
 import struct
 import nfstest_config as c
+from collections import OrderedDict
 from baseobj import BaseObj
 from packet.utils import ShortHex
 from packet.transport.tcp import TCP
@@ -27,7 +28,11 @@ from packet.transport.udp import UDP
 __author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
 __copyright__ = "Copyright (C) 2012 NetApp, Inc."
 __license__   = "GPL v2"
-__version__   = "1.3"
+__version__   = "1.4"
+
+# Module variables
+FRAG_TIMEOUT  = 30   # Seconds to keep an incomplete datagram
+FRAG_MAXCOUNT = 1024 # Maximum number of incomplete datagrams
 
 # Name of different protocols
 _IP_map = {1:'ICMP(1)', 2:'IGMP(2)', 6:'TCP(6)', 17:'UDP(17)'}
@@ -42,6 +47,153 @@ class Flags(BaseObj):
         self.DF = ((data >> 14) & 0x01) # Don't Fragment
         self.MF = ((data >> 13) & 0x01) # More Fragments
 
+class Datagram(object):
+    """IPv4 datagram being reassembled from its fragments
+
+       Each fragment is placed directly into the buffer at its offset.
+       The holes, byte ranges in the datagram not yet received, are kept
+       so the datagram is complete when there are no holes left, the
+       end of the last hole is None until the last fragment is received.
+       The holes are tracked using the fragment size on the wire so a
+       fragment truncated by the capture does not leave a hole, the
+       missing data is filled with zeros.
+    """
+    def __init__(self, stime):
+        self.stime  = stime       # Time of the last fragment received
+        self.size   = None        # Size of datagram, known on last fragment
+        self.buffer = bytearray()
+        self.holes  = [[0, None]] # List of holes: [start, end]
+
+    def add_fragment(self, offset, data, last=False, size=None):
+        """Place fragment data at the given offset in the datagram
+
+           offset:
+               Offset of fragment data in bytes
+           data:
+               Fragment data
+           last:
+               This is the last fragment of the datagram
+           size:
+               Size of fragment data on the wire [default: len(data)]
+        """
+        buffer = self.buffer
+        if offset > len(buffer):
+            buffer.extend(bytearray(offset - len(buffer)))
+        buffer[offset:offset+len(data)] = data
+        if size is None:
+            size = len(data)
+        end = offset + size
+        if last:
+            self.size = end
+
+        # Update the list of holes
+        holes = self.holes
+        if len(holes) == 1 and holes[0][0] == offset and holes[0][1] is None:
+            # Fragments received in order
+            if last:
+                self.holes = []
+            else:
+                holes[0][0] = end
+            return
+        holes = []
+        for hstart, hend in self.holes:
+            if end <= hstart or (hend is not None and offset >= hend):
+                # Fragment does not fill any part of this hole
+                if not (last and hstart >= end):
+                    holes.append([hstart, hend])
+                continue
+            if offset > hstart:
+                # There is still a hole before the fragment
+                holes.append([hstart, offset])
+            if hend is None:
+                if not last:
+                    # Rest of datagram is still missing
+                    holes.append([end, None])
+            elif end < hend:
+                # There is still a hole after the fragment
+                holes.append([end, hend])
+        self.holes = holes
+
+    def complete(self):
+        """True if all fragments have been received"""
+        return len(self.holes) == 0
+
+    def has_ends(self):
+        """True if both the first and last fragments have been received"""
+        return self.size is not None and (len(self.holes) == 0 or self.holes[0][0] > 0)
+
+    def get_data(self):
+        """Return datagram data, any missing fragments are filled with zeros"""
+        return memoryview(self.buffer)[:self.size].tobytes()
+
+class Fragments(object):
+    """IPv4 fragments object used for reassembly
+
+       Datagrams are identified by the source and destination addresses,
+       the protocol and the identification. A datagram is reassembled
+       when all its fragments have been received or, as fragments may be
+       missing from the capture, when both its first and last fragments
+       have been received, filling any missing fragments with zeros.
+       When a new datagram is
+       added, the least recently updated incomplete datagrams are evicted
+       if no fragment has been received for them in FRAG_TIMEOUT seconds
+       (using the packet timestamps) or if there are already FRAG_MAXCOUNT
+       incomplete datagrams.
+    """
+    def __init__(self):
+        # Incomplete datagrams {key: (src, dst, protocol, id), value: Datagram}
+        # in the order they were last updated
+        self._datagrams = OrderedDict()
+
+    def size(self):
+        """Return the number of incomplete datagrams"""
+        return len(self._datagrams)
+    __len__ = size
+
+    def reset(self):
+        """Clear incomplete datagrams"""
+        self._datagrams = OrderedDict()
+
+    def add_fragment(self, key, offset, data, last, stime, size=None):
+        """Add fragment to the datagram identified by the given key and
+           return the reassembled datagram data if it is complete,
+           otherwise return None
+
+           key:
+               Datagram identifier: (src, dst, protocol, id)
+           offset:
+               Offset of fragment data in bytes
+           data:
+               Fragment data
+           last:
+               This is the last fragment of the datagram
+           stime:
+               Timestamp of packet
+           size:
+               Size of fragment data on the wire [default: len(data)]
+        """
+        datagrams = self._datagrams
+        # Remove datagram so it is added back as the most recently updated
+        datagram = datagrams.pop(key, None)
+        if datagram is None:
+            # Evict stale datagrams before adding a new one
+            while len(datagrams) >= FRAG_MAXCOUNT:
+                datagrams.popitem(last=False)
+            while len(datagrams):
+                dkey = next(iter(datagrams))
+                if stime - datagrams[dkey].stime <= FRAG_TIMEOUT:
+                    break
+                del datagrams[dkey]
+            datagram = Datagram(stime)
+        datagram.stime = stime
+        datagram.add_fragment(offset, data, last, size)
+        if datagram.complete() or ((last or offset == 0) and datagram.has_ends()):
+            # Reassemble datagram when all fragments have been received or
+            # on the fragment which completes both ends of the datagram
+            return datagram.get_data()
+        datagrams[key] = datagram
+        return None
+
 class IPv4(BaseObj):
     """IPv4 object
 
@@ -114,28 +266,27 @@ class IPv4(BaseObj):
             osize = self.header_size - 20
             self.options = unpack.read(osize)
 
-        if self.flags.MF:
+        if self.flags.MF or self.fragment_offset > 0:
             # This is an IP fragment
             record = pktt.pkt.record
-            self.data = unpack.getbytes()
-            fragment = pktt._ipv4_fragments.setdefault(self.id, {})
-            fragment[self.fragment_offset] = self.data
-            return
-        else:
-            # Reassemble the fragments
-            fragment = pktt._ipv4_fragments.pop(self.id, None)
-            if fragment is not None:
-                data = ""
-                for off in sorted(fragment.keys()):
-                    offset = 8*off # Offset is given in multiples of 8
-                    count = len(data)
-                    if offset > count:
-                        # Fill missing fragments with zeros
-                        data += "\x00" * (offset - count)
-                    data += fragment[off]
-                # Insert all previous fragments right before the current
-                # (and last) fragment
-                unpack.insert(data)
+            fdata = unpack.getbytes()
+            size = self.total_size - self.header_size
+            if size > 0:
+                # Drop any link layer padding
+                fdata = fdata[:size]
+            else:
+                size = None
+            key = (self.src, self.dst, self.protocol, self.id)
+            # Offset is given in multiples of 8
+            data = pktt._ipv4_fragments.add_fragment(key, 8*self.fragment_offset,
+                                     fdata, not self.flags.MF, record.secs, size)
+            if data is None:
+                # Datagram is not complete
+                self.data = unpack.getbytes()
+                return
+            # Replace the fragment with the reassembled datagram
+            unpack.read(len(unpack))
+            unpack.insert(data)
 
         if self.protocol == 6:
             # Decode TCP
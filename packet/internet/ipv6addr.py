@@ -18,6 +18,9 @@ Create an object to represent an IPv6 address. An IPv6 address is given either
 by a series of hexadecimal numbers or using the ":" notation. It provides
 a mechanism for comparing this object with a regular string. It also takes
 care of '::' notation and leading zeroes.
+
+Address objects created from the raw bytes of the address are cached so
+the same object is returned every time the same address is decoded.
 """
 import nfstest_config as c
 
@@ -25,7 +28,16 @@ import nfstest_config as c
 __author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
 __copyright__ = "Copyright (C) 2012 NetApp, Inc."
 __license__   = "GPL v2"
-__version__   = "1.1"
+__version__   = "1.2"
+
+# Maximum number of entries in each cache
+CACHE_SIZE = 4096
+
+# Address objects keyed by the raw bytes of the address
+_addr_cache = {}
+
+# Canonical representation of addresses given in any of the supported formats
+_conv_cache = {}
 
 class IPv6Addr(str):
     """IPv6Addr address object
@@ -35,6 +47,9 @@ class IPv6Addr(str):
 
            ip = IPv6Addr('fe80000000000000020c29fffe5409ef')
 
+           # Create object from the raw bytes of the address
+           ip = IPv6Addr.frombytes(data)
+
        The following expressions are equivalent:
            ip == 0xFE80000000000000020C29FFFE5409EF
            ip == 0xfe80000000000000020c29fffe5409ef
@@ -116,15 +131,47 @@ class IPv6Addr(str):
             ip = ":".join(olist)
         return ip
 
+    @staticmethod
+    def _canonical(ip):
+        """Return the persistent representation of an IPv6 address, the
+           conversion is done just once for each different value given.
+        """
+        try:
+            return _conv_cache[ip]
+        except (KeyError, TypeError):
+            pass
+        ret = IPv6Addr._convert(ip)
+        if type(ip) in (str, int, long):
+            if len(_conv_cache) >= CACHE_SIZE:
+                _conv_cache.clear()
+            _conv_cache[ip] = ret
+        return ret
+
+    @staticmethod
+    def frombytes(data):
+        """Return the IPv6 address object for the given 16 bytes, the same
+           object is returned for the same address.
+        """
+        ip = _addr_cache.get(data)
+        if ip is None:
+            ip = IPv6Addr(data.encode('hex'))
+            if len(_addr_cache) >= CACHE_SIZE:
+                _addr_cache.clear()
+            _addr_cache[data] = ip
+        return ip
+
     def __new__(cls, ip):
         """Create new instance by converting input int/string into a persistent
            representation of an IPv6 address.
         """
-        return super(IPv6Addr, cls).__new__(cls, IPv6Addr._convert(ip))
+        return super(IPv6Addr, cls).__new__(cls, IPv6Addr._canonical(ip))
 
     def __eq__(self, other):
         """Compare two IPv6 addresses and return True if both are equal."""
-        return str(self) == self._convert(other)
+        if isinstance(other, IPv6Addr):
+            return str.__eq__(self, other)
+        other = IPv6Addr._canonical(other)
+        return other is not None and str.__eq__(self, other)
 
     def __ne__(self, other):
         """Compare two IPv6 addresses and return False if both are equal."""
@@ -135,7 +182,7 @@ if __name__ == '__main__':
     ip = IPv6Addr('fe80000000000000020c29fffe5409ef')
     ipstr = "%s" % ip
     iprpr = "%r" % ip
-    ntests = 22
+    ntests = 24
 
     tcount = 0
     if ip == 0xFE80000000000000020C29FFFE5409EF:
@@ -189,6 +236,13 @@ if __name__ == '__main__':
     if IPv6Addr("1:0:0:2:0:0:0:0") == "1:0:0:2::":
         tcount += 1
 
+    data = 'fe80000000000000020c29fffe5409ef'.decode('hex')
+    ip = IPv6Addr.frombytes(data)
+    if ip == 'fe80::20c:29ff:fe54:9ef' and ip is IPv6Addr.frombytes(data):
+        tcount += 1
+    if ip == IPv6Addr('fe80:0000:0000:0000:020c:29ff:fe54:09ef'):
+        tcount += 1
+
     if tcount == ntests:
         print "All tests passed!"
         exit(0)
@@ -63,8 +63,8 @@ class ETHERNET(BaseObj):
         """
         unpack = pktt.unpack
         ulist = unpack.unpack(14, "!6s6sH")
-        self.dst  = MacAddr(ulist[0].encode('hex'))
-        self.src  = MacAddr(ulist[1].encode('hex'))
+        self.dst  = MacAddr.frombytes(ulist[0])
+        self.src  = MacAddr.frombytes(ulist[1])
         self.type = ulist[2]
         pktt.pkt.add_layer("ethernet", self)
 
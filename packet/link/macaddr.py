@@ -17,15 +17,27 @@ MacAddr module
 Create an object to represent a MAC address. A MAC address is given either
 by a series of hexadecimal numbers or using the ":" notation. It provides
 a mechanism for comparing this object with a regular string.
+
+Address objects created from the raw bytes of the address are cached so
+the same object is returned every time the same address is decoded.
 """
 import nfstest_config as c
 
 # Module constants
 __author__    = 'Jorge Mora (%s)' % c.NFSTEST_AUTHOR_EMAIL
-__version__   = '1.0.1'
+__version__   = '1.0.2'
 __copyright__ = "Copyright (C) 2012 NetApp, Inc."
 __license__   = "GPL v2"
 
+# Maximum number of entries in each cache
+CACHE_SIZE = 4096
+
+# Address objects keyed by the raw bytes of the address
+_addr_cache = {}
+
+# Canonical representation of addresses given in any of the supported formats
+_conv_cache = {}
+
 class MacAddr(str):
     """MacAddr address object
 
@@ -34,6 +46,9 @@ class MacAddr(str):
 
            mac = MacAddr('E4CE8F589FF4')
 
+           # Create object from the raw bytes of the address
+           mac = MacAddr.frombytes(data)
+
        The following expressions are equivalent:
            mac == 'E4CE8F589FF4'
            mac == 'e4ce8f589ff4'
@@ -50,15 +65,47 @@ class MacAddr(str):
                 mac = ':'.join(a+b for a,b in zip(t, t))
         return mac
 
+    @staticmethod
+    def _canonical(mac):
+        """Return the persistent representation of a MAC address, the
+           conversion is done just once for each different value given.
+        """
+        try:
+            return _conv_cache[mac]
+        except (KeyError, TypeError):
+            pass
+        ret = MacAddr._convert(mac)
+        if type(mac) == str:
+            if len(_conv_cache) >= CACHE_SIZE:
+                _conv_cache.clear()
+            _conv_cache[mac] = ret
+        return ret
+
+    @staticmethod
+    def frombytes(data):
+        """Return the MAC address object for the given 6 bytes, the same
+           object is returned for the same address.
+        """
+        mac = _addr_cache.get(data)
+        if mac is None:
+            mac = MacAddr(data.encode('hex'))
+            if len(_addr_cache) >= CACHE_SIZE:
+                _addr_cache.clear()
+            _addr_cache[data] = mac
+        return mac
+
     def __new__(cls, mac):
         """Create new instance by converting input string into a persistent
            representation of a MAC address.
         """
-        return super(MacAddr, cls).__new__(cls, MacAddr._convert(mac))
+        return super(MacAddr, cls).__new__(cls, MacAddr._canonical(mac))
 
     def __eq__(self, other):
         """Compare two MAC addresses and return True if both are equal."""
-        return str(self) == self._convert(other)
+        if isinstance(other, MacAddr):
+            return str.__eq__(self, other)
+        other = MacAddr._canonical(other)
+        return other is not None and str.__eq__(self, other)
 
     def __ne__(self, other):
         """Compare two MAC addresses and return False if both are equal."""
@@ -69,7 +116,7 @@ if __name__ == '__main__':
     mac = MacAddr('E4CE8F589FF4')
     macstr = "%s" % mac
     macrpr = "%r" % mac
-    ntests = 6
+    ntests = 7
 
     tcount = 0
     if mac == 'E4CE8F589FF4':
@@ -85,6 +132,11 @@ if __name__ == '__main__':
     if macrpr == "'e4:ce:8f:58:9f:f4'":
         tcount += 1
 
+    data = 'E4CE8F589FF4'.decode('hex')
+    mac = MacAddr.frombytes(data)
+    if mac == 'E4:CE:8F:58:9F:F4' and mac is MacAddr.frombytes(data):
+        tcount += 1
+
     if tcount == ntests:
         print "All tests passed!"
         exit(0)
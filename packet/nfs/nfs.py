@@ -18,6 +18,7 @@ Process the NFS layer and return the correct NFS object. The function returns
 either a NULL(), CB_NULL, COMPOUND or CB_COMPOUND object.
 """
 import nfstest_config as c
+import packet.utils as utils
 from packet.utils import *
 from packet.nfs.nfsbase import *
 from packet.nfs.nfs3 import NFS3args,NFS3res
@@ -27,7 +28,25 @@ from packet.nfs.nfs4 import COMPOUND4args,COMPOUND4res,CB_COMPOUND4args,CB_COMPO
 __author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
 __copyright__ = "Copyright (C) 2014 NetApp, Inc."
 __license__   = "GPL v2"
-__version__   = "1.2"
+__version__   = "1.3"
+
+def _compound_unpack(rpc, unpack):
+    """Return the unpack object used to decode an NFS COMPOUND, when
+       utils.NFS_lazyops is set and the size of the RPC payload is known,
+       the payload is decoded by a LazyUnpack object so the operations
+       are decoded on first access
+    """
+    if not utils.NFS_lazyops or rpc._pktt.pkt == "gssd":
+        return unpack
+    if rpc._proto == 6:
+        size = rpc.fragment_hdr.data_size
+    elif rpc._proto == 17:
+        size = unpack.size()
+    else:
+        return unpack
+    if size > unpack.size():
+        return unpack
+    return LazyUnpack(unpack.read(size))
 
 def NFS(rpc, callback):
     """Process the NFS layer and return the correct NFS object"""
@@ -48,7 +67,7 @@ def NFS(rpc, callback):
             if callback:
                 ret = CB_COMPOUND4args(unpack)
             else:
-                ret = COMPOUND4args(unpack)
+                ret = COMPOUND4args(_compound_unpack(rpc, unpack))
         else:
             # RPC reply
             minorversion = None
@@ -58,7 +77,7 @@ def NFS(rpc, callback):
             if callback:
                 ret = CB_COMPOUND4res(unpack, minorversion)
             else:
-                ret = COMPOUND4res(unpack, minorversion)
+                ret = COMPOUND4res(_compound_unpack(rpc, unpack), minorversion)
     elif rpc.version == 3:
         if rpc.type == RPC_CALL:
             # RPC call
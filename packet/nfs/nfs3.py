@@ -1444,7 +1444,7 @@ class entry3(BaseObj):
         self.name   = filename3(unpack)
         self.cookie = cookie3(unpack)
 
-class dirlist3(BaseObj):
+class dirlist3(DIRbase):
     """
        struct dirlist3 {
            entry3 *entries;
@@ -1457,7 +1457,7 @@ class dirlist3(BaseObj):
 
     def __init__(self, unpack):
         try:
-            self.entries = unpack.unpack_list(entry3)
+            self.entries = self.lazy_entries(unpack.unpack_list, entry3)
             self.eof     = nfs_bool(unpack)
         except:
             pass
@@ -1556,7 +1556,7 @@ class entryplus3(BaseObj):
         self.attributes = post_op_attr(unpack)
         self.obj        = post_op_fh3(unpack)
 
-class dirlistplus3(BaseObj):
+class dirlistplus3(DIRbase):
     """
        struct dirlistplus3 {
            entryplus3 *entries;
@@ -1569,7 +1569,7 @@ class dirlistplus3(BaseObj):
 
     def __init__(self, unpack):
         try:
-            self.entries = unpack.unpack_list(entryplus3)
+            self.entries = self.lazy_entries(unpack.unpack_list, entryplus3)
             self.eof     = nfs_bool(unpack)
         except:
             pass
@@ -732,6 +732,8 @@ struct entry3 {
         entry3     *nextentry;
 };
 
+/* INHERIT: DIRbase */
+/* FWRAP: entries=DIRbase.lazy_entries */
 /* TRY: 1 */
 /* STRFMT1: eof:{1} */
 struct dirlist3 {
@@ -780,6 +782,8 @@ struct entryplus3 {
         entryplus3   *nextentry;
 };
 
+/* INHERIT: DIRbase */
+/* FWRAP: entries=DIRbase.lazy_entries */
 /* TRY: 1 */
 /* STRFMT1: eof:{1} */
 struct dirlistplus3 {
@@ -2810,7 +2810,7 @@ class entry4(BaseObj):
         self.name   = component4(unpack)
         self.attrs  = fattr4(unpack)
 
-class dirlist4(BaseObj):
+class dirlist4(DIRbase):
     """
        struct dirlist4 {
            entry4 *entries;
@@ -2823,7 +2823,7 @@ class dirlist4(BaseObj):
 
     def __init__(self, unpack):
         try:
-            self.entries = unpack.unpack_list(entry4)
+            self.entries = self.lazy_entries(unpack.unpack_list, entry4)
             self.eof     = nfs_bool(unpack)
         except:
             pass
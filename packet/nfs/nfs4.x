@@ -2131,6 +2131,8 @@ struct entry4 {
     entry4          *nextentry;
 };
 
+/* INHERIT: DIRbase */
+/* FWRAP: entries=DIRbase.lazy_entries */
 /* TRY: 1 */
 /* STRFMT1: eof:{1} */
 struct dirlist4 {
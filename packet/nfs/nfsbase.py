@@ -16,16 +16,18 @@ NFS Base module
 
 Base class for an NFS object
 """
+import traceback
 import nfstest_config as c
 from baseobj import BaseObj
 import packet.utils as utils
+from packet.unpack import Unpack
 import packet.nfs.nfs4_const as const4
 
 # Module constants
 __author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
 __copyright__ = "Copyright (C) 2014 NetApp, Inc."
 __license__   = "GPL v2"
-__version__   = "1.3"
+__version__   = "1.4"
 
 # NFSv4 operation priority for displaying purposes
 NFSpriority = {
@@ -122,11 +124,69 @@ CBpriority = {
     const4.OP_CB_ILLEGAL              : 0,
 }
 
+class LazyArray(object):
+    """Array of operations not yet decoded, the unpack object and the
+       arguments given to unpack_array() are saved to decode the array
+       on first access
+    """
+    __slots__ = ("unpack", "kwts", "kwds")
+
+    def __init__(self, unpack, kwts, kwds):
+        self.unpack = unpack
+        self.kwts   = kwts
+        self.kwds   = kwds
+
+class LazyUnpack(Unpack):
+    """Unpack object for a COMPOUND where the array of operations is
+       decoded on first access, see NFSbase.array
+    """
+    def unpack_array(self, *kwts, **kwds):
+        """Return a LazyArray instead of decoding the array, the array
+           is decoded by a regular Unpack object so any arrays within
+           the operations are decoded normally
+        """
+        return LazyArray(Unpack(self.getbytes()), kwts, kwds)
+
 class NFSbase(utils.RPCload):
     """NFS Base object
 
        This should only be used as a base class for an NFS object
     """
+    # The array of operations could not be decoded on first access
+    undecoded = False
+
+    def _get_array(self):
+        """Return the array of operations, decoding it if it has not
+           been decoded yet
+        """
+        if "array" not in self.__dict__:
+            # Not a COMPOUND object, let __getattr__() handle it
+            raise AttributeError("array")
+        array = self.__dict__["array"]
+        if isinstance(array, LazyArray):
+            # Decode the operations with the decoding state
+            # reset just like at the start of the COMPOUND
+            self.set_global("nfs4_fh", None)
+            self.set_global("nfs4_sfh", None)
+            self.set_global("nfs4_layouttype", None)
+            try:
+                array = Unpack.unpack_array(array.unpack, *array.kwts, **array.kwds)
+            except Exception:
+                # Mark the object so an empty array is not taken as
+                # a COMPOUND without any operations
+                self.dprint('PKT3', traceback.format_exc())
+                self.undecoded = True
+                array = []
+            self.__dict__["array"] = array
+        return array
+
+    def _set_array(self, array):
+        """Set the array of operations"""
+        self.__dict__["array"] = array
+
+    # Array of operations in a COMPOUND
+    array = property(_get_array, _set_array)
+
     def __str__(self):
         """Informal string representation of object"""
         rpc = self._rpc
@@ -70,6 +70,7 @@ class Pkt(BaseObj):
     """
     # Class attributes
     _attrlist = tuple(PKT_layers)
+    _stats = None # Decode statistics object (packet.pktstats.PktStats)
 
     # Do not use BaseObj constructor to have a little bit of
     # performance improvement
@@ -164,6 +165,8 @@ class Pkt(BaseObj):
         layer._pkt = self
         setattr(self, name, layer)
         self._layers.append(name)
+        if self._stats is not None:
+            self._stats.add_layer(name)
 
     def get_layers(self):
         """Return the list of layers currently in the packet"""
@@ -0,0 +1,193 @@
+#===============================================================================
+# Copyright 2026 NetApp, Inc. All Rights Reserved,
+# contribution by Jorge Mora <mora@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#===============================================================================
+"""
+Packet statistics module
+
+Provides the object to collect decode statistics for a packet trace: number
+of packets and bytes decoded by each layer, time spent decoding each layer,
+number of NFS operations, high-water marks of the reassembly buffers and
+the RPC xid map, and the time spent matching each expression.
+
+The time for each layer is measured between consecutive layers being added
+to the packet, so the time for a layer includes the time to decode its own
+header plus any reassembly done before the layer is added to the packet.
+The time for the "record" layer includes reading the packet from the file.
+"""
+import time
+import nfstest_config as c
+from baseobj import BaseObj
+
+# Module constants
+__author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
+__copyright__ = "Copyright (C) 2026 NetApp, Inc."
+__license__   = "GPL v2"
+__version__   = "1.0"
+
+class PktStats(BaseObj):
+    """Packet statistics object
+
+       Usage:
+           from packet.pktt import Pktt
+
+           # Collect statistics and display report when closing the trace
+           x = Pktt("/traces/tracefile.cap", stats=True)
+           for pkt in x:
+               pass
+           x.close()
+
+           # Get the report as a string
+           print x.stats.report()
+    """
+    def __init__(self):
+        """Constructor
+
+           Initialize object's private data.
+        """
+        self.npackets   = 0   # Number of packets decoded
+        self.nbytes     = 0   # Number of bytes decoded
+        self.layers     = {}  # Layer statistics: [packets, bytes, time]
+        self.nfsops     = {}  # Number of NFS operations by name
+        self.matches    = {}  # Match statistics: [calls, matched, packets, time, evaltime]
+        self.tcpstreams = 0   # High-water mark of number of TCP streams
+        self.tcpbuffer  = 0   # High-water mark of TCP reassembly buffer
+        self.ipv4frags  = 0   # High-water mark of IPv4 fragments
+        self.rdmainfo   = 0   # High-water mark of RDMA reassembly entries
+        self.xidmap     = 0   # High-water mark of RPC xid map
+        self.starttime  = time.time()
+        self._ltime = 0.0     # Time when last layer was added to packet
+        self._lname = None    # Name of last layer added to packet
+
+    def start(self):
+        """Start decoding a new packet"""
+        self._ltime = time.time()
+        self._lname = "record"
+
+    def add_layer(self, name):
+        """Layer was added to the packet being decoded"""
+        ltime = time.time()
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = [0, 0, 0.0]
+            self.layers[name] = layer
+        layer[2] += ltime - self._ltime
+        self._ltime = ltime
+        self._lname = name
+
+    def add_packet(self, pktt):
+        """Packet has been decoded"""
+        ltime = time.time()
+        pkt = pktt.pkt
+        size = pkt.record.length_inc
+        self.npackets += 1
+        self.nbytes   += size
+
+        # Time after the last layer was added is part of the last layer
+        layer = self.layers.get(self._lname)
+        if layer is None:
+            layer = [0, 0, 0.0]
+            self.layers[self._lname] = layer
+        layer[2] += ltime - self._ltime
+
+        for name in pkt._layers:
+            layer = self.layers.get(name)
+            if layer is not None:
+                layer[0] += 1
+                layer[1] += size
+
+        nfs = getattr(pkt, "nfs", None)
+        if nfs is not None:
+            # Count NFS operations
+            rpc = pkt.rpc
+            if hasattr(nfs, "array"):
+                oplist = ["NFSv%d %s" % (rpc.version, str(x.op)[3:]) for x in nfs.array]
+            elif hasattr(nfs, "procedure"):
+                oplist = ["NFSv%d %s" % (rpc.version, str(nfs.procedure).split("_", 1)[-1])]
+            else:
+                oplist = ["NFSv%d %s" % (rpc.version, nfs.__class__.__name__)]
+            for op in oplist:
+                self.nfsops[op] = self.nfsops.get(op, 0) + 1
+
+        # High-water marks
+        self.xidmap     = max(self.xidmap, len(pktt._rpc_xid_map))
+        self.tcpstreams = max(self.tcpstreams, len(pktt._tcp_stream_map))
+        self.ipv4frags  = max(self.ipv4frags, len(pktt._ipv4_fragments))
+        self.rdmainfo   = max(self.rdmainfo, len(pktt._rdma_info))
+        tcp = getattr(pkt, "tcp", None)
+        if tcp is not None:
+            ip = pkt.ip
+            streamid = "%s:%d-%s:%d" % (ip.src, tcp.src_port, ip.dst, tcp.dst_port)
+            stream = pktt._tcp_stream_map.get(streamid)
+            if stream is not None:
+                self.tcpbuffer = max(self.tcpbuffer, len(stream.buffer))
+
+    def add_match(self, expr, pkt, npackets, mtime, evaltime):
+        """Match has been evaluated
+
+           expr:
+               Match expression
+           pkt:
+               Packet matched or None
+           npackets:
+               Number of packets searched
+           mtime:
+               Total time spent in match
+           evaltime:
+               Time spent evaluating the expression
+        """
+        item = self.matches.get(expr)
+        if item is None:
+            item = [0, 0, 0, 0.0, 0.0]
+            self.matches[expr] = item
+        item[0] += 1
+        item[1] += 0 if pkt is None else 1
+        item[2] += npackets
+        item[3] += mtime
+        item[4] += evaltime
+
+    def report(self):
+        """Return the statistics report as a string"""
+        etime = time.time() - self.starttime
+        ltime = sum(x[2] for x in self.layers.values())
+        out  = "Decode statistics:\n"
+        out += "    Packets: %d, bytes: %d, elapsed time: %.3f secs, decode time: %.3f secs\n" % (self.npackets, self.nbytes, etime, ltime)
+        if ltime > 0:
+            out += "    Packets/sec: %.0f, bytes/sec: %.0f\n" % (self.npackets/ltime, self.nbytes/ltime)
+
+        out += "  Layers:\n"
+        out += "    %-12s %10s %14s %10s %8s %10s\n" % ("layer", "packets", "bytes", "secs", "%time", "usecs/pkt")
+        for name, item in sorted(self.layers.items(), key=lambda x: -x[1][2]):
+            npkts, nbytes, secs = item
+            pct = 100.0*secs/ltime if ltime > 0 else 0.0
+            upkt = 1000000.0*secs/npkts if npkts > 0 else 0.0
+            out += "    %-12s %10d %14d %10.3f %8.2f %10.2f\n" % (name.upper(), npkts, nbytes, secs, pct, upkt)
+
+        if self.nfsops:
+            out += "  NFS operations:\n"
+            for name, count in sorted(self.nfsops.items(), key=lambda x: -x[1]):
+                out += "    %-30s %10d\n" % (name, count)
+
+        out += "  High-water marks:\n"
+        out += "    TCP streams:            %d\n" % self.tcpstreams
+        out += "    TCP reassembly buffer:  %d bytes\n" % self.tcpbuffer
+        out += "    IPv4 fragments:         %d\n" % self.ipv4frags
+        out += "    RDMA reassembly:        %d\n" % self.rdmainfo
+        out += "    RPC xid map:            %d\n" % self.xidmap
+
+        if self.matches:
+            out += "  Matches:\n"
+            for expr, item in sorted(self.matches.items(), key=lambda x: -x[1][3]):
+                calls, matched, npkts, mtime, evaltime = item
+                out += "    %s\n" % expr
+                out += "        calls: %d, matched: %d, packets: %d, secs: %.3f, eval secs: %.3f\n" % (calls, matched, npkts, mtime, evaltime)
+        return out
@@ -55,8 +55,10 @@ from baseobj import BaseObj
 from packet.link.erf import ERF
 from packet.unpack import Unpack
 from packet.record import Record
+from packet.pktstats import PktStats
 from packet.pkt import Pkt, PKT_layers
 from packet.transport.ib import RDMAinfo
+from packet.internet.ipv4 import Fragments
 from packet.link.ethernet import ETHERNET
 
 # Module constants
@@ -111,7 +113,7 @@ class Pktt(BaseObj):
            for pkt in x:
                print pkt
     """
-    def __init__(self, tfile, live=False, state=True):
+    def __init__(self, tfile, live=False, state=True, stats=False):
         """Constructor
 
            Initialize object's private data, note that this will not check the
@@ -130,6 +132,10 @@ class Pktt(BaseObj):
                case when <EOF> is encountered the next trace file created by
                tcpdump will be opened and the object will be re-initialized,
                all private data referencing the previous file is lost.
+           stats:
+               Collect decode statistics, the statistics are available in
+               the object attribute stats and the report is displayed on
+               standard error when the object is closed [default: False]
         """
         self.tfile   = tfile  # Current trace file name
         self.bfile   = tfile  # Base trace file name
@@ -161,6 +167,8 @@ class Pktt(BaseObj):
         self.showprog  = 0    # If this is true the progress will be displayed
         self.progdone  = 0    # Display last progress only once
         self.maxindex  = None # Global maxindex default
+        self.stats     = PktStats() if stats else None # Decode statistics
+        self.statsout  = stats # Display statistics report on close()
         self.timestart = time.time() # Time reference base
         self.reply_matched = False   # Matching a reply
         self._cleanup_done = False   # Cleanup of attributes has been done
@@ -171,7 +179,7 @@ class Pktt(BaseObj):
         self._tcp_stream_map = {}
 
         # IPv4 fragments used in reassembly
-        self._ipv4_fragments = {}
+        self._ipv4_fragments = Fragments()
 
         # RDMA reassembly object
         self._rdma_info = RDMAinfo()
@@ -191,7 +199,10 @@ class Pktt(BaseObj):
             else:
                 # Create all packet trace objects
                 for tfile in self.tfiles:
-                    self.pktt_list.append(Pktt(tfile))
+                    pktt = Pktt(tfile)
+                    # All packet trace objects share the same statistics
+                    pktt.stats = self.stats
+                    self.pktt_list.append(pktt)
 
     def close(self):
         """Gracefully close the tcpdump trace file and cleanup attributes."""
@@ -201,6 +212,11 @@ class Pktt(BaseObj):
         # Cleanup is done just once
         self._cleanup_done = True
 
+        if self.statsout and self.stats is not None:
+            # Display statistics report after any buffered output
+            sys.stdout.flush()
+            sys.stderr.write(self.stats.report())
+
         if self.fh:
             # Close packet trace
             self.fh.close()
@@ -420,6 +436,10 @@ class Pktt(BaseObj):
         # Save file offset for this packet
         self.boffset = self.offset
 
+        stats = self.stats
+        if stats is not None:
+            stats.start()
+
         # Get record header
         data = self._read(16)
         if len(data) < 16:
@@ -439,6 +459,11 @@ class Pktt(BaseObj):
             self.show_progress(True)
             raise StopIteration
 
+        if stats is not None:
+            # Record time includes reading the packet
+            self.pkt._stats = stats
+            stats.add_layer("record")
+
         if self.header.link_type == 1:
             # Decode ethernet layer
             ETHERNET(self)
@@ -449,6 +474,10 @@ class Pktt(BaseObj):
             # Unknown link layer
             record.data = self.unpack.getbytes()
 
+        if stats is not None:
+            del self.pkt._stats
+            stats.add_packet(self)
+
         self.show_progress()
 
         # Increment packet index
@@ -495,6 +524,7 @@ class Pktt(BaseObj):
                 self._tcp_stream_map = {}
                 self._rpc_xid_map    = {}
                 self._rdma_info = RDMAinfo()
+                self._ipv4_fragments.reset()
 
             # Move to the packet before the specified by the index so the
             # next packet fetched will be the one given by index
@@ -610,6 +640,9 @@ class Pktt(BaseObj):
             if self.live and ldata != count:
                 # Not all data was read (<EOF>)
                 tracefile = "%s%d" % (self.bfile, self.findex+1)
+                if not os.path.isfile(tracefile) and os.path.isfile(tracefile + ".gz"):
+                    # Next trace file has already been compressed
+                    tracefile += ".gz"
                 # Check if next trace file exists
                 if os.path.isfile(tracefile):
                     # Save information that keeps track of the next trace file
@@ -998,6 +1031,12 @@ class Pktt(BaseObj):
            See also:
                match_ethernet(), match_ip(), match_tcp(), match_rpc(), match_nfs()
         """
+        stats = self.stats
+        if stats is not None:
+            mtime = time.time()
+            evaltime = 0.0
+            npackets = 0
+
         # Parse match expression
         st = parser.expr(expr)
         smap = parser.st2list(st)
@@ -1026,12 +1065,18 @@ class Pktt(BaseObj):
                 else:
                     self.pindex = pkt.record.index + 1
                     self.pkt = pkt
+            if stats is not None:
+                npackets += 1
+                etime = time.time()
             try:
                 if reply and pkt == "rpc" and pkt.rpc.type == 1 and pkt.rpc.xid in self._match_xid_list:
                     self.dprint('PKT1', ">>> %d: match() -> True: reply" % pkt.record.index)
                     self._match_xid_list.remove(pkt.rpc.xid)
                     self.reply_matched = True
                     self.dprint('PKT2', "    %s" % pkt)
+                    if stats is not None:
+                        evaltime += time.time() - etime
+                        stats.add_match(expr, pkt, npackets, time.time() - mtime, evaltime)
                     return pkt
                 if eval(pdata):
                     # Return matched packet
@@ -1040,9 +1085,14 @@ class Pktt(BaseObj):
                         # Save xid of matched call
                         self._match_xid_list.append(pkt.rpc.xid)
                     self.dprint('PKT2', "    %s" % pkt)
+                    if stats is not None:
+                        evaltime += time.time() - etime
+                        stats.add_match(expr, pkt, npackets, time.time() - mtime, evaltime)
                     return pkt
             except Exception:
                 pass
+            if stats is not None:
+                evaltime += time.time() - etime
 
         if rewind:
             # No packet matched, re-position the file pointer back to where
@@ -1050,6 +1100,8 @@ class Pktt(BaseObj):
             self.rewind(save_index)
         self.pkt = None
         self.dprint('PKT1', ">>> %d: match() -> False" % self.get_index())
+        if stats is not None:
+            stats.add_match(expr, None, npackets, time.time() - mtime, evaltime)
         return None
 
     def show_progress(self, done=False):
@@ -1099,6 +1151,8 @@ class Pktt(BaseObj):
                 # Add progress percentage and how many bytes have been
                 # processed so far relative to the total number of bytes
                 pbar += "%5.1f%% %9s/%s" % (progress, str_units(self.offset), str_units(self.filesize))
+                # Display any buffered output before the progress bar
+                sys.stdout.flush()
                 if columns < 100:
                     sys.stderr.write("%s %-6s\r" % (pbar, str_time(otime)))
                 else:
@@ -17,6 +17,7 @@ InfiniBand module
 Decode InfiniBand layer.
 Reference: IB Specification Vol 1-Release-1.3-2015-03-03.pdf
 """
+import bisect
 import nfstest_config as c
 from packet.utils import *
 from baseobj import BaseObj
@@ -30,7 +31,10 @@ import packet.application.rpcordma_const as rdma
 __author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
 __copyright__ = "Copyright (C) 2017 NetApp, Inc."
 __license__   = "GPL v2"
-__version__   = "1.1"
+__version__   = "1.2"
+
+# Module variables
+MAX_PREALLOC = 16777216 # Maximum number of bytes to preallocate for a sub-segment
 
 # Operation Code Transport Services (3 most significant bits)
 ib_transport_services = {
@@ -176,8 +180,8 @@ class GRH(BaseObj):
         self.paylen = ulist[1]
         self.nxthdr = ulist[2]
         self.hoplmt = ulist[3]
-        self.sgid   = IPv6Addr(ulist[4].encode('hex'))
-        self.dgid   = IPv6Addr(ulist[5].encode('hex'))
+        self.sgid   = IPv6Addr.frombytes(ulist[4])
+        self.dgid   = IPv6Addr.frombytes(ulist[5])
 
         # Calculate where the Invariant CRC starts
         self._icrc_offset = unpack.tell() + self.paylen - 4
@@ -533,12 +537,20 @@ class RDMAseg(object):
        sequence number in each of the data fragments. Therefore, a range
        of PSN numbers define this object which is given by the spsn and
        epsn attributes (first and last PSN respectively).
+
+       The data is placed directly into a buffer preallocated using the
+       DMA length, every fragment but the last one has the same size so
+       the offset of each fragment in the buffer is given by its PSN.
     """
     def __init__(self, spsn, epsn, dmalen):
         self.spsn     = spsn   # First PSN in sub-segment
         self.epsn     = epsn   # Last PSN in sub-segment
         self.dmalen   = dmalen # DMA length in sub-segment
-        self.fraglist = []     # List of data fragments
+        self.iosize   = 0      # Size of each fragment
+        self.size     = 0      # Number of data bytes in all fragments
+        self.fraglist = []     # List of fragments: (offset, size)
+        self.buffer   = bytearray(min(dmalen, MAX_PREALLOC))
+        self._oflow   = None   # Offset of fragments not placed by PSN
 
     def insert_data(self, psn, data):
         """Insert data at correct position given by the psn"""
@@ -546,39 +558,64 @@ class RDMAseg(object):
         if psn >= self.spsn and psn <= self.epsn:
             # Normalize psn with respect to first PSN
             index = psn - self.spsn
+            size = len(data)
+            if self.iosize == 0:
+                # Use size of first fragment received
+                self.iosize = size
             fraglist = self.fraglist
             nlen = len(fraglist)
             if index < nlen:
                 # This is an out-of-order fragment,
                 # replace fragment data at index
-                fraglist[index] = data
+                if fraglist[index] is not None:
+                    self.size -= fraglist[index][1]
             else:
-                # Some fragments may be missing
-                for i in xrange(index - nlen):
-                    # Use an empty string for missing fragments
-                    # These may come later as out-of-order fragments
-                    fraglist.append("")
-                fraglist.append(data)
+                # Some fragments may be missing, these may come
+                # later as out-of-order fragments
+                fraglist.extend([None] * (index + 1 - nlen))
+
+            buffer = self.buffer
+            offset = index * self.iosize
+            end = offset + size
+            if size > self.iosize or (self._oflow is not None and end > self._oflow):
+                # Fragment does not fit in its slot, place it after
+                # all the slots in the sub-segment and any other data
+                offset = max(len(buffer), (self.epsn - self.spsn + 1) * self.iosize)
+                end = offset + size
+                if self._oflow is None:
+                    self._oflow = offset
+            if end > len(buffer):
+                buffer.extend(bytearray(end - len(buffer)))
+            buffer[offset:end] = data
+            fraglist[index] = (offset, size)
+            self.size += size
             return True
         return False
 
     def get_data(self, padding=True):
         """Return sub-segment data"""
-        data = ""
+        # Find out if all fragments are contiguous in the buffer
+        size = 0
+        for frag in self.fraglist:
+            if frag is not None:
+                if frag[0] != size:
+                    break
+                size += frag[1]
+        else:
+            if not padding and size > self.dmalen:
+                size = self.dmalen
+            return memoryview(self.buffer)[:size].tobytes()
+
         # Get data from all fragments
-        for fragdata in self.fraglist:
-            data += fragdata
+        buffer = memoryview(self.buffer)
+        data = "".join([buffer[x[0]:x[0]+x[1]].tobytes() for x in self.fraglist if x])
         if not padding and len(data) > self.dmalen:
-            return data[:self.dmalen-len(data)]
+            return data[:self.dmalen]
         return data
 
     def get_size(self):
         """Return sub-segment data size"""
-        size = 0
-        # Get the size from all fragments
-        for fragdata in self.fraglist:
-            size += len(fragdata)
-        return size
+        return self.size
 
 class RDMAsegment(object):
     """RDMA segment object
@@ -600,24 +637,25 @@ class RDMAsegment(object):
         # specifies the same RKey(or handle) for all sub-segments and the
         # DMA length for the sub-segment.
         self.seglist = []
+        # Sub-segments indexed by their first PSN
+        self._segmap = {}
 
     def valid_psn(self, psn):
         """True if given psn is valid for this segment"""
+        return self.get_sub_segment(psn) is not None
+
+    def get_sub_segment(self, psn):
+        """Return the sub-segment for the given psn"""
         # Search all sub-segments
         for seg in self.seglist:
             if psn >= seg.spsn and psn <= seg.epsn:
                 # Correct sub-segment found
-                return True
-        return False
+                return seg
 
     def add_sub_segment(self, psn, dmalen, only=False, iosize=0):
         """Add RDMA sub-segment PSN information"""
-        seg = None
         # Find if sub-segment already exists
-        for item in self.seglist:
-            if psn == item.spsn:
-                seg = item
-                break
+        seg = self._segmap.get(psn)
         if seg:
             # Sub-segment already exists, just update epsn
             if only:
@@ -644,32 +682,25 @@ class RDMAsegment(object):
                     epsn = psn + dmalen/iosize - 1 + (1 if dmalen%iosize else 0)
             seg = RDMAseg(psn, epsn, dmalen)
             self.seglist.append(seg)
+            self._segmap[psn] = seg
         return seg
 
     def add_data(self, psn, data):
         """Add fragment data"""
         # Search for correct sub-segment
-        for seg in self.seglist:
-            if seg.insert_data(psn, data):
-                # The insert_data method returns True on correct
-                # sub-segment for given psn
-                return
+        seg = self.get_sub_segment(psn)
+        if seg:
+            seg.insert_data(psn, data)
 
     def get_data(self, padding=True):
         """Return segment data"""
-        data = ""
         # Get data from all sub-segments
-        for seg in self.seglist:
-            data += seg.get_data(padding)
-        return data
+        return "".join([x.get_data(padding) for x in self.seglist])
 
     def get_size(self):
-        """Return segment data"""
-        size = 0
+        """Return segment data size"""
         # Get the size from all sub-segments
-        for seg in self.seglist:
-            size += seg.get_size()
-        return size
+        return sum([x.size for x in self.seglist])
 
 class RDMAinfo(RDMAbase):
     """RDMA info object used for reassembly
@@ -692,6 +723,10 @@ class RDMAinfo(RDMAbase):
     def __init__(self):
         # RDMA Reads/Writes/Reply segments {key: handle, value: RDMAsegment}
         self._rdma_segments = {}
+        # Index of all sub-segments sorted by their first PSN, the list
+        # of first PSNs and the list of (RDMAseg, RDMAsegment) items
+        self._psnlist = []
+        self._psnsegs = []
 
     def size(self):
         """Return the number RDMA segments"""
@@ -701,8 +736,36 @@ class RDMAinfo(RDMAbase):
     def reset(self):
         """Clear RDMA segments"""
         self._rdma_segments = {}
+        self._psnlist = []
+        self._psnsegs = []
     __del__ = reset
 
+    def _add_sub_segment(self, rsegment, psn, dmalen, only=False, iosize=0):
+        """Add RDMA sub-segment PSN information to the given segment
+           and add the sub-segment to the PSN index if it is new
+        """
+        nlen = len(rsegment.seglist)
+        seg = rsegment.add_sub_segment(psn, dmalen, only=only, iosize=iosize)
+        if len(rsegment.seglist) > nlen:
+            index = bisect.bisect_right(self._psnlist, psn)
+            self._psnlist.insert(index, psn)
+            self._psnsegs.insert(index, (seg, rsegment))
+        return seg
+
+    def _find_segment(self, psn):
+        """Return the segment for the given psn"""
+        # Get the sub-segment with the largest first PSN which is not
+        # greater than the given PSN
+        index = bisect.bisect_right(self._psnlist, psn) - 1
+        if index >= 0:
+            seg, rsegment = self._psnsegs[index]
+            if psn <= seg.epsn:
+                return rsegment
+            # Sub-segments could overlap, search the rest of them
+            for seg, rsegment in reversed(self._psnsegs[:index]):
+                if psn >= seg.spsn and psn <= seg.epsn:
+                    return rsegment
+
     def get_rdma_segment(self, handle):
         """Return RDMA segment identified by the given handle"""
         return self._rdma_segments.get(handle)
@@ -729,26 +792,26 @@ class RDMAinfo(RDMAbase):
             rsegment = self.get_rdma_segment(reth.r_key)
             if rsegment:
                 size = len(unpack)
-                seg = rsegment.add_sub_segment(psn, reth.dma_len, only=only, iosize=size)
+                seg = self._add_sub_segment(rsegment, psn, reth.dma_len, only=only, iosize=size)
                 if size > 0:
                     seg.insert_data(psn, unpack.read(size))
             return rsegment
         else:
             # The RETH object header is not given, find the correct segment
             # where this fragment should be inserted
-            for rsegment in self._rdma_segments.itervalues():
-                if rsegment.valid_psn(psn):
-                    size = len(unpack)
-                    if read:
-                        # Modify sub-segment for RDMA read (first or only)
-                        # The sub-segment is added in the read request where
-                        # RETH is given but the request does not have any
-                        # data to correctly calculate the epsn
-                        seg = rsegment.add_sub_segment(psn, 0, only=only, iosize=size)
-                        seg.insert_data(psn, unpack.read(size))
-                    else:
-                        rsegment.add_data(psn, unpack.read(size))
-                    return rsegment
+            rsegment = self._find_segment(psn)
+            if rsegment:
+                size = len(unpack)
+                if read:
+                    # Modify sub-segment for RDMA read (first or only)
+                    # The sub-segment is added in the read request where
+                    # RETH is given but the request does not have any
+                    # data to correctly calculate the epsn
+                    seg = self._add_sub_segment(rsegment, psn, 0, only=only, iosize=size)
+                    seg.insert_data(psn, unpack.read(size))
+                else:
+                    rsegment.add_data(psn, unpack.read(size))
+                return rsegment
 
     def reassemble_rdma_reads(self, psn, unpack):
         """Reassemble RDMA read chunks
@@ -795,27 +858,30 @@ class RDMAinfo(RDMAbase):
                 slist = read_chunks.setdefault(rsegment.xdrpos, [])
                 slist.append(rsegment)
 
-            data = ""
+            data = []
+            dlen = 0    # Length of reassembled message
             offset = 0  # Current offset of reduced message
             # Reassemble the whole message
             for xdrpos in sorted(read_chunks.keys()):
                 # Check if there is data from the reduced message which
                 # should be inserted before this chunk
-                if xdrpos > len(data):
+                if xdrpos > dlen:
                     # Insert data from the reduced message
-                    size = xdrpos - len(data)
-                    data += reduced_data[offset:size]
+                    size = xdrpos - dlen
+                    data.append(reduced_data[offset:size])
+                    dlen += len(data[-1])
                     offset = size
                 # Add all data from chunk
                 for rsegment in read_chunks[xdrpos]:
                     # Get the bytes for the segment including the padding
                     # bytes because this is part of the message that will
                     # be dissected and the opaque needs a 4-byte boundary
-                    data += rsegment.get_data(padding=True)
+                    data.append(rsegment.get_data(padding=True))
+                    dlen += len(data[-1])
             if len(reduced_data) > offset:
                 # Add last fragment from the reduced message
-                data += reduced_data[offset:]
-            return data
+                data.append(reduced_data[offset:])
+            return "".join(data)
 
     def process_rdma_segments(self, rpcrdma):
         """Process the RPC-over-RDMA chunks
@@ -939,7 +1005,7 @@ class RDMAinfo(RDMAbase):
         #   +--------------------------+------------------+--------------------------+
         #   Each RDMA write could be a single RDMA_WRITE_Only or a series of
         #   RDMA_WRITE_First, RDMA_WRITE_Middle, ..., RDMA_WRITE_Last
-        replydata = ""
+        replydata = []
         if rpcrdma.reply:
             # Process all segments in the RDMA reply chunk
             for rdma_seg in rpcrdma.reply.target:
@@ -948,8 +1014,8 @@ class RDMAinfo(RDMAbase):
                     # Get the bytes for the segment including the padding
                     # bytes because this is part of the message that will
                     # be dissected and the opaque needs a 4-byte boundary
-                    replydata += rsegment.get_data(padding=True)
-        return replydata
+                    replydata.append(rsegment.get_data(padding=True))
+        return "".join(replydata)
 
 class IB(BaseObj):
     """InfiniBand (IB) object
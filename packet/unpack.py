@@ -23,7 +23,7 @@ import nfstest_config as c
 __author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
 __copyright__ = "Copyright (C) 2012 NetApp, Inc."
 __license__   = "GPL v2"
-__version__   = "2.4"
+__version__   = "2.5"
 
 # Module variables
 UNPACK_ERROR = False  # Raise unpack error when True
@@ -127,6 +127,11 @@ class Unpack(object):
            # a short integer and each string is padded to a 4 byte boundary
            alist = x.unpack_list(Unpack.unpack_string, uargs={'ltype':Unpack.unpack_short, 'pad':4})
 
+           # Get a list of objects decoded by item_obj on first access,
+           # the function skip_obj must consume the bytes of a single item
+           # without decoding it so the length of the list is known
+           alist = x.unpack_lazylist(item_obj, skip_obj)
+
            # Unpack a conditional, it unpacks a conditional flag first and
            # if it is true it unpacks the item given and returns it. If the
            # conditional flag decoded is false, the method returns None
@@ -355,6 +360,47 @@ class Unpack(object):
         kwds['islist'] = True
         return self.unpack_array(*kwts, **kwds)
 
+    def unpack_lazylist(self, unpack_item, skip_item, ltype=unpack_uint, uargs={}):
+        """Get an indeterminate size list where the items are decoded
+           on first access, see LazyList. The items are skipped so the
+           offset pointer is moved past the end of the list
+
+           unpack_item:
+               Unpack function for each item in the list
+           skip_item:
+               Function to skip each item in the list, the function must
+               have the unpack object as the only argument and it must
+               fail if the item is not complete
+           ltype:
+               Function to decode the next item flag [default: unpack_uint]
+           uargs:
+               Named arguments to pass to unpack_item function [default: {}]
+        """
+        count = 0
+        offset = self._offset
+        slen = self._get_ltype(ltype)
+        while slen > 0:
+            ioffset = self._offset
+            try:
+                try:
+                    # Skip each item in the list
+                    skip_item(self)
+                except:
+                    # The item is not complete, decode it instead so a
+                    # partial item is kept just like unpack_list() does
+                    self._offset = ioffset
+                    unpack_item(self, **uargs)
+                count += 1
+                slen = self._get_ltype(ltype)
+            except:
+                if UNPACK_ERROR:
+                    raise
+                break
+        unpack = Unpack(self._data[offset:self._offset])
+        # Skip first next item flag
+        unpack._get_ltype(ltype)
+        return LazyList(unpack, count, unpack_item, ltype, uargs)
+
     def unpack_conditional(self, unpack_item=unpack_uint, ltype=unpack_uint, uargs={}):
         """Get an item if condition flag given by ltype is true, if condition
            flag is false then return None
@@ -384,3 +430,133 @@ class Unpack(object):
             bitmask += bint << nshift
             nshift += 32
         return bitmask
+
+class LazyList(list):
+    """List of items decoded on first access
+
+       The list is created with the number of items already known, so the
+       length of the list is available without decoding any items. Items
+       are decoded in order up to the item being accessed and then they
+       are kept in the list. Any other list operation decodes the rest of
+       the items first.
+
+       Usage:
+           from packet.unpack import Unpack
+
+           x = Unpack(buffer)
+
+           # Get a list of objects decoded on first access
+           alist = x.unpack_lazylist(item_obj, skip_obj)
+
+           # Get the number of items, no item is decoded
+           count = len(alist)
+
+           # Decode the first three items
+           item = alist[2]
+
+           # Decode items as the list is traversed
+           for item in alist:
+               pass
+    """
+    __slots__ = ("_unpack", "_count", "_item", "_ltype", "_uargs")
+
+    def __init__(self, unpack, count, unpack_item, ltype=Unpack.unpack_uint, uargs={}):
+        """Constructor
+
+           Initialize object's private data.
+
+           unpack:
+               Unpack object positioned at the first item of the list
+           count:
+               Number of items in the list
+           unpack_item:
+               Unpack function for each item in the list
+           ltype:
+               Function to decode the next item flag [default: unpack_uint]
+           uargs:
+               Named arguments to pass to unpack_item function [default: {}]
+        """
+        list.__init__(self)
+        self._unpack = unpack
+        self._count  = count
+        self._item   = unpack_item
+        self._ltype  = ltype
+        self._uargs  = uargs
+
+    def _decode(self, index=None):
+        """Decode items up to the given index [default: all items]"""
+        unpack = self._unpack
+        if unpack is None:
+            return
+        if index is None or index >= self._count:
+            index = self._count - 1
+        while list.__len__(self) <= index:
+            try:
+                list.append(self, self._item(unpack, **self._uargs))
+                unpack._get_ltype(self._ltype)
+            except:
+                # Not able to decode the item, truncate the list
+                self._count = list.__len__(self)
+                if UNPACK_ERROR:
+                    raise
+                break
+        if list.__len__(self) >= self._count:
+            # All items have been decoded
+            self._unpack = None
+
+    def __len__(self):
+        if self._unpack is None:
+            return list.__len__(self)
+        return self._count
+
+    def __nonzero__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, long)) and index >= 0:
+            self._decode(index)
+        else:
+            self._decode()
+        return list.__getitem__(self, index)
+
+    def __getslice__(self, i, j):
+        self._decode()
+        return list.__getslice__(self, i, j)
+
+    def __iter__(self):
+        index = 0
+        while index < len(self):
+            self._decode(index)
+            if index >= list.__len__(self):
+                break
+            yield list.__getitem__(self, index)
+            index += 1
+
+    def __repr__(self):
+        self._decode()
+        return list.__repr__(self)
+    __str__ = __repr__
+
+    def __reduce_ex__(self, protocol):
+        # Copy or pickle as a regular list
+        return (list, (list(self),))
+
+def _decode_all(name):
+    """Return list method name which decodes all the items first"""
+    method = getattr(list, name)
+    def wrapper(self, *kwts, **kwds):
+        self._decode()
+        return method(self, *kwts, **kwds)
+    wrapper.__name__ = name
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+# Any other list operation needs all the items decoded
+for _name in ("__contains__", "__eq__", "__ne__", "__lt__", "__le__",
+              "__gt__", "__ge__", "__add__", "__iadd__", "__mul__",
+              "__imul__", "__reversed__", "__setitem__", "__delitem__",
+              "__setslice__", "__delslice__", "append",
+              "extend", "insert", "pop", "remove", "index", "count",
+              "reverse", "sort"):
+    setattr(LazyList, _name, _decode_all(_name))
+del _name
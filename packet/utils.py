@@ -22,6 +22,7 @@ class to be used as a base class for an RPC payload object.
 This module also includes some module variables to change how certain
 objects are displayed.
 """
+import binascii
 import nfstest_config as c
 from packet.unpack import Unpack
 from baseobj import BaseObj, fstrobj
@@ -47,6 +48,10 @@ RPC_xid  = True  # Display RPC xid
 NFS_mainop = False # Display only the main operation in an NFS COMPOUND
 LOAD_body  = True  # Display the body of layer/procedure/operation
 
+# Module variables that change the way an RPC payload is decoded
+NFS_lazyops  = False # Decode the operations in an NFS COMPOUND on first access
+NFS_lazydirs = False # Decode the entries in a directory listing on first access
+
 # Module variables for Enum
 ENUM_CHECK = False  # If True, Enums are strictly enforced
 ENUM_REPR  = False  # If True, Enums are displayed as numbers
@@ -54,6 +59,15 @@ ENUM_REPR  = False  # If True, Enums are displayed as numbers
 # Module variables for Bitmaps
 BMAP_CHECK = False  # If True, bitmaps are strictly enforced
 
+# Cache of shared Enum and OptionFlags objects, key is the class and
+# the value is a dictionary of objects keyed by their value
+_enum_cache  = {}
+_flags_cache = {}
+
+# Cache of bitmap decoding plans, see bitmap_info()
+BITMAP_CACHE_SIZE = 4096
+_bitmap_plans = {}
+
 class ByteHex(int):
     """Byte integer object which is displayed in hex"""
     def __str__(self):
@@ -85,10 +99,31 @@ class DateStr(float):
         return repr(fstrobj.format(self._strfmt, self))
 
 class StrHex(str):
-    """String object which is displayed in hex"""
+    """String object which is displayed in hex
+
+       This object is used for file handles and state ids among others,
+       which are displayed and matched using their CRC32 or CRC16 digests
+       so the digests are computed only once for each object.
+    """
     def __str__(self):
         return "0x" + self.encode("hex")
 
+    def crc32(self):
+        """Return the CRC32 digest of the string"""
+        try:
+            return self._crc32
+        except AttributeError:
+            self._crc32 = binascii.crc32(self) & 0xffffffff
+            return self._crc32
+
+    def crc16(self):
+        """Return the CRC16 digest of the string"""
+        try:
+            return self._crc16
+        except AttributeError:
+            self._crc16 = binascii.crc_hqx(self, 0xa5a5) & 0xffff
+            return self._crc16
+
 class EnumInval(Exception):
     """Exception for an invalid enum value"""
     pass
@@ -97,6 +132,10 @@ class Enum(int):
     """Enum base object
        This should only be used as a base class where the class attributes
        should be initialized
+
+       Objects are immutable so a single object is created for each valid
+       enum value, the same object is returned every time the value is
+       decoded.
     """
     _offset = 0    # Strip the first bytes from the string name after conversion
     _enumdict = {} # Enum mapping dictionary to convert integer to string name
@@ -109,10 +148,20 @@ class Enum(int):
         else:
             # Unpack integer
             value = unpack.unpack_int()
-        # Instantiate base class (integer class)
-        obj = super(Enum, cls).__new__(cls, value)
-        if ENUM_CHECK and obj._enumdict.get(value) is None:
-            raise EnumInval, "value=%s not in enum '%s'" % (value, obj.__class__.__name__)
+        cache = _enum_cache.get(cls)
+        if cache is None:
+            cache = {}
+            _enum_cache[cls] = cache
+        obj = cache.get(value)
+        if obj is None:
+            # Instantiate base class (integer class)
+            obj = super(Enum, cls).__new__(cls, value)
+            if obj._enumdict.get(value) is None:
+                if ENUM_CHECK:
+                    raise EnumInval, "value=%s not in enum '%s'" % (value, obj.__class__.__name__)
+            else:
+                # Share object only for valid enum values
+                cache[value] = obj
         return obj
 
     def __str__(self):
@@ -158,16 +207,51 @@ def bitmap_info(unpack, bitmap, key_enum=None, func_map=None):
            the "unpack" object as the only argument. If this is None a list
            of bit attributes is returned instead [default: None]
     """
+    # Get decoding plan for this bitmap
+    pkey = (bitmap, key_enum, id(func_map), ENUM_CHECK)
+    item = _bitmap_plans.get(pkey)
+    if item is None or item[0] is not func_map:
+        item = (func_map, _bitmap_plan(bitmap, key_enum, func_map))
+        if len(_bitmap_plans) >= BITMAP_CACHE_SIZE:
+            _bitmap_plans.clear()
+        _bitmap_plans[pkey] = item
+    plan = item[1]
+
+    if not func_map:
+        # Return the list of bit attributes
+        return list(plan)
+
     ret = {}
-    blist = []
+    # Get size of opaque
+    length = unpack.unpack_uint()
+    # Save offset to make sure to consume all bytes
+    offset = unpack.tell()
+
+    for key, func in plan:
+        if func is None:
+            if BMAP_CHECK:
+                raise BitmapInval, "decoding function not found for bit number %d" % key
+            break
+        ret[key] = func(unpack)
+
+    count = length + offset - unpack.tell()
+    if count > 0:
+        # Read rest of data for bitmap
+        pad = (4 - (length % 4)) if (length % 4) else 0
+        unpack.read(count + pad)
+    # Return bitmap info dictionary
+    return ret
+
+def _bitmap_plan(bitmap, key_enum, func_map):
+    """Return the decoding plan for the given bitmap, see bitmap_info().
+       If func_map is given, the plan is a list of (key, func) for every
+       bit set in the bitmap in the order they must be decoded, where the
+       last item is (bitnum, None) if the decoding function for the bit
+       number is not found. Otherwise, the plan is the list of bit
+       attributes.
+    """
+    plan = []
     bitnum = 0
-
-    if func_map:
-        # Get size of opaque
-        length = unpack.unpack_uint()
-        # Save offset to make sure to consume all bytes
-        offset = unpack.tell()
-
     while bitmap > 0:
         # Check if bit is set
         if bitmap & 0x01 == 1:
@@ -175,33 +259,19 @@ def bitmap_info(unpack, bitmap, key_enum=None, func_map=None):
                 # Get decoding function for this bit number
                 func = func_map.get(bitnum)
                 if func is None:
-                    if BMAP_CHECK:
-                        raise BitmapInval, "decoding function not found for bit number %d" % bitnum
-                    else:
-                        break
+                    plan.append((bitnum, None))
+                    break
+                if key_enum:
+                    # Use Enum as the key instead of a plain number
+                    plan.append((key_enum(bitnum), func))
                 else:
-                    if key_enum:
-                        # Use Enum as the key instead of a plain number
-                        ret[key_enum(bitnum)] = func(unpack)
-                    else:
-                        ret[bitnum] = func(unpack)
+                    plan.append((bitnum, func))
             else:
                 # Add attribute to list
-                blist.append(key_enum(bitnum))
+                plan.append(key_enum(bitnum))
         bitmap = bitmap >> 1
         bitnum += 1
-
-    if func_map:
-        count = length + offset - unpack.tell()
-        if count > 0:
-            # Read rest of data for bitmap
-            pad = (4 - (length % 4)) if (length % 4) else 0
-            unpack.read(count + pad)
-        # Return bitmap info dictionary
-        return ret
-    else:
-        # Return the list of bit attributes
-        return blist
+    return plan
 
 class OptionFlags(BaseObj):
     """OptionFlags base object
@@ -231,6 +301,10 @@ class OptionFlags(BaseObj):
                x.bit1     = 1,
                x.bit2     = 0,
                x.bit3     = 1,
+
+       Objects should be treated as immutable since a single object is
+       created for each different value of raw flags, the same object
+       is returned every time the same raw flags are given.
     """
     _strfmt1  = "{0}"
     _strfmt2  = "{0}"
@@ -242,12 +316,28 @@ class OptionFlags(BaseObj):
     # if set to 31, bits are reversed on a 32 bit integer (0 becomes 31, etc.)
     _reversed = 0
 
+    def __new__(cls, options=None):
+        """Return the shared object for the given raw flags"""
+        cache = _flags_cache.get(cls)
+        if cache is None:
+            cache = {}
+            _flags_cache[cls] = cache
+        obj = cache.get(options)
+        if obj is None:
+            obj = super(OptionFlags, cls).__new__(cls)
+            if options is not None:
+                cache[options] = obj
+        return obj
+
     def __init__(self, options):
         """Initialize object's private data.
 
            options:
                Unsigned integer of raw flags
         """
+        if "rawflags" in self.__dict__:
+            # Shared object has already been initialized
+            return
         self.rawflags = self._rawfunc(options) # Raw option flags
         bitnames = self._bitnames
         for bit,name in bitnames.items():
@@ -264,6 +354,9 @@ class OptionFlags(BaseObj):
            Use "__str__ = OptionFlags.str_flags" to have it as the default
            string representation
         """
+        ret = self.__dict__.get("_strflags")
+        if ret is not None:
+            return ret
         ulist = []
         bitnames = self._bitnames
         for bit in sorted(bitnames):
@@ -272,7 +365,10 @@ class OptionFlags(BaseObj):
                 bit = self._reversed - bit
             if (self.rawflags >> bit) & 0x01:
                 ulist.append(bitnames[bit])
-        return ",".join(ulist)
+        ret = ",".join(ulist)
+        # Save names of flags set since object is shared
+        self.__dict__["_strflags"] = ret
+        return ret
 
 class RPCload(BaseObj):
     """RPC load base object
@@ -359,11 +455,9 @@ class RDMAbase(BaseObj):
         if self.rdma_write_chunks:
             # There are RDMA write chunks, use the next chunk data
             # instead of calling the original decoding function
-            data = ""
-            for rsegment in self.rdma_write_chunks.pop(0):
-                # Just get the bytes for the segment, dropping the
-                # padding bytes if any
-                data += rsegment.get_data(padding=False)
+            # Just get the bytes for each segment, dropping the
+            # padding bytes if any
+            data = "".join([x.get_data(padding=False) for x in self.rdma_write_chunks.pop(0)])
             unpack = None
             if len(kwts) == 0:
                 # If no arguments are given check if the original function
@@ -380,3 +474,76 @@ class RDMAbase(BaseObj):
         else:
             # Call original decoding function with all arguments given
             return func(*kwts, **kwds)
+
+def _skip_bytes(unpack, size, pad=0):
+    """Skip the given number of bytes, fail if there are not enough bytes"""
+    if len(unpack.read(size, pad)) < size:
+        raise Exception("Not enough data to skip %d bytes" % size)
+
+def _skip_entry4(unpack):
+    """Skip an NFSv4 directory entry (entry4)"""
+    _skip_bytes(unpack, 8)                           # cookie
+    _skip_bytes(unpack, unpack.unpack_uint(), pad=4) # name
+    _skip_bytes(unpack, 4*unpack.unpack_uint())      # attribute mask
+    _skip_bytes(unpack, unpack.unpack_uint(), pad=4) # attribute values
+
+def _skip_entry3(unpack):
+    """Skip an NFSv3 directory entry (entry3)"""
+    _skip_bytes(unpack, 8)                           # fileid
+    _skip_bytes(unpack, unpack.unpack_uint(), pad=4) # name
+    _skip_bytes(unpack, 8)                           # cookie
+
+def _skip_entryplus3(unpack):
+    """Skip an NFSv3 READDIRPLUS directory entry (entryplus3)"""
+    _skip_entry3(unpack)
+    if unpack.unpack_uint():
+        _skip_bytes(unpack, 84)                          # attributes
+    if unpack.unpack_uint():
+        _skip_bytes(unpack, unpack.unpack_uint(), pad=4) # file handle
+
+# Functions to skip a directory entry given the name of its class
+_skip_entry = {
+    "entry4"     : _skip_entry4,
+    "entry3"     : _skip_entry3,
+    "entryplus3" : _skip_entryplus3,
+}
+
+class DIRbase(BaseObj):
+    """Directory listing base object
+
+       Base class for a directory listing object where the list of
+       entries is decoded on first access when NFS_lazydirs is set.
+       The entries are skipped without decoding them so the rest of
+       the listing (e.g., eof) is decoded right away, the length of
+       the list is known without decoding any entries.
+
+       Usage:
+           from packet.utils import DIRbase
+
+           # For an original class definition with a list of entries
+           class dirlist(BaseObj):
+               def __init__(self, unpack):
+                   self.entries = unpack.unpack_list(entry4)
+                   self.eof     = nfs_bool(unpack)
+
+           # Class definition to decode entries on first access
+           class dirlist(DIRbase):
+               def __init__(self, unpack):
+                   self.entries = self.lazy_entries(unpack.unpack_list, entry4)
+                   self.eof     = nfs_bool(unpack)
+    """
+    def lazy_entries(self, func, unpack_item):
+        """Dissecting method for the list of entries
+           The first positional argument is the original dissecting
+           function to be called when the entries are not decoded
+           on first access, the second argument is the unpack function
+           for each entry in the list.
+        """
+        skip_item = _skip_entry.get(unpack_item.__name__)
+        if NFS_lazydirs and skip_item is not None:
+            # Decode entries on first access
+            unpack = getattr(func, "__self__")
+            return unpack.unpack_lazylist(unpack_item, skip_item)
+        else:
+            # Call original decoding function
+            return func(unpack_item)
@@ -0,0 +1,753 @@
+#!/usr/bin/env python
+#===============================================================================
+# Copyright 2026 NetApp, Inc. All Rights Reserved,
+# contribution by Jorge Mora <mora@netapp.com>
+#
+# This program is free software; you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 2 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#===============================================================================
+import os
+import sys
+import json
+import time
+import struct
+import random
+import cPickle
+import subprocess
+from optparse import OptionParser, IndentedHelpFormatter
+
+# Benchmark the packet module in the same source tree as this script
+# instead of any installed version
+TOPDIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, TOPDIR)
+import nfstest_config as c
+from packet.pktt import Pktt
+
+# Module constants
+__author__    = "Jorge Mora (%s)" % c.NFSTEST_AUTHOR_EMAIL
+__copyright__ = "Copyright (C) 2026 NetApp, Inc."
+__license__   = "GPL v2"
+__version__   = "1.0"
+
+USAGE = """%prog [options] [<scenario1> [<scenario2> ...]]
+
+Packet decoder micro-benchmark suite
+====================================
+Generate reproducible synthetic packet traces and measure the throughput
+of the packet trace module decoding them. Each scenario is a packet trace
+exercising a different part of the decoder:
+
+{scenarios}
+Each benchmark is run on a separate process so the peak RSS reported is
+the maximum resident set size for that benchmark alone:
+
+{benchmarks}
+Before running the benchmarks, every scenario is checked to make sure all
+its RPC packets are decoded, the check fails if any of them is missing.
+Results are displayed as packets per second, MB per second (bytes of the
+packets processed) and peak RSS. Results can be saved to a file to be
+used as the baseline in a later run, in which case the percentage change
+in packets per second with respect to the baseline is displayed as well.
+
+Examples:
+    # Run all benchmarks on all scenarios and save results as baseline
+    %prog --save /tmp/baseline.json
+
+    # Compare against baseline, fail if any benchmark is 5% slower
+    %prog --baseline /tmp/baseline.json --threshold 5
+
+    # Run only the iterate benchmark on the NFSv4 and RDMA scenarios
+    %prog --bench iterate nfs4 rdma
+
+    # Just create the packet traces
+    %prog --generate --tmpdir /tmp/traces"""
+
+# Location of nfstest_pkt in the source tree
+NFSTEST_PKT = os.path.join(TOPDIR, "test", "nfstest_pkt")
+
+# Base timestamp for all packet traces
+TIME_BASE = 1500000000
+# Time between packets in microseconds
+TIME_DELTA = 20
+
+# Ethernet addresses
+MAC_CLIENT = "\x00\x0c\x29\x54\x09\xef"
+MAC_SERVER = "\xe4\xce\x8f\x58\x9f\xf4"
+# IPv4 addresses
+IPV4_CLIENT = "\xc0\xa8\x00\x11"
+IPV4_SERVER = "\xc0\xa8\x00\x3e"
+# IPv6 addresses
+IPV6_CLIENT = "\xfe\x80" + "\x00"*6 + "\x02\x0c\x29\xff\xfe\x54\x09\xef"
+IPV6_SERVER = "\xfe\x80" + "\x00"*6 + "\xe6\xce\x8f\xff\xfe\x58\x9f\xf4"
+
+# RPC program numbers
+NFS_PROGRAM = 100003
+# InfiniBand opcodes for reliable connection
+IB_SEND_ONLY         = 0x04
+IB_RDMA_WRITE_FIRST  = 0x06
+IB_RDMA_WRITE_MIDDLE = 0x07
+IB_RDMA_WRITE_LAST   = 0x08
+IB_RDMA_WRITE_ONLY   = 0x0a
+# InfiniBand path MTU
+IB_MTU = 4096
+
+def xdr_uint(*values):
+    """Return XDR encoded unsigned integers"""
+    return struct.pack("!%dI" % len(values), *values)
+
+def xdr_uhyper(*values):
+    """Return XDR encoded unsigned hyper integers"""
+    return struct.pack("!%dQ" % len(values), *values)
+
+def xdr_opaque(data):
+    """Return XDR encoded variable length opaque"""
+    return struct.pack("!I", len(data)) + data + "\x00" * (-len(data) % 4)
+
+def ip_checksum(data):
+    """Return the IPv4 header checksum"""
+    csum = sum(struct.unpack("!%dH" % (len(data)/2), data))
+    csum = (csum >> 16) + (csum & 0xFFFF)
+    csum += csum >> 16
+    return ~csum & 0xFFFF
+
+class TraceWriter:
+    """Write packets to a pcap trace file"""
+    def __init__(self, tfile, link_type=1, snaplen=65535):
+        self.fd = open(tfile, "wb")
+        self.fd.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, snaplen, link_type))
+        self.snaplen = snaplen
+        self.usecs = 0
+        self.npackets = 0
+        self.nrpc = 0
+
+    def write(self, data):
+        """Write a packet to the trace file truncated to the snaplen"""
+        secs, usecs = divmod(self.usecs, 1000000)
+        self.fd.write(struct.pack("<IIII", TIME_BASE + secs, usecs, min(len(data), self.snaplen), len(data)))
+        self.fd.write(data[:self.snaplen])
+        self.usecs += TIME_DELTA
+        self.npackets += 1
+
+    def close(self):
+        """Close trace file"""
+        self.fd.close()
+
+class Link:
+    """Base object for the connection between the client and the server
+
+       Messages given to rpc() are encoded as RPC calls and replies and
+       the encapsulation is done by the send() method on each sub-class.
+    """
+    # RPC records are sent with the record marker
+    rmark = False
+    # Large opaque data is sent using RDMA writes
+    rdma = False
+
+    def __init__(self, writer, vlan=None, gss=False):
+        """Constructor
+
+           writer:
+               TraceWriter object
+           vlan:
+               Add an 802.1Q header with the given VLAN identifier
+           gss:
+               Use RPCSEC_GSS with the integrity service (krb5i)
+        """
+        self.writer = writer
+        self.vlan   = vlan
+        self.gss    = gss
+        self.ipid   = 1
+        self.gssseq = 1
+
+    def ethernet(self, payload, reply, etype):
+        """Return ethernet frame"""
+        if reply:
+            out = MAC_CLIENT + MAC_SERVER
+        else:
+            out = MAC_SERVER + MAC_CLIENT
+        if self.vlan is not None:
+            out += struct.pack("!HH", 0x8100, self.vlan)
+        return out + struct.pack("!H", etype) + payload
+
+    def ipv4(self, payload, reply, proto, ipid=None, foffset=0, mf=False):
+        """Return ethernet frame with the IPv4 packet"""
+        if ipid is None:
+            ipid = self.ipid
+            self.ipid = (self.ipid + 1) & 0xFFFF
+        src, dst = (IPV4_SERVER, IPV4_CLIENT) if reply else (IPV4_CLIENT, IPV4_SERVER)
+        flags = (0x2000 if mf else 0) | (foffset >> 3)
+        hdr = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20+len(payload), ipid, flags, 64, proto, 0, src, dst)
+        hdr = hdr[:10] + struct.pack("!H", ip_checksum(hdr)) + hdr[12:]
+        return self.ethernet(hdr + payload, reply, 0x0800)
+
+    def ipv6(self, payload, reply, proto):
+        """Return ethernet frame with the IPv6 packet"""
+        src, dst = (IPV6_SERVER, IPV6_CLIENT) if reply else (IPV6_CLIENT, IPV6_SERVER)
+        hdr = struct.pack("!IHBB16s16s", 0x60000000, len(payload), proto, 64, src, dst)
+        return self.ethernet(hdr + payload, reply, 0x86dd)
+
+    def rpc(self, xid, proc, args, res, rdata=None, vers=3, prog=NFS_PROGRAM):
+        """Send RPC call and its reply
+
+           xid:
+               RPC transaction identifier
+           proc:
+               RPC procedure
+           args:
+               Encoded procedure arguments
+           res:
+               Encoded procedure results
+           rdata:
+               Opaque data appended to the results, this data is sent
+               using RDMA writes if the link supports it
+           vers:
+               RPC program version
+           prog:
+               RPC program number
+        """
+        if self.gss:
+            # RPCSEC_GSS credential and verifier using the integrity service
+            seq = self.gssseq
+            self.gssseq += 1
+            cred = xdr_uint(6) + xdr_opaque(xdr_uint(1, 0, seq, 2) + xdr_opaque("\x01"*16))
+            verf = xdr_uint(6) + xdr_opaque("\x04\x04\x05\xff\xff\xff\xff\xff" + "\x00"*8 + "\x5a"*12)
+            args = xdr_uint(len(args)+4, seq) + args + xdr_opaque("\x5a"*28)
+        else:
+            # AUTH_SYS credential and AUTH_NONE verifier
+            cred = xdr_uint(1) + xdr_opaque(xdr_uint(0) + xdr_opaque("client") + xdr_uint(0, 0, 1, 0))
+            verf = xdr_uint(0, 0)
+        call = xdr_uint(xid, 0, 2, prog, vers, proc) + cred + verf + args
+
+        if rdata is not None and not self.rdma:
+            res += xdr_opaque(rdata)
+            rdata = None
+        if self.gss:
+            res = xdr_uint(len(res)+4, seq) + res
+        reply = xdr_uint(xid, 1, 0) + verf + xdr_uint(0) + res
+        if self.gss:
+            reply += xdr_opaque("\x5a"*28)
+
+        if self.rmark:
+            call  = struct.pack("!I", 0x80000000|len(call)) + call
+            reply = struct.pack("!I", 0x80000000|len(reply)) + reply
+        self.send_call(xid, call, rdata)
+        self.send_reply(xid, reply, rdata)
+        self.writer.nrpc += 2
+
+    def send_call(self, xid, data, rdata):
+        """Send RPC call"""
+        self.send(data, False)
+
+    def send_reply(self, xid, data, rdata):
+        """Send RPC reply"""
+        self.send(data, True)
+
+class TCPLink(Link):
+    """TCP connection over IPv4 or IPv6"""
+    rmark = True
+
+    def __init__(self, writer, ipv6=False, mss=1448, **kwds):
+        Link.__init__(self, writer, **kwds)
+        self.isipv6 = ipv6
+        self.mss    = mss
+        self.seq    = [1000, 2000000] # Sequence numbers for each direction
+        self.port   = 708
+
+    def send(self, data, reply):
+        """Send data splitting it into multiple TCP segments"""
+        idx = 1 if reply else 0
+        sport, dport = (2049, self.port) if reply else (self.port, 2049)
+        for offset in xrange(0, len(data), self.mss):
+            segment = data[offset:offset+self.mss]
+            flags = 0x18 if offset + self.mss >= len(data) else 0x10
+            tcp = struct.pack("!HHIIBBHHH", sport, dport, self.seq[idx], self.seq[1-idx], 0x50, flags, 65535, 0, 0)
+            self.seq[idx] = (self.seq[idx] + len(segment)) & 0xFFFFFFFF
+            if self.isipv6:
+                self.writer.write(self.ipv6(tcp + segment, reply, 6))
+            else:
+                self.writer.write(self.ipv4(tcp + segment, reply, 6))
+
+class UDPLink(Link):
+    """UDP over IPv4 where large datagrams are sent as IP fragments"""
+    def __init__(self, writer, mtu=1500, **kwds):
+        Link.__init__(self, writer, **kwds)
+        self.mtu  = mtu
+        self.port = 708
+
+    def send(self, data, reply):
+        """Send data as a single UDP datagram"""
+        sport, dport = (2049, self.port) if reply else (self.port, 2049)
+        payload = struct.pack("!HHHH", sport, dport, 8+len(data), 0) + data
+        fsize = ((self.mtu - 20) / 8) * 8
+        ipid = self.ipid
+        self.ipid = (self.ipid + 1) & 0xFFFF
+        for offset in xrange(0, len(payload), fsize):
+            mf = offset + fsize < len(payload)
+            self.writer.write(self.ipv4(payload[offset:offset+fsize], reply, 17, ipid, offset, mf))
+
+class RDMALink(Link):
+    """RPC-over-RDMA using RoCEv2 or InfiniBand encapsulated in ERF records
+
+       Large opaque data in replies is sent with RDMA writes using a write
+       chunk and all messages are sent inline with RDMA_MSG.
+    """
+    rdma = True
+
+    def __init__(self, writer, erf=False, **kwds):
+        Link.__init__(self, writer, **kwds)
+        self.erf    = erf
+        self.psn    = [100, 500000] # Packet sequence numbers for each direction
+        self.handle = 0x1000
+
+    def bth(self, reply, opcode, payload, reth=""):
+        """Send InfiniBand packet"""
+        idx = 1 if reply else 0
+        destqp = 0x11 if reply else 0x22
+        psn = self.psn[idx]
+        self.psn[idx] = (psn + 1) & 0xFFFFFF
+        ibpkt = struct.pack("!BBHII", opcode, 0x40, 0xFFFF, destqp, psn) + reth + payload
+        if self.erf:
+            # Native InfiniBand: LRH + BTH + payload + ICRC + VCRC
+            plen = (8 + len(ibpkt) + 4) / 4
+            lrh = struct.pack("!HHHH", 0x0002, 1 if reply else 2, plen, 2 if reply else 1)
+            data = lrh + ibpkt + "\x00"*4 + "\x00"*2
+            secs, usecs = divmod(self.writer.usecs, 1000000)
+            erfts = ((TIME_BASE + secs) << 32) | int(usecs * 4294.967296)
+            erfhdr = struct.pack("<Q", erfts) + struct.pack("!BBHHH", 21, 0x04, 16+len(data), 0, len(data))
+            self.writer.write(erfhdr + data)
+        else:
+            # RoCEv2: IPv4 + UDP + BTH + payload + ICRC
+            data = ibpkt + "\x00"*4
+            udp = struct.pack("!HHHH", 49152, 4791, 8+len(data), 0)
+            self.writer.write(self.ipv4(udp + data, reply, 17))
+
+    def send_call(self, xid, data, rdata):
+        """Send RPC call with a write chunk if the reply has data"""
+        if rdata is None:
+            writes = xdr_uint(0)
+        else:
+            self.handle += 1
+            segment = xdr_uint(self.handle, len(rdata)) + xdr_uhyper(0x7f0000000000)
+            writes = xdr_uint(1, 1) + segment + xdr_uint(0)
+        rdmahdr = xdr_uint(xid, 1, 32, 0, 0) + writes + xdr_uint(0)
+        self.bth(False, IB_SEND_ONLY, rdmahdr + data)
+
+    def send_reply(self, xid, data, rdata):
+        """Send RDMA writes with the reply data followed by the RPC reply"""
+        if rdata is None:
+            writes = xdr_uint(0)
+        else:
+            count = len(rdata)
+            reth = struct.pack("!QII", 0x7f0000000000, self.handle, count)
+            if count <= IB_MTU:
+                self.bth(True, IB_RDMA_WRITE_ONLY, rdata, reth)
+            else:
+                for offset in xrange(0, count, IB_MTU):
+                    if offset == 0:
+                        self.bth(True, IB_RDMA_WRITE_FIRST, rdata[:IB_MTU], reth)
+                    elif offset + IB_MTU < count:
+                        self.bth(True, IB_RDMA_WRITE_MIDDLE, rdata[offset:offset+IB_MTU])
+                    else:
+                        self.bth(True, IB_RDMA_WRITE_LAST, rdata[offset:])
+            segment = xdr_uint(self.handle, count) + xdr_uhyper(0x7f0000000000)
+            writes = xdr_uint(1, 1) + segment + xdr_uint(0)
+            # Reduced message: the opaque has just the length
+            data += xdr_uint(count)
+        rdmahdr = xdr_uint(xid, 1, 32, 0, 0) + writes + xdr_uint(0)
+        self.bth(True, IB_SEND_ONLY, rdmahdr + data)
+
+class Generator:
+    """Generate NFS traffic on a link"""
+    def __init__(self, link, seed, iosize):
+        self.link   = link
+        self.rand   = random.Random(seed)
+        self.iosize = iosize
+        self.xid    = self.rand.randint(1, 0x7FFFFFFF)
+        self.fh     = "".join(chr(self.rand.randint(0, 255)) for i in xrange(28))
+        self.sessid = "".join(chr(self.rand.randint(0, 255)) for i in xrange(16))
+        self.stid   = xdr_uint(1) + "".join(chr(self.rand.randint(0, 255)) for i in xrange(12))
+        self.slotseq = 1
+        self._data  = {}
+
+    def data(self, size):
+        """Return data buffer of the given size"""
+        buf = self._data.get(size)
+        if buf is None:
+            buf = "".join(chr(self.rand.randint(0, 255)) for i in xrange(min(size, 4096)))
+            buf = (buf * (size / len(buf) + 1))[:size]
+            self._data[size] = buf
+        return buf
+
+    def next_xid(self):
+        """Return next RPC transaction identifier"""
+        self.xid = (self.xid + 1) & 0xFFFFFFFF
+        return self.xid
+
+    def fattr3(self, fileid):
+        """Return NFSv3 file attributes"""
+        return xdr_uint(1, 0644, 1, 0, 0) + xdr_uhyper(1048576, 1048576) + \
+               xdr_uint(0, 0) + xdr_uhyper(1, fileid) + xdr_uint(TIME_BASE, 0)*3
+
+    def nfs3(self, count, iosize=None):
+        """NFSv3 GETATTR, LOOKUP, READ and WRITE"""
+        if iosize is None:
+            iosize = self.iosize
+        link = self.link
+        fh = xdr_opaque(self.fh)
+        for i in xrange(count):
+            xid = self.next_xid()
+            offset = i * iosize
+            op = i % 4
+            if op == 0:
+                link.rpc(xid, 1, fh, xdr_uint(0) + self.fattr3(i))
+            elif op == 1:
+                res = xdr_uint(0) + fh + xdr_uint(1) + self.fattr3(i) + xdr_uint(0)
+                link.rpc(xid, 3, fh + xdr_opaque("file_%08d" % i), res)
+            elif op == 2:
+                args = fh + xdr_uhyper(offset) + xdr_uint(iosize)
+                res = xdr_uint(0, 1) + self.fattr3(i) + xdr_uint(iosize, 0)
+                link.rpc(xid, 6, args, res, rdata=self.data(iosize))
+            else:
+                args = fh + xdr_uhyper(offset) + xdr_uint(iosize, 2) + xdr_opaque(self.data(iosize))
+                res = xdr_uint(0, 0, 0, iosize, 2) + "\x00"*8
+                link.rpc(xid, 7, args, res)
+
+    def nfs4(self, count, iosize=None):
+        """NFSv4.1 COMPOUNDs: SEQUENCE, PUTFH with GETATTR, READ or WRITE"""
+        if iosize is None:
+            iosize = self.iosize
+        link = self.link
+        # Attributes: type, change, size, fileid, mode and numlinks
+        bitmap = xdr_uint(2, (1<<1)|(1<<3)|(1<<4)|(1<<20), (1<<1)|(1<<3))
+        for i in xrange(count):
+            xid = self.next_xid()
+            offset = i * iosize
+            seq = xdr_uint(53) + self.sessid + xdr_uint(self.slotseq, 0, 0, 0)
+            seqres = xdr_uint(53, 0) + self.sessid + xdr_uint(self.slotseq, 0, 0, 0, 0)
+            self.slotseq += 1
+            putfh = xdr_uint(22) + xdr_opaque(self.fh)
+            putfhres = xdr_uint(22, 0)
+            op = i % 3
+            rdata = None
+            if op == 0:
+                attrs = xdr_uint(1) + xdr_uhyper(i, 1048576, i) + xdr_uint(0644, 1)
+                oparg = xdr_uint(9) + bitmap
+                opres = xdr_uint(9, 0) + bitmap + xdr_opaque(attrs)
+            elif op == 1:
+                oparg = xdr_uint(25) + self.stid + xdr_uhyper(offset) + xdr_uint(iosize)
+                opres = xdr_uint(25, 0, 0)
+                rdata = self.data(iosize)
+            else:
+                oparg = xdr_uint(38) + self.stid + xdr_uhyper(offset) + xdr_uint(2) + xdr_opaque(self.data(iosize))
+                opres = xdr_uint(38, 0, iosize, 2) + "\x00"*8
+            args = xdr_opaque("") + xdr_uint(1, 3) + seq + putfh + oparg
+            res  = xdr_uint(0) + xdr_opaque("") + xdr_uint(3) + seqres + putfhres + opres
+            link.rpc(xid, 1, args, res, rdata=rdata, vers=4)
+
+def gen_nfs3(tfile, count, vopts):
+    """NFSv3 over TCP/IPv4"""
+    writer = TraceWriter(tfile)
+    Generator(TCPLink(writer), vopts.seed, vopts.iosize).nfs3(count)
+    return writer
+
+def gen_nfs4(tfile, count, vopts):
+    """NFSv4.1 COMPOUNDs over TCP/IPv4"""
+    writer = TraceWriter(tfile)
+    Generator(TCPLink(writer), vopts.seed, vopts.iosize).nfs4(count)
+    return writer
+
+def gen_bigio(tfile, count, vopts):
+    """NFSv4.1 large READ/WRITE spanning multiple TCP segments"""
+    writer = TraceWriter(tfile)
+    Generator(TCPLink(writer), vopts.seed, vopts.iosize).nfs4(max(1, count/16), vopts.bigsize)
+    return writer
+
+def gen_udpfrag(tfile, count, vopts):
+    """NFSv3 over UDP with IPv4 fragmentation"""
+    writer = TraceWriter(tfile)
+    Generator(UDPLink(writer), vopts.seed, vopts.iosize).nfs3(max(1, count/4), 32768)
+    return writer
+
+def gen_udpsnap(tfile, count, vopts):
+    """NFSv3 over UDP with IPv4 fragmentation truncated to 512 bytes"""
+    writer = TraceWriter(tfile, snaplen=512)
+    Generator(UDPLink(writer), vopts.seed, vopts.iosize).nfs3(max(1, count/4), 32768)
+    return writer
+
+def gen_rdma(tfile, count, vopts):
+    """NFSv3 RPC-over-RDMA (RoCEv2) with RDMA write chunks"""
+    writer = TraceWriter(tfile)
+    Generator(RDMALink(writer), vopts.seed, vopts.iosize).nfs3(max(1, count/4), 32768)
+    return writer
+
+def gen_gss(tfile, count, vopts):
+    """NFSv4.1 using Kerberos (RPCSEC_GSS krb5i)"""
+    writer = TraceWriter(tfile)
+    Generator(TCPLink(writer, gss=True), vopts.seed, vopts.iosize).nfs4(count)
+    return writer
+
+def gen_ipv6(tfile, count, vopts):
+    """NFSv4.1 over TCP/IPv6"""
+    writer = TraceWriter(tfile)
+    Generator(TCPLink(writer, ipv6=True), vopts.seed, vopts.iosize).nfs4(count)
+    return writer
+
+def gen_vlan(tfile, count, vopts):
+    """NFSv3 over TCP/IPv4 on an 802.1Q VLAN"""
+    writer = TraceWriter(tfile)
+    Generator(TCPLink(writer, vlan=100), vopts.seed, vopts.iosize).nfs3(count)
+    return writer
+
+def gen_erf(tfile, count, vopts):
+    """NFSv3 RPC-over-RDMA on InfiniBand in ERF records"""
+    writer = TraceWriter(tfile, link_type=197)
+    Generator(RDMALink(writer, erf=True), vopts.seed, vopts.iosize).nfs3(max(1, count/4), 32768)
+    return writer
+
+# Scenarios in the order in which they are run
+SCENARIOS = [
+    ("nfs3",    gen_nfs3),
+    ("nfs4",    gen_nfs4),
+    ("bigio",   gen_bigio),
+    ("udpfrag", gen_udpfrag),
+    ("udpsnap", gen_udpsnap),
+    ("rdma",    gen_rdma),
+    ("gss",     gen_gss),
+    ("ipv6",    gen_ipv6),
+    ("vlan",    gen_vlan),
+    ("erf",     gen_erf),
+]
+
+def count_rpc(tfile):
+    """Return the number of RPC packets decoded from the trace"""
+    x = Pktt(tfile)
+    nrpc = 0
+    for pkt in x:
+        if pkt == "rpc":
+            nrpc += 1
+    x.close()
+    return nrpc
+
+def bench_iterate(tfile, vopts):
+    """Iterate over all packets in the trace"""
+    stime = time.time()
+    x = Pktt(tfile)
+    for pkt in x:
+        pass
+    npackets = x.index
+    x.close()
+    return npackets, None, time.time() - stime, None
+
+def bench_match(tfile, vopts):
+    """Match all packets using the match expression"""
+    stime = time.time()
+    x = Pktt(tfile)
+    while x.match(vopts.match, rewind=False):
+        pass
+    npackets = x.index
+    x.close()
+    return npackets, None, time.time() - stime, None
+
+def bench_pktlist(tfile, vopts):
+    """Match the expression on the list of RPC packets given to set_pktlist()"""
+    x = Pktt(tfile)
+    pktlist = [pkt for pkt in x if pkt == "rpc"]
+    nbytes = sum(pkt.record.length_inc for pkt in pktlist)
+    stime = time.time()
+    x.set_pktlist(pktlist)
+    while x.match(vopts.match, rewind=False):
+        pass
+    etime = time.time() - stime
+    x.close()
+    return len(pktlist), nbytes, etime, None
+
+def bench_nfstest_pkt(tfile, vopts):
+    """Display all packets using nfstest_pkt with output sent to /dev/null"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([TOPDIR] + env.get("PYTHONPATH", "").split(os.pathsep))
+    stime = time.time()
+    fd = open(os.devnull, "w")
+    proc = subprocess.Popen([sys.executable, NFSTEST_PKT, "-l", "all", tfile], stdout=fd, stderr=fd, env=env)
+    pid, status, rusage = os.wait4(proc.pid, 0)
+    etime = time.time() - stime
+    fd.close()
+    if status != 0:
+        raise Exception("nfstest_pkt failed with status %d" % status)
+    return None, None, etime, rusage.ru_maxrss
+
+# Benchmarks in the order in which they are run
+BENCHMARKS = [
+    ("iterate",    bench_iterate),
+    ("match",      bench_match),
+    ("pktlist",    bench_pktlist),
+    ("nfstest_pkt", bench_nfstest_pkt),
+]
+
+def run_bench(func, tfile, vopts):
+    """Run benchmark on a separate process and return the tuple
+       (npackets, nbytes, secs, peak RSS in kB), where npackets and
+       nbytes are None if all the packets in the trace were processed
+    """
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(rfd)
+        try:
+            out = func(tfile, vopts)
+        except Exception as e:
+            out = e
+        os.write(wfd, cPickle.dumps(out, cPickle.HIGHEST_PROTOCOL))
+        os._exit(0)
+    os.close(wfd)
+    data = ""
+    while True:
+        buf = os.read(rfd, 65536)
+        if not buf:
+            break
+        data += buf
+    os.close(rfd)
+    pid, status, rusage = os.wait4(pid, 0)
+    out = cPickle.loads(data)
+    if isinstance(out, Exception):
+        raise out
+    npackets, nbytes, secs, rss = out
+    if rss is None:
+        rss = rusage.ru_maxrss
+    return npackets, nbytes, secs, rss
+
+def help_list(items):
+    """Return help for the list of scenarios or benchmarks"""
+    return "".join(["    %-12s %s\n" % (name, func.__doc__) for name, func in items])
+
+#===============================================================================
+# Entry point
+#===============================================================================
+# Setup options to parse in the command line
+usage = USAGE.format(scenarios=help_list(SCENARIOS), benchmarks=help_list(BENCHMARKS))
+opts = OptionParser(usage, formatter = IndentedHelpFormatter(2, 25), version = "%prog " + __version__)
+hhelp = "Number of RPC operations for each scenario [default: %default]"
+opts.add_option("-n", "--count", type="int", default=2000, help=hhelp)
+hhelp = "Comma separated list of benchmarks to run [default: all]"
+opts.add_option("-b", "--bench", default=None, help=hhelp)
+hhelp = "Number of times to run each benchmark, the best time is used [default: %default]"
+opts.add_option("-r", "--repeat", type="int", default=3, help=hhelp)
+hhelp = "Match expression used by the match and pktlist benchmarks [default: %default]"
+opts.add_option("-m", "--match", default="RPC.type == 1", help=hhelp)
+hhelp = "Seed used to generate the packet traces [default: %default]"
+opts.add_option("--seed", type="int", default=1, help=hhelp)
+hhelp = "I/O size for READ and WRITE [default: %default]"
+opts.add_option("--iosize", type="int", default=4096, help=hhelp)
+hhelp = "I/O size for READ and WRITE on the bigio scenario [default: %default]"
+opts.add_option("--bigsize", type="int", default=1048576, help=hhelp)
+hhelp = "Directory where the packet traces are created [default: %default]"
+opts.add_option("--tmpdir", default=c.NFSTEST_TMPDIR, help=hhelp)
+hhelp = "Do not remove the packet traces"
+opts.add_option("--keep", action="store_true", default=False, help=hhelp)
+hhelp = "Just create the packet traces, no benchmarks are run"
+opts.add_option("--generate", action="store_true", default=False, help=hhelp)
+hhelp = "Save results to this file to be used as the baseline"
+opts.add_option("--save", default=None, help=hhelp)
+hhelp = "Compare results against the baseline saved in this file"
+opts.add_option("--baseline", default=None, help=hhelp)
+hhelp = "Exit with an error if any benchmark is slower than the baseline " + \
+        "by more than this percentage [default: no check]"
+opts.add_option("--threshold", type="float", default=None, help=hhelp)
+vopts, args = opts.parse_args()
+
+scenario_map = dict(SCENARIOS)
+for name in args:
+    if name not in scenario_map:
+        opts.error("invalid scenario: %s" % name)
+scenarios = [x for x in SCENARIOS if len(args) == 0 or x[0] in args]
+
+bench_map = dict(BENCHMARKS)
+if vopts.bench is None:
+    benchmarks = BENCHMARKS
+else:
+    blist = vopts.bench.split(",")
+    for name in blist:
+        if name not in bench_map:
+            opts.error("invalid benchmark: %s" % name)
+    benchmarks = [x for x in BENCHMARKS if x[0] in blist]
+
+baseline = {}
+if vopts.baseline:
+    with open(vopts.baseline) as fd:
+        baseline = json.load(fd)["results"]
+
+if not os.path.exists(vopts.tmpdir):
+    os.makedirs(vopts.tmpdir)
+
+results = {}
+regressions = 0
+failures = 0
+if not vopts.generate:
+    print "%-8s %-12s %9s %9s %11s %9s %9s %9s" % ("scenario", "benchmark", "packets", "secs", "packets/s", "MB/s", "RSS MB", "baseline")
+for name, gen_func in scenarios:
+    tfile = os.path.join(vopts.tmpdir, "bench_pkt_%s.cap" % name)
+    writer = gen_func(tfile, vopts.count, vopts)
+    writer.close()
+    tsize = os.path.getsize(tfile)
+    if vopts.generate:
+        print "%-8s %s: %d packets, %d bytes" % (name, tfile, writer.npackets, tsize)
+        continue
+
+    # Make sure all RPC packets are decoded
+    nrpc = count_rpc(tfile)
+    if nrpc != writer.nrpc:
+        print "%-8s only %d of %d RPC packets are decoded" % (name, nrpc, writer.nrpc)
+        sys.stdout.flush()
+        failures += 1
+
+    for bname, bench_func in benchmarks:
+        best = None
+        maxrss = 0
+        for i in xrange(max(1, vopts.repeat)):
+            npackets, nbytes, secs, rss = run_bench(bench_func, tfile, vopts)
+            if best is None or secs < best:
+                best = secs
+            maxrss = max(maxrss, rss)
+        if npackets is None:
+            npackets = writer.npackets
+        if nbytes is None:
+            nbytes = tsize
+        pps = npackets / best if best > 0 else 0.0
+        key = "%s/%s" % (name, bname)
+        results[key] = {
+            "packets": npackets,
+            "secs":    best,
+            "pps":     pps,
+            "mbps":    nbytes / best / 1000000.0 if best > 0 else 0.0,
+            "rss":     maxrss / 1024.0,
+        }
+        bstr = ""
+        base = baseline.get(key)
+        if base is not None and base["pps"] > 0:
+            change = 100.0 * (pps - base["pps"]) / base["pps"]
+            bstr = "%+.1f%%" % change
+            if vopts.threshold is not None and change < -vopts.threshold:
+                bstr += " *"
+                regressions += 1
+        item = results[key]
+        print "%-8s %-12s %9d %9.3f %11.0f %9.2f %9.1f %9s" % (name, bname, npackets, best, pps, item["mbps"], item["rss"], bstr)
+        sys.stdout.flush()
+
+    if not vopts.keep and not vopts.generate:
+        os.unlink(tfile)
+
+if vopts.save:
+    with open(vopts.save, "w") as fd:
+        json.dump({"version": __version__, "count": vopts.count, "results": results}, fd, indent=2, sort_keys=True)
+
+if failures:
+    print "%d scenario(s) with RPC packets not decoded" % failures
+if regressions:
+    print "%d benchmark(s) slower than the baseline by more than %g%%" % (regressions, vopts.threshold)
+if failures or regressions:
+    sys.exit(1)